@@ -1,247 +1,3992 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
+import asyncio
+import time
+import heapq
+import hashlib
+import bisect
+import threading
+import tracemalloc
+import argparse
+import itertools
+import glob
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from pymongo import monitoring, InsertOne, UpdateOne, UpdateMany, DeleteMany, IndexModel, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, Iterator, Iterable, Callable, AsyncIterator
 import uuid
 from datetime import datetime, timezone, timedelta
-import random
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import json
+import orjson
+import base64
+
+try:
+    import resource
+except ImportError:  # not available on Windows; memory profiling falls back to off
+    resource = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def format_labels(names: tuple, values: tuple) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Process-wide histogram rendered in the Prometheus text exposition format.
+    
+    Observations may come from driver threads (Mongo command events), so updates take a lock."""
+    
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[tuple, List[float]] = {}  # label values -> per-bucket counts, then sum and count
+        self.lock = threading.Lock()
+    
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((values, list(counts)) for values, counts in self.series.items())
+        bucket_labels = self.labels + ("le",)
+        for values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(bucket_labels, values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(bucket_labels, values + ('+Inf',))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {counts[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, values)} {counts[-1]}")
+        return lines
+
+http_request_seconds = Histogram("http_request_duration_seconds", "Time from request to response start, by route template",
+                                 ("method", "route", "status"))
+mongo_command_seconds = Histogram("mongo_command_duration_seconds", "MongoDB command round trip time",
+                                  ("command", "collection", "outcome"))
+pipeline_queue_depth = Histogram("pipeline_queue_depth", "Runs already queued when a new run is submitted",
+                                 buckets=DEPTH_BUCKETS)
+pipeline_stage_seconds = Histogram("pipeline_stage_duration_seconds", "Wall time per pipeline run stage",
+                                   ("stage", "operation"), buckets=LATENCY_BUCKETS + (30.0, 60.0, 300.0))
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command the driver sends, labelled with the collection it targets"""
+    
+    def __init__(self):
+        self.collections: Dict[tuple, str] = {}
+    
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else event.command.get("collection", "")
+        self.collections[(event.connection_id, event.request_id)] = collection
+    
+    def succeeded(self, event):
+        self._observe(event, "ok")
+    
+    def failed(self, event):
+        self._observe(event, "error")
+    
+    def _observe(self, event, outcome: str):
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name, collection, outcome)
+
+class RequestLatencyMiddleware:
+    """ASGI middleware timing each HTTP request up to the start of its response.
+    
+    Measuring to the first byte keeps long-lived streams (SSE, NDJSON) from skewing the histogram.
+    Requests are labelled by route template so path parameters don't explode the series count."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                http_request_seconds.observe(time.perf_counter() - start, scope["method"],
+                                             getattr(route, "path", "unmatched"), message["status"])
+            await send(message)
+        
+        await self.app(scope, receive, timed_send)
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()])
+db = client[os.environ['DB_NAME']]
+
+def json_default(obj: Any) -> Any:
+    """orjson fallback for pandas timestamps and other datetime-likes"""
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson rendering that also accepts numpy scalars/arrays and pandas timestamps"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+# Create the main app without a prefix
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# Create a router with the /api prefix
+api_router = APIRouter(prefix="/api")
+
+# ==================== MODELS ====================
+
+class DataSource(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    type: str  # "manufacturing_plant", "quality_sensor", "inventory_system"
+    location: str
+    status: str = "active"  # "active", "inactive"
+    config: Dict[str, Any] = {}
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class DataSourceCreate(BaseModel):
+    name: str
+    type: str
+    location: str
+    config: Dict[str, Any] = {}
+
+class Pipeline(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str
+    source_id: str
+    transformations: List[Dict[str, Any]] = []
+    schedule: Optional[str] = None
+    status: str = "draft"  # "draft", "active", "paused"
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class PipelineCreate(BaseModel):
+    name: str
+    description: str
+    source_id: str
+    transformations: List[Dict[str, Any]] = []
+    schedule: Optional[str] = None
+
+class RetentionPolicyUpdate(BaseModel):
+    days: Optional[int] = None
+    compact_logs_days: Optional[int] = None
+
+class PipelineBatchExecute(BaseModel):
+    pipeline_ids: List[str]
+    num_records: int = 100
+    seed: Optional[int] = None
+    streaming: bool = False
+    chunk_size: int = 10000
+    full_refresh: bool = False
+    partitions: Optional[int] = None
+
+class PipelineRun(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    pipeline_id: str
+    pipeline_name: str
+    status: str  # "running", "success", "failed", "cancelled"
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    records_processed: int = 0
+    records_failed: int = 0
+    logs: List[Dict[str, Any]] = []
+    metrics: Dict[str, Any] = {}
+    error_message: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None  # refreshed by the owning process while the run is active
+    archive_id: Optional[str] = None  # set once retention archived the full run; its logs are compacted or gone
+
+class DataQualityRule(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str
+    rule_type: str  # "completeness", "accuracy", "consistency", "timeliness"
+    field: str
+    condition: Dict[str, Any]
+    severity: str  # "critical", "high", "medium", "low"
+    active: bool = True
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class DataQualityRuleCreate(BaseModel):
+    name: str
+    description: str
+    rule_type: str
+    field: str
+    condition: Dict[str, Any]
+    severity: str
+
+class DataQualityResult(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    pipeline_run_id: str
+    rule_id: str
+    rule_name: str
+    passed: bool
+    records_checked: int
+    records_failed: int
+    quality_score: float
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ProcessedData(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    pipeline_run_id: str
+    data: List[Dict[str, Any]]
+    metadata: Dict[str, Any]
+    storage: Optional[Dict[str, Any]] = None  # pointer to the full output in the columnar store
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class AggregateSketch(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    pipeline_id: str
+    pipeline_run_id: str
+    field: str
+    function: str  # "approx_distinct", "approx_percentile"
+    group_by: List[str]
+    percentile: Optional[float] = None  # the pipeline's percentile, for approx_percentile
+    group: Dict[str, Any]
+    sketch: bytes  # serialized HyperLogLog or t-digest of one run's rows in the group
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+# ==================== PROFILING ====================
+
+PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', 'rss').lower()  # "rss", "tracemalloc" or "off"
+
+def memory_mark() -> Optional[int]:
+    """Start a peak-memory measurement; pair with memory_peak_since"""
+    if PROFILE_MEMORY == "tracemalloc" and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+    if PROFILE_MEMORY == "rss" and resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+def memory_peak_since(mark: Optional[int]) -> Optional[int]:
+    """Bytes by which peak memory rose above `mark`.
+    
+    With tracemalloc this is the exact peak of Python/numpy allocations during the stage. The rss
+    mode only sees the process high-water mark grow, so stages that stay under an earlier peak report 0."""
+    if mark is None:
+        return None
+    if PROFILE_MEMORY == "tracemalloc":
+        return max(tracemalloc.get_traced_memory()[1] - mark, 0)
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - mark) * 1024  # ru_maxrss is in KiB on Linux
+
+class StageProfiler:
+    """Wall time, rows in/out and peak memory growth per pipeline stage, summed over chunks.
+    
+    Stages are keyed by name and plan step, so a transformation applied to every chunk of a
+    streaming run reports one entry. Stages must not nest, as each resets the memory peak."""
+    
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.stages: Dict[tuple, Dict[str, Any]] = {}
+    
+    @contextmanager
+    def stage(self, name: str, rows_in: int = 0, step: Optional[int] = None, operation: Optional[str] = None):
+        """Time the enclosed block; it may update the yielded counters' rows_in, rows_out and calls"""
+        counters = {"calls": 1, "rows_in": rows_in, "rows_out": rows_in}
+        mark = memory_mark() if self.memory else None
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = memory_peak_since(mark)
+            entry = self.stages.get((name, step))
+            if entry is None:
+                entry = self.stages[(name, step)] = {"stage": name, "calls": 0, "wall_ms": 0.0, "rows_in": 0,
+                                                     "rows_out": 0, "peak_memory_bytes": None}
+                if step is not None:
+                    entry.update(step=step, operation=operation)
+            entry["calls"] += counters["calls"]
+            entry["wall_ms"] += elapsed * 1000
+            entry["rows_in"] += counters["rows_in"]
+            entry["rows_out"] += counters["rows_out"]
+            if peak is not None:
+                entry["peak_memory_bytes"] = max(entry["peak_memory_bytes"] or 0, peak)
+    
+    def report(self) -> List[Dict[str, Any]]:
+        return [{**entry, "wall_ms": round(entry["wall_ms"], 3)} for entry in self.stages.values()]
+
+# ==================== DATA GENERATION ====================
+
+PLANTS = ["Plant_ATL", "Plant_NYC", "Plant_CHI", "Plant_LA", "Plant_MIA"]
+PRODUCTS = ["Product_A", "Product_B", "Product_C", "Product_D", "Product_E"]
+BATCH_IDS = np.array([f"BATCH_{n}" for n in range(1000, 10000)], dtype=object)
+OPERATOR_IDS = np.array([f"OP_{n}" for n in range(100, 1000)], dtype=object)
+
+# Column statistics of the simulated source; the planner uses them to scope null checks and estimate row counts
+PLANT_DATA_STATS = {
+    "null_fraction": {"quality_score": 0.05},
+    "distinct": {"plant_id": len(PLANTS), "product": len(PRODUCTS), "batch_id": len(BATCH_IDS),
+                 "operator_id": len(OPERATOR_IDS), "downtime_minutes": 121},
+    "range": {"production_volume": (5000, 15000), "quality_score": (85, 100), "downtime_minutes": (0, 120),
+              "temperature": (2, 25), "ph_level": (2.8, 3.5)}
+}
+
+def record_ids(offset: int, count: int) -> np.ndarray:
+    """REC_000000-style ids, formatted by Arrow's string kernels rather than one f-string per row"""
+    digits = pc.utf8_lpad(pa.array(np.arange(offset, offset + count)).cast(pa.string()), 6, "0")
+    return pc.binary_join_element_wise("REC_", digits, "").to_numpy(zero_copy_only=False)
+
+def generate_plant_data(num_records: int = 100, seed: Union[int, np.random.Generator, None] = None,
+                        offset: int = 0, base_time: Optional[datetime] = None) -> pd.DataFrame:
+    """Generate simulated manufacturing plant data, building each column in one vectorized draw"""
+    rng = np.random.default_rng(seed)
+    if base_time is None:
+        base_time = datetime.now(timezone.utc) - timedelta(days=7)
+    
+    quality_score = np.round(rng.uniform(85, 100, num_records), 2)
+    temperature = np.round(rng.uniform(2, 8, num_records), 1)
+    
+    # Randomly add some data quality issues
+    quality_score[rng.random(num_records) < 0.05] = np.nan  # 5% missing values
+    out_of_range = rng.random(num_records) < 0.03  # 3% out of range
+    temperature[out_of_range] = np.round(rng.uniform(15, 25, int(out_of_range.sum())), 1)
+    
+    return pd.DataFrame({
+        "record_id": record_ids(offset, num_records),
+        "plant_id": np.array(PLANTS, dtype=object)[rng.integers(0, len(PLANTS), num_records)],
+        "product": np.array(PRODUCTS, dtype=object)[rng.integers(0, len(PRODUCTS), num_records)],
+        "production_volume": np.round(rng.uniform(5000, 15000, num_records), 2),
+        "quality_score": quality_score,
+        "downtime_minutes": rng.integers(0, 121, num_records),
+        "batch_id": BATCH_IDS[rng.integers(0, len(BATCH_IDS), num_records)],
+        "temperature": temperature,
+        "ph_level": np.round(rng.uniform(2.8, 3.5, num_records), 2),
+        "timestamp": pd.date_range(base_time + timedelta(hours=offset), periods=num_records, freq="h", unit="us"),
+        "operator_id": OPERATOR_IDS[rng.integers(0, len(OPERATOR_IDS), num_records)],
+    })
+
+def generate_plant_batches(num_records: int, batch_size: int, seed: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yield simulated plant data in fixed-size chunks drawn from a single random stream"""
+    rng = np.random.default_rng(seed)
+    base_time = datetime.now(timezone.utc) - timedelta(days=7)
+    for offset in range(0, num_records, batch_size):
+        yield generate_plant_data(min(batch_size, num_records - offset), seed=rng, offset=offset, base_time=base_time)
+
+def filter_mask(df: pd.DataFrame, conditions: List[Dict[str, Any]], not_null: Optional[List[str]] = None) -> Optional[pd.Series]:
+    """AND together filter conditions (and an optional not-null check) into one boolean mask"""
+    mask = None
+    for condition in conditions:
+        field = condition.get("field")
+        operator = condition.get("operator")
+        value = condition.get("value")
+        
+        column = df[field]
+        if operator in (">", "<") and isinstance(column.dtype, pd.CategoricalDtype):
+            # Unordered categoricals only support equality; compare the categories' values instead
+            compare = (lambda col: col > value) if operator == ">" else (lambda col: col < value)
+            cond = pd.Series(map_column(column, compare), index=df.index)
+        elif operator == ">": cond = column > value
+        elif operator == "<": cond = column < value
+        elif operator == "==": cond = column == value
+        elif operator == "!=": cond = column != value
+        else: continue
+        if isinstance(cond.dtype, pd.BooleanDtype):
+            cond = cond.fillna(operator == "!=")  # nullable columns: treat NA the way NaN compares
+        mask = cond if mask is None else mask & cond
+    
+    if not_null:
+        cond = df[not_null].notna().all(axis=1)
+        mask = cond if mask is None else mask & cond
+    return mask
+
+def transform_frame(df: pd.DataFrame, transform: Dict[str, Any]) -> pd.DataFrame:
+    """Apply a single transformation step (or optimized plan node) to a DataFrame"""
+    transform_type = transform.get("type")
+    
+    if transform_type == "filter":
+        if "conditions" in transform:
+            conditions = transform["conditions"]
+        else:
+            conditions = [transform["condition"]] if transform.get("condition") else []
+        mask = filter_mask(df, conditions, transform.get("not_null"))
+        if mask is not None:
+            df = df[mask]
+    
+    elif transform_type == "aggregate":
+        group_by = transform.get("group_by", [])
+        agg_func = transform.get("function", "sum")
+        agg_field = transform.get("field")
+        
+        if group_by and agg_field:
+            if agg_func == "sum":
+                df = df.groupby(group_by, observed=True)[agg_field].sum().reset_index()
+            elif agg_func == "avg":
+                df = df.groupby(group_by, observed=True)[agg_field].mean().reset_index()
+            elif agg_func == "count":
+                df = df.groupby(group_by, observed=True)[agg_field].count().reset_index()
+            elif agg_func in SKETCH_FUNCTIONS:
+                df = merge_partial_aggregates([sketch_partials(df, transform)], transform)
+    
+    elif transform_type == "remove_nulls":
+        df = df.dropna(subset=transform.get("subset"))
+    
+    elif transform_type == "deduplicate":
+        key_fields = transform.get("key_fields", [])
+        if key_fields:
+            df = df.drop_duplicates(subset=key_fields)
+    
+    elif transform_type == "project":
+        columns = set(transform["columns"])
+        df = df[[c for c in df.columns if c in columns]]
+    
+    return df
+
+def apply_transformations(data: Union[List[Dict[str, Any]], pd.DataFrame], transformations: List[Dict[str, Any]],
+                          stats: Optional[Dict[str, Any]] = None, profiler: Optional[StageProfiler] = None,
+                          partitions: int = 1, source_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Apply PySpark-style transformations to data, via the optimized plan, typed by the source's schema"""
+    df = apply_schema(data if isinstance(data, pd.DataFrame) else pd.DataFrame(data), source_type)
+    profiler = profiler or StageProfiler(memory=False)
+    
+    if partitions > 1:
+        return pd.concat(list(stream_transformations([df], transformations, stats, profiler=profiler, partitions=partitions))).to_dict('records')
+    
+    for i, node in enumerate(plan_transformations(transformations, stats)[0]):
+        with profiler.stage("transform", len(df), i, node.get("type")) as counters:
+            df = transform_frame(df, node)
+            counters["rows_out"] = len(df)
+    
+    return df.to_dict('records')
+
+# ==================== SCHEMAS ====================
+
+# Column dtypes per DataSource.type. Columns a schema doesn't declare keep their inferred dtype.
+# Categories are sorted so categorical order matches string order in sorts and groupbys.
+SOURCE_SCHEMAS = {
+    "manufacturing_plant": {
+        "plant_id": pd.CategoricalDtype(sorted(PLANTS)),
+        "product": pd.CategoricalDtype(sorted(PRODUCTS)),
+        "production_volume": np.dtype("float64"),  # summed into totals float32 can't hold to the cent
+        "quality_score": np.dtype("float32"),
+        "downtime_minutes": pd.Int16Dtype(),
+        "batch_id": pd.CategoricalDtype(sorted(BATCH_IDS)),
+        "temperature": np.dtype("float32"),
+        "ph_level": np.dtype("float32"),
+        "timestamp": pd.DatetimeTZDtype("us", "UTC"),
+        "operator_id": pd.CategoricalDtype(sorted(OPERATOR_IDS)),
+    }
+}
+SOURCE_SCHEMAS["quality_sensor"] = {column: SOURCE_SCHEMAS["manufacturing_plant"][column] for column in
+                                    ("plant_id", "batch_id", "quality_score", "temperature", "ph_level", "timestamp")}
+
+def cast_column(column: pd.Series, dtype: Any) -> pd.Series:
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Values outside the declared categories extend them instead of becoming NaN
+        unknown = pd.Index(column.dropna().unique()).difference(dtype.categories)
+        if len(unknown):
+            dtype = pd.CategoricalDtype(dtype.categories.union(unknown))
+    elif isinstance(dtype, pd.DatetimeTZDtype):
+        return pd.to_datetime(column, utc=True).dt.as_unit(dtype.unit)
+    return column.astype(dtype)
+
+def apply_schema(df: pd.DataFrame, source_type: Optional[str]) -> pd.DataFrame:
+    """Cast a frame to its source type's declared dtypes; columns whose values don't fit keep the inferred dtype"""
+    schema = SOURCE_SCHEMAS.get(source_type) or {}
+    columns = {}
+    for column, dtype in schema.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        try:
+            columns[column] = cast_column(df[column], dtype)
+        except (TypeError, ValueError):
+            logger.debug("Column %s does not fit the %s schema; keeping its inferred dtype", column, source_type)
+    return df.assign(**columns) if columns else df
+
+def schema_fingerprint(source_type: Optional[str]) -> Dict[str, str]:
+    return {column: str(dtype) for column, dtype in (SOURCE_SCHEMAS.get(source_type) or {}).items()}
+
+def json_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rows as plain Python values: float32 at its shortest decimal form and None for every kind of null"""
+    widened = {column: df[column].astype(str).astype(np.float64) for column in df.columns if df[column].dtype == np.float32}
+    df = df.assign(**widened) if widened else df
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+# ==================== SOURCE CONNECTORS ====================
+
+SOURCE_FILES_ROOT = Path(os.environ.get('SOURCE_FILES_ROOT', str(ROOT_DIR / 'data' / 'sources')))
+CONNECTOR_READ_THREADS = int(os.environ.get('CONNECTOR_READ_THREADS', '4'))
+CONNECTOR_PREFETCH_CHUNKS = 2  # chunks each file being read ahead may buffer before the run consumes them
+FILE_FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet"}
+
+def connector_name(config: Dict[str, Any]) -> str:
+    """The connector a source's config selects: explicit `connector`, else by `path` extension, else simulated"""
+    if config.get("connector"):
+        return config["connector"]
+    if config.get("path"):
+        return FILE_FORMATS.get(Path(config["path"]).suffix.lower(), "csv")
+    return "simulated"
+
+def validate_source_config(config: Dict[str, Any]):
+    """Reject configs no connector can read; file paths must stay under SOURCE_FILES_ROOT"""
+    name = connector_name(config)
+    if name not in CONNECTORS:
+        raise ValueError(f"Unknown connector '{name}'")
+    if name == "simulated":
+        return
+    if not config.get("path"):
+        raise ValueError(f"The {name} connector needs a path")
+    root = os.path.normpath(SOURCE_FILES_ROOT.resolve())
+    if not os.path.normpath(os.path.join(root, config["path"])).startswith(root + os.sep):
+        raise ValueError(f"path must be inside {SOURCE_FILES_ROOT}")
+    columns = config.get("columns")
+    if columns is not None and not (isinstance(columns, list) and all(isinstance(c, str) for c in columns)):
+        raise ValueError("columns must be a list of column names")
+
+def source_files(pattern: str) -> List[Path]:
+    """Files matching a path glob relative to SOURCE_FILES_ROOT, in name order"""
+    root = SOURCE_FILES_ROOT.resolve()
+    paths = (Path(p).resolve() for p in glob.glob(str(root / pattern), recursive=True))
+    return sorted(p for p in paths if p.is_file() and p.is_relative_to(root))
+
+def file_fingerprint(path: Path) -> str:
+    """Identity of one version of a file: a rewritten file counts as new"""
+    stat = path.stat()
+    return f"{path.relative_to(SOURCE_FILES_ROOT.resolve()).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def rechunk(batches: Iterable[pa.RecordBatch], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Regroup record batches into DataFrames of `chunk_size` rows (the last one may be shorter)"""
+    pending, rows = [], 0
+    for batch in batches:
+        pending.append(batch)
+        rows += batch.num_rows
+        if rows >= chunk_size:
+            table = pa.Table.from_batches(pending)
+            for start in range(0, rows - chunk_size + 1, chunk_size):
+                yield table.slice(start, chunk_size).to_pandas()
+            remainder = table.slice(rows - rows % chunk_size)
+            pending, rows = remainder.to_batches(), remainder.num_rows
+    if rows:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+def read_ahead(paths: List[Path], read: Callable[[Path], Iterator[pd.DataFrame]], threads: int) -> Iterator[tuple[Path, Optional[pd.DataFrame]]]:
+    """Yield (path, chunk) for every chunk of every file in path order, then (path, None) once a file is done.
+    
+    Up to `threads` files are read concurrently in threads (Arrow releases the GIL while parsing),
+    each buffering at most CONNECTOR_PREFETCH_CHUNKS chunks, so memory stays bounded."""
+    stop = threading.Event()
+    
+    def put(out: queue.Queue, item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def produce(path: Path, out: queue.Queue):
+        try:
+            for chunk in read(path):
+                if stop.is_set():
+                    return
+                put(out, ("chunk", chunk))
+            put(out, ("done", None))
+        except BaseException as e:
+            put(out, ("error", e))
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="connector")
+    in_flight = deque()
+    remaining = iter(paths)
+    try:
+        while True:
+            while len(in_flight) < max(1, threads):
+                path = next(remaining, None)
+                if path is None:
+                    break
+                out = queue.Queue(maxsize=CONNECTOR_PREFETCH_CHUNKS)
+                executor.submit(produce, path, out)
+                in_flight.append((path, out))
+            if not in_flight:
+                return
+            path, out = in_flight.popleft()
+            while True:
+                kind, value = out.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    yield path, None
+                    break
+                yield path, value
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+class SimulatedConnector:
+    """The built-in plant data simulator; reruns use the timestamp watermark"""
+    filters_by_watermark = True
+    stats = PLANT_DATA_STATS
+    
+    def __init__(self, config: Dict[str, Any], options: Dict[str, Any], ingested: Iterable[str] = ()):
+        self.num_records = options.get("num_records", 100)
+        self.seed = options.get("seed")
+        self.files: List[str] = []
+        self.skipped_files = 0
+        self.current_file: Optional[str] = None
+    
+    def chunk_size(self, options: Dict[str, Any]) -> int:
+        # Non-streaming runs are a single chunk holding the whole batch
+        return options.get("chunk_size", 10000) if options.get("streaming") else max(self.num_records, 1)
+    
+    def batches(self, chunk_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        return generate_plant_batches(self.num_records, chunk_size, seed=self.seed)
+
+class FileConnector:
+    """Reads the files matching a source's `path` glob in chunks, several files at a time.
+    
+    Files are identified by path, size and mtime. Those in `ingested` are skipped; `files` lists
+    the ones this run read, to be committed with the watermark once the run succeeds. Reruns
+    rely on this instead of the timestamp watermark, so late files with old records still load.
+    Nothing is known about a file's columns up front, so the planner gets no statistics for it."""
+    filters_by_watermark = False
+    stats = None
+    
+    def __init__(self, config: Dict[str, Any], options: Dict[str, Any], ingested: Iterable[str] = ()):
+        self.config = config
+        self.column_types = arrow_column_types(options.get("source_type"))
+        self.ingested = set(ingested)
+        self.files: List[str] = []
+        self.skipped_files = 0
+        self.current_file: Optional[str] = None  # fingerprint of the file the last chunk came from
+    
+    def chunk_size(self, options: Dict[str, Any]) -> int:
+        # File sizes aren't known up front, so file sources are always read in bounded chunks
+        return options.get("chunk_size", 10000)
+    
+    def batches(self, chunk_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        columns = self.config.get("columns") or columns
+        fingerprints = {}
+        for path in source_files(self.config["path"]):
+            fingerprint = file_fingerprint(path)
+            if fingerprint in self.ingested:
+                self.skipped_files += 1
+            else:
+                fingerprints[path] = fingerprint
+        
+        read = lambda path: rechunk(self.read_file(path, chunk_size, columns), chunk_size)
+        for path, chunk in read_ahead(list(fingerprints), read, CONNECTOR_READ_THREADS):
+            if chunk is None:
+                self.files.append(fingerprints[path])
+            elif len(chunk):
+                self.current_file = fingerprints[path]
+                yield chunk
+    
+    def read_file(self, path: Path, chunk_size: int, columns: Optional[List[str]]) -> Iterator[pa.RecordBatch]:
+        raise NotImplementedError
+
+class CsvConnector(FileConnector):
+    def read_file(self, path: Path, chunk_size: int, columns: Optional[List[str]]) -> Iterator[pa.RecordBatch]:
+        options = self.config.get("csv", {})
+        reader = pa_csv.open_csv(
+            pa.memory_map(str(path)),
+            read_options=pa_csv.ReadOptions(use_threads=False, block_size=options.get("block_size", 1 << 22)),
+            parse_options=pa_csv.ParseOptions(delimiter=options.get("delimiter", ",")),
+            convert_options=pa_csv.ConvertOptions(include_columns=columns, include_missing_columns=columns is not None,
+                                                  column_types=self.column_types)
+        )
+        yield from reader
+
+class ParquetConnector(FileConnector):
+    def read_file(self, path: Path, chunk_size: int, columns: Optional[List[str]]) -> Iterator[pa.RecordBatch]:
+        parquet = pq.ParquetFile(str(path), memory_map=True)
+        if columns is not None:
+            columns = [c for c in columns if c in parquet.schema_arrow.names]
+        yield from parquet.iter_batches(batch_size=chunk_size, columns=columns)
+
+CONNECTORS = {"simulated": SimulatedConnector, "csv": CsvConnector, "parquet": ParquetConnector}
+
+def arrow_column_types(source_type: Optional[str]) -> Dict[str, pa.DataType]:
+    """Arrow types to parse CSV columns as, from the source type's schema, so every block of a file agrees.
+    Timestamps are left to apply_schema, which also accepts values without a UTC offset."""
+    types = {}
+    for column, dtype in (SOURCE_SCHEMAS.get(source_type) or {}).items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            types[column] = pa.string()
+        elif not isinstance(dtype, pd.DatetimeTZDtype):
+            types[column] = pa.from_numpy_dtype(getattr(dtype, "numpy_dtype", dtype))
+    return types
+
+def open_connector(options: Dict[str, Any], ingested: Iterable[str] = ()):
+    config = options.get("source_config") or {}
+    return CONNECTORS[connector_name(config)](config, options, ingested)
+
+def source_stats(options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Column statistics the planner may rely on for a run's source, or None if its data is unknown"""
+    return CONNECTORS[connector_name(options.get("source_config") or {})].stats
+
+def read_columns(transformations: List[Dict[str, Any]], stats: Optional[Dict[str, Any]] = None) -> Optional[List[str]]:
+    """Columns a run needs from its source: the planner's pruned input plus the watermark column, or None for all"""
+    plan = plan_transformations(transformations, stats)[0]
+    if plan and plan[0]["type"] == "project":
+        return sorted(set(plan[0]["columns"]) | {"timestamp"})
+    return None
+
+# ==================== QUERY PLANNER ====================
+
+FILTER_OPERATORS = (">", "<", "==", "!=")
+# Textbook selectivity guesses for when no column statistics are available
+DEFAULT_SELECTIVITY = {">": 1 / 3, "<": 1 / 3, "==": 0.1, "!=": 0.9}
+
+def plan_node(transform: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Normalize a user transformation into a plan node, or None when it would not change the data"""
+    transform_type = transform.get("type")
+    if transform_type == "filter":
+        condition = transform.get("condition")
+        if not condition or condition.get("operator") not in FILTER_OPERATORS:
+            return None
+        return {"type": "filter", "conditions": [condition]}
+    if transform_type == "aggregate":
+        if not is_aggregate_step(transform):
+            return None
+        node = {"type": "aggregate", "group_by": list(transform["group_by"]), "field": transform["field"],
+                "function": transform.get("function", "sum")}
+        if node["function"] == "approx_percentile":
+            node["percentile"] = float(transform.get("percentile", 0.95))
+        return node
+    if transform_type == "remove_nulls":
+        return {"type": "remove_nulls", "subset": None}
+    if transform_type == "deduplicate" and transform.get("key_fields"):
+        return {"type": "deduplicate", "key_fields": list(transform["key_fields"])}
+    return None
+
+def filter_fields(node: Dict[str, Any]) -> set:
+    return {c.get("field") for c in node["conditions"]} | set(node.get("not_null") or [])
+
+def can_push_filter(below: Dict[str, Any], node: Dict[str, Any]) -> bool:
+    """Whether a filter gives the same result when run before `below` instead of after it"""
+    if below["type"] == "remove_nulls":
+        return True  # both only drop rows, so they commute
+    if below["type"] == "aggregate":
+        return filter_fields(node) <= set(below["group_by"])  # predicate on group keys only
+    if below["type"] == "deduplicate":
+        return filter_fields(node) <= set(below["key_fields"])  # all duplicates pass or fail together
+    return False
+
+def plan_transformations(transformations: List[Dict[str, Any]], stats: Optional[Dict[str, Any]] = None) -> tuple[List[Dict[str, Any]], List[str]]:
+    """Build an optimized logical plan for a transformation list.
+    
+    Rewrites never change the result: filters are pushed below steps they commute with and
+    adjacent filters fused into one mask; with source stats, remove_nulls only checks columns
+    that can hold nulls; and when an aggregate makes most columns dead, the input is pruned
+    to the columns the plan reads. Returns the plan and a description of each rewrite."""
+    rewrites = []
+    plan = []
+    for transform in transformations:
+        node = plan_node(transform)
+        if node is None:
+            rewrites.append(f"dropped no-op {transform.get('type')} step")
+        else:
+            plan.append(node)
+    
+    # Push filters down past steps they commute with
+    moved = True
+    while moved:
+        moved = False
+        for i in range(1, len(plan)):
+            if plan[i]["type"] == "filter" and can_push_filter(plan[i - 1], plan[i]):
+                rewrites.append(f"pushed filter on {sorted(filter_fields(plan[i]))} below {plan[i - 1]['type']}")
+                plan[i - 1], plan[i] = plan[i], plan[i - 1]
+                moved = True
+    
+    # Scope remove_nulls to the columns that can actually be null at that point
+    if stats is not None:
+        nullable = set(stats.get("null_fraction", {}))
+        scoped = []
+        for node in plan:
+            if node["type"] == "remove_nulls":
+                if not nullable:
+                    rewrites.append("dropped remove_nulls: no nullable columns at that point")
+                    continue
+                node = dict(node, subset=sorted(nullable))
+                rewrites.append(f"scoped remove_nulls to {node['subset']}")
+                nullable = set()
+            elif node["type"] == "aggregate":
+                nullable = ({node["field"]} if node["function"] in ("avg", "approx_percentile") and node["field"] in nullable
+                            else set())
+            scoped.append(node)
+        plan = scoped
+    
+    # Fuse adjacent filters, and scoped null checks, into a single mask
+    fused = []
+    for node in plan:
+        prev = fused[-1] if fused else None
+        if prev is not None and prev["type"] == "filter" and node["type"] == "filter":
+            fused[-1] = dict(prev, conditions=prev["conditions"] + node["conditions"],
+                             not_null=(prev.get("not_null") or []) + (node.get("not_null") or []) or None)
+            rewrites.append("fused adjacent filters into one mask")
+        elif prev is not None and prev["type"] == "filter" and node["type"] == "remove_nulls" and node["subset"]:
+            fused[-1] = dict(prev, not_null=sorted(set(prev.get("not_null") or []) | set(node["subset"])))
+            rewrites.append("fused remove_nulls into filter mask")
+        elif prev is not None and prev["type"] == "remove_nulls" and prev["subset"] and node["type"] == "filter":
+            fused[-1] = dict(node, not_null=sorted(set(prev["subset"]) | set(node.get("not_null") or [])))
+            rewrites.append("fused remove_nulls into filter mask")
+        else:
+            fused.append(node)
+    plan = fused
+    
+    # Prune input columns no step reads when an aggregate discards the rest anyway
+    live = None  # None means every column is needed
+    for node in reversed(plan):
+        if node["type"] == "aggregate":
+            live = set(node["group_by"]) | {node["field"]}
+        elif live is not None:
+            if node["type"] == "filter":
+                live |= filter_fields(node)
+            elif node["type"] == "remove_nulls":
+                live = None if node["subset"] is None else live | set(node["subset"])
+            elif node["type"] == "deduplicate":
+                live |= set(node["key_fields"])
+    if live is not None:
+        plan.insert(0, {"type": "project", "columns": sorted(live)})
+        rewrites.append(f"pruned input to columns {sorted(live)}")
+    
+    return plan, rewrites
+
+def filter_selectivity(condition: Dict[str, Any], stats: Dict[str, Any]) -> float:
+    field, operator, value = condition.get("field"), condition.get("operator"), condition.get("value")
+    bounds = stats.get("range", {}).get(field)
+    distinct = stats.get("distinct", {}).get(field)
+    if bounds and operator in (">", "<") and isinstance(value, (int, float)):
+        low, high = bounds
+        above = (high - value) / (high - low) if high > low else float(value < high)
+        return min(max(above if operator == ">" else 1 - above, 0.0), 1.0)
+    if distinct and operator in ("==", "!="):
+        return 1 / distinct if operator == "==" else 1 - 1 / distinct
+    return DEFAULT_SELECTIVITY[operator]
+
+def estimate_plan_rows(plan: List[Dict[str, Any]], input_rows: int, stats: Optional[Dict[str, Any]] = None) -> List[int]:
+    """Estimated output row count of each plan node"""
+    stats = stats or {}
+    null_fraction = stats.get("null_fraction", {})
+    distinct = stats.get("distinct", {})
+    rows = float(input_rows)
+    estimates = []
+    for node in plan:
+        if node["type"] == "filter":
+            for condition in node["conditions"]:
+                rows *= filter_selectivity(condition, stats)
+            for column in node.get("not_null") or []:
+                rows *= 1 - null_fraction.get(column, 0)
+        elif node["type"] == "remove_nulls":
+            for column in node["subset"] if node["subset"] is not None else null_fraction:
+                rows *= 1 - null_fraction.get(column, 0)
+        elif node["type"] in ("aggregate", "deduplicate"):
+            keys = node["group_by"] if node["type"] == "aggregate" else node["key_fields"]
+            if all(k in distinct for k in keys):
+                rows = min(rows, float(np.prod([distinct[k] for k in keys])))
+        estimates.append(int(round(rows)))
+    return estimates
+
+def explain_transformations(transformations: List[Dict[str, Any]], input_rows: int, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Optimized plan with per-node row estimates, as returned by the explain endpoint"""
+    plan, rewrites = plan_transformations(transformations, stats)
+    estimates = estimate_plan_rows(plan, input_rows, stats)
+    return {
+        "input_rows": input_rows,
+        "original": transformations,
+        "plan": [dict(node, estimated_rows=rows) for node, rows in zip(plan, estimates)],
+        "rewrites": rewrites,
+        "estimated_output_rows": estimates[-1] if estimates else input_rows
+    }
+
+def column_or_missing(df: pd.DataFrame, field: str) -> pd.Series:
+    """Column values for a rule, or an all-missing column when the field is absent"""
+    if field in df.columns:
+        return df[field]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+def map_column(column: pd.Series, func: Callable[[pd.Series], pd.Series]) -> np.ndarray:
+    """Evaluate an elementwise predicate, once per category for categorical columns"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = pd.Series(column.cat.categories.astype(object).tolist() + [np.nan], dtype=object)
+        return np.asarray(func(categories), dtype=bool)[column.cat.codes.to_numpy()]
+    return np.asarray(func(column), dtype=bool)
+
+def is_blank(col: pd.Series) -> pd.Series:
+    """None or empty string, exactly as the per-record check saw them: NaN, NaT and NA are values"""
+    if col.dtype == object:
+        blank = col.isna()
+        if blank.any():
+            blank[blank] = [value is None for value in col[blank]]
+        return blank | (col == "")
+    if pd.api.types.is_string_dtype(col.dtype):
+        return (col == "").fillna(False).astype(bool)
+    return pd.Series(False, index=col.index)
+
+def compile_rule(rule: Dict[str, Any]) -> Callable[[pd.DataFrame], np.ndarray]:
+    """Compile a quality rule into a vectorized predicate returning the mask of failing rows"""
+    rule_type = rule.get("rule_type")
+    field = rule.get("field")
+    condition = rule.get("condition") or {}
+    
+    if rule_type == "completeness":
+        # Check for null/missing values
+        def predicate(df):
+            return map_column(column_or_missing(df, field), is_blank)
+    
+    elif rule_type == "accuracy":
+        # Check if values are within acceptable range
+        min_val = condition.get("min")
+        max_val = condition.get("max")
+        
+        def predicate(df):
+            if field not in df.columns:
+                return np.zeros(len(df), dtype=bool)
+            col = df[field]
+            return np.asarray(col.notna() & ((col < min_val) | (col > max_val)), dtype=bool)
+    
+    elif rule_type == "consistency":
+        # Check if values match expected format/pattern
+        expected_pattern = condition.get("pattern")
+        
+        def predicate(df):
+            if not expected_pattern:
+                return np.zeros(len(df), dtype=bool)
+            if field not in df.columns:
+                return np.full(len(df), not "".startswith(expected_pattern))
+            return map_column(df[field], lambda col: ~col.map(str).str.startswith(expected_pattern))
+    
+    else:
+        def predicate(df):
+            return np.zeros(len(df), dtype=bool)
+    
+    return predicate
+
+def validate_frame(df: pd.DataFrame, rules: List[Dict[str, Any]], return_failures: bool = False):
+    """Validate a DataFrame against all quality rules in one columnar pass.
+    
+    With return_failures=True a third value maps each rule id to the positional indices of
+    its failing rows, so bad records can be quarantined without scanning again."""
+    results = []
+    failures = {}
+    total_records = len(df)
+    
+    for rule in rules:
+        failed_mask = compile_rule(rule)(df)
+        failed_records = int(failed_mask.sum())
+        if return_failures:
+            failures[rule.get("id")] = np.flatnonzero(failed_mask)
+        
+        passed = failed_records == 0
+        quality_score = ((total_records - failed_records) / total_records * 100) if total_records > 0 else 0
+        
+        results.append({
+            "rule_id": rule.get("id"),
+            "rule_name": rule.get("name"),
+            "passed": passed,
+            "records_checked": total_records,
+            "records_failed": failed_records,
+            "quality_score": round(quality_score, 2)
+        })
+    
+    overall_score = sum(r["quality_score"] for r in results) / len(results) if results else 100
+    
+    if return_failures:
+        return results, {"overall_quality_score": round(overall_score, 2)}, failures
+    return results, {"overall_quality_score": round(overall_score, 2)}
+
+def validate_data(data: Union[List[Dict[str, Any]], pd.DataFrame], rules: List[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Validate data against quality rules"""
+    # Object columns keep records' None apart from NaN, which completeness checks treat differently
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data, dtype=object)
+    return validate_frame(df, rules)
+
+# ==================== SKETCHES ====================
+
+HLL_PRECISION = 14  # 2^14 registers: ~0.8% standard error, at most 16 KiB per group
+TDIGEST_COMPRESSION = 200  # ~100 centroids per group
+SKETCH_FUNCTIONS = ("approx_distinct", "approx_percentile")
+
+def sketch_hashes(values: pd.Series) -> np.ndarray:
+    """64-bit hashes of the non-null values; numbers hash as float64 so int and float chunks agree"""
+    values = values.dropna()
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        values = values.astype(np.float64)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+class HyperLogLog:
+    """Distinct-count sketch; merging two is exact, so sketches combine across chunks and runs in any order"""
+    
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+    
+    def add(self, values: pd.Series) -> "HyperLogLog":
+        return self.add_hashes(sketch_hashes(values))
+    
+    def add_hashes(self, hashes: np.ndarray) -> "HyperLogLog":
+        if len(hashes):
+            p = self.precision
+            index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+            rest = hashes << np.uint64(p)
+            # Bit length: smear the highest set bit down, then count the ones
+            for shift in (1, 2, 4, 8, 16, 32):
+                rest |= rest >> np.uint64(shift)
+            rank = np.minimum(65 - np.bitwise_count(rest), 65 - p).astype(np.uint8)
+            np.maximum.at(self.registers, index, rank)
+        return self
+    
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def estimate(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting is more accurate for small cardinalities
+        return int(round(estimate))
+    
+    def to_bytes(self) -> bytes:
+        nonzero = np.flatnonzero(self.registers)
+        if len(nonzero) * 3 < len(self.registers):
+            # Sparse: (register, value) pairs, so small groups stay small
+            return (b"h" + bytes([self.precision]) + nonzero.astype("<u2").tobytes()
+                    + self.registers[nonzero].tobytes())
+        return b"H" + bytes([self.precision]) + self.registers.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        precision = data[1]
+        if data[:1] == b"H":
+            return cls(precision, np.frombuffer(data, dtype=np.uint8, offset=2).copy())
+        sketch = cls(precision)
+        count = (len(data) - 2) // 3
+        index = np.frombuffer(data, dtype="<u2", count=count, offset=2)
+        sketch.registers[index] = np.frombuffer(data, dtype=np.uint8, offset=2 + 2 * count)
+        return sketch
+
+class TDigest:
+    """Mergeable quantile sketch of weighted centroids, densest in the tails where p95/p99 live"""
+    
+    def __init__(self, compression: float = TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.array([], dtype=np.float64)
+        self.weights = np.array([], dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+    
+    def add(self, values: pd.Series) -> "TDigest":
+        values = pd.to_numeric(values, errors="coerce").dropna().to_numpy(dtype=np.float64)
+        if len(values):
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+            self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+    
+    def merge(self, other: "TDigest") -> "TDigest":
+        if len(other.means):
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+    
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Centroids falling in the same unit of the arcsine scale function are combined
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+    
+    def quantile(self, q: float) -> float:
+        if not len(self.means):
+            return float("nan")
+        centers = np.cumsum(self.weights) - self.weights / 2
+        total = self.weights.sum()
+        return float(np.interp(q * total, np.r_[0, centers, total], np.r_[self.min, self.means, self.max]))
+    
+    def to_bytes(self) -> bytes:
+        return b"T" + np.r_[self.compression, self.min, self.max, self.means, self.weights].astype("<f8").tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        values = np.frombuffer(data, dtype="<f8", offset=1)
+        sketch = cls(values[0])
+        sketch.min, sketch.max = values[1], values[2]
+        centroids = values[3:].reshape(2, -1)
+        sketch.means, sketch.weights = centroids[0].copy(), centroids[1].copy()
+        return sketch
+
+def load_sketch(data: bytes) -> Union[HyperLogLog, TDigest]:
+    return TDigest.from_bytes(data) if data[:1] == b"T" else HyperLogLog.from_bytes(data)
+
+def new_sketch(function: str) -> Union[HyperLogLog, TDigest]:
+    return HyperLogLog() if function == "approx_distinct" else TDigest()
+
+def merge_sketches(sketches: Iterable[bytes]) -> bytes:
+    """Serialized merge of serialized sketches of the same kind"""
+    sketches = iter(sketches)
+    merged = load_sketch(next(sketches))
+    for data in sketches:
+        merged.merge(load_sketch(data))
+    return merged.to_bytes()
+
+def sketch_value(sketch: Union[HyperLogLog, TDigest], function: str, percentile: float = 0.95) -> Union[int, float]:
+    """The distinct count or percentile a sketch estimates"""
+    return sketch.estimate() if function == "approx_distinct" else sketch.quantile(percentile)
+
+def sketch_partials(df: pd.DataFrame, transform: Dict[str, Any]) -> pd.DataFrame:
+    """Per-group serialized sketches of the aggregate field, indexed like the sum/count partials"""
+    group_by, field, function = transform["group_by"], transform["field"], transform["function"]
+    grouped = df.groupby(group_by, observed=True)
+    groups = grouped.size().index
+    positions = grouped.indices
+    if function == "approx_distinct":
+        # Hash the column once, then slice per group
+        notnull = df[field].notna().to_numpy()
+        hashes = np.zeros(len(df), dtype=np.uint64)
+        hashes[notnull] = sketch_hashes(df[field])
+        sketches = [HyperLogLog().add_hashes(hashes[rows[notnull[rows]]]).to_bytes()
+                    for rows in (positions[key] for key in groups)]
+    else:
+        values = pd.to_numeric(df[field], errors="coerce")
+        sketches = [TDigest().add(values.iloc[positions[key]]).to_bytes() for key in groups]
+    return pd.DataFrame({"sketch": pd.Series(sketches, index=groups, dtype=object)})
+
+def sketch_groups(partials: List[pd.DataFrame], group_by: List[str]) -> List[Dict[str, Any]]:
+    """One {group, sketch} entry per group of sketch partials, with plain Python group values"""
+    entries = []
+    for key, data in combine_partials(partials)["sketch"].items():
+        key = key if isinstance(key, tuple) else (key,)
+        group = {field: value.item() if isinstance(value, np.generic) else value for field, value in zip(group_by, key)}
+        entries.append({"group": group, "sketch": data})
+    return entries
+
+def combine_sketch_documents(docs: List[Dict[str, Any]], percentile: Optional[float] = None) -> Dict[str, Any]:
+    """Merge persisted per-run sketches by aggregate and group, and estimate each merged group"""
+    merged = {}
+    for doc in docs:
+        key = (doc["field"], doc["function"], tuple(doc["group_by"]), json.dumps(doc["group"], sort_keys=True, default=str))
+        entry = merged.setdefault(key, {"doc": doc, "sketch": load_sketch(doc["sketch"]), "runs": set()})
+        if entry["doc"] is not doc:
+            entry["sketch"].merge(load_sketch(doc["sketch"]))
+        entry["runs"].add(doc["pipeline_run_id"])
+    
+    rows = []
+    for entry in merged.values():
+        doc = entry["doc"]
+        row = {"field": doc["field"], "function": doc["function"], "group": doc["group"], "runs": len(entry["runs"])}
+        if doc["function"] == "approx_percentile":
+            row["percentile"] = percentile if percentile is not None else doc.get("percentile") or 0.95
+        value = sketch_value(entry["sketch"], doc["function"], row.get("percentile", 0.95))
+        row["value"] = None if value != value else value  # NaN is not valid JSON
+        rows.append(row)
+    return {"rows": rows, "row_count": len(rows)}
+
+def group_sketches(values: pd.Series, function: str, percentile: float = 0.95) -> Union[int, float]:
+    """Aggregation function for groupby().agg() computing one approximate value from raw rows"""
+    return sketch_value(new_sketch(function).add(values), function, percentile)
+
+# ==================== STREAMING EXECUTION ====================
+
+STREAM_PARTIALS_COMPACT_AT = 64  # merge partial aggregates once this many chunks have piled up
+
+def is_aggregate_step(transform: Dict[str, Any]) -> bool:
+    """Whether a transformation is an aggregate that actually changes the data"""
+    function = transform.get("function", "sum")
+    if function == "approx_percentile":
+        percentile = transform.get("percentile", 0.95)
+        supported = isinstance(percentile, (int, float)) and 0 <= percentile <= 1
+    else:
+        supported = function in ("sum", "avg", "count", "approx_distinct")
+    return (transform.get("type") == "aggregate" and bool(transform.get("group_by")) and bool(transform.get("field"))
+            and supported)
+
+def deduplicate_chunk(df: pd.DataFrame, key_fields: List[str], seen: np.ndarray) -> tuple[pd.DataFrame, np.ndarray]:
+    """Drop rows whose key was already seen in this or an earlier chunk; returns the updated sorted key hashes.
+    
+    Lookups are binary searches and new keys are merged in without re-sorting `seen`, so a chunk
+    costs O(chunk log seen) plus one copy. Memory is 8 bytes per distinct key of the whole stream
+    (per partition's share of the key space when partitioned)."""
+    hashes = pd.util.hash_pandas_object(df[key_fields], index=False).to_numpy()
+    unique, first_index = np.unique(hashes, return_index=True)
+    positions = np.searchsorted(seen, unique)
+    known = np.zeros(len(unique), dtype=bool)
+    in_range = positions < len(seen)
+    known[in_range] = seen[positions[in_range]] == unique[in_range]
+    keep = np.zeros(len(hashes), dtype=bool)
+    keep[first_index[~known]] = True
+    return df[keep], np.insert(seen, positions[~known], unique[~known])
+
+def partial_aggregate(df: pd.DataFrame, transform: Dict[str, Any]) -> pd.DataFrame:
+    """Reduce a chunk to per-group sum/count partials (or sketches) that can be merged with other chunks"""
+    if transform.get("function") in SKETCH_FUNCTIONS:
+        return sketch_partials(df, transform)
+    return df.groupby(transform["group_by"], observed=True)[transform["field"]].agg(["sum", "count"])
+
+def combine_partials(partials: List[pd.DataFrame]) -> pd.DataFrame:
+    """Merge partial aggregates into one partial per group"""
+    merged = pd.concat(partials)
+    grouped = merged.groupby(level=list(range(merged.index.nlevels)), observed=True)
+    if "sketch" in merged.columns:
+        return grouped["sketch"].agg(merge_sketches).to_frame()
+    return grouped.sum()
+
+def merge_partial_aggregates(partials: List[pd.DataFrame], transform: Dict[str, Any]) -> pd.DataFrame:
+    """Combine partial aggregate states into the final aggregate frame"""
+    group_by = transform["group_by"]
+    agg_field = transform["field"]
+    agg_func = transform.get("function", "sum")
+    if not partials:
+        return pd.DataFrame(columns=group_by + [agg_field])
+    
+    merged = combine_partials(partials)
+    if agg_func in SKETCH_FUNCTIONS:
+        percentile = transform.get("percentile", 0.95)
+        values = merged["sketch"].map(lambda data: sketch_value(load_sketch(data), agg_func, percentile))
+    elif agg_func == "sum":
+        values = merged["sum"]
+    elif agg_func == "avg":
+        values = merged["sum"] / merged["count"].where(merged["count"] > 0)
+    else:
+        values = merged["count"]
+    return values.rename(agg_field).rename_axis(group_by).reset_index()
+
+def stream_transformations(batches: Iterable[pd.DataFrame], transformations: List[Dict[str, Any]],
+                           stats: Optional[Dict[str, Any]] = None,
+                           state: Optional[Dict[str, Any]] = None,
+                           profiler: Optional[StageProfiler] = None,
+                           partitions: int = 1, prefix: int = 0) -> Iterator[pd.DataFrame]:
+    """Run transformations over a stream of chunks, carrying dedup and aggregate state between them.
+    
+    Row-level steps before the first aggregate run per chunk. The aggregate keeps mergeable
+    partials, and whatever follows it runs once on the (small) aggregated result. A `state`
+    dict seeds the dedup keys and partials from earlier runs and receives the updated ones, plus
+    this run's own partials as "run_partials". With `partitions` > 1, large chunks are split and run on the partition pool (see run_partitioned).
+    The first `prefix` planned steps must be stateless and were already applied to the incoming chunks (see shared scans)."""
+    transformations = plan_transformations(transformations, stats)[0]
+    profiler = profiler or StageProfiler(memory=False)
+    split = next((i for i, t in enumerate(transformations) if is_aggregate_step(t)), len(transformations))
+    row_steps = transformations[:split]
+    state = {} if state is None else state
+    seen = {i: state.get("seen", {}).get(i, np.array([], dtype=np.uint64)) for i, t in enumerate(row_steps)
+            if t.get("type") == "deduplicate" and t.get("key_fields")}
+    seeded = list(state.get("partials", []))
+    partials = []
+    aggregate = transformations[split] if split < len(transformations) else None
+    key = partition_key(row_steps) if partitions > 1 else None
+    
+    for chunk in batches:
+        if key is not None and len(chunk) >= PARTITION_MIN_ROWS:
+            with profiler.stage("partitioned_transform", len(chunk)) as counters:
+                frames, seen = run_partitioned(chunk, row_steps, aggregate, seen, key, partitions, partition_pool(), prefix)
+                counters["rows_out"] = 0 if aggregate is not None else len(frames[0])
+            if aggregate is None:
+                yield frames[0]
+            else:
+                partials.extend(frames)
+                if len(partials) >= STREAM_PARTIALS_COMPACT_AT:
+                    partials = [combine_partials(partials)]
+            continue
+        
+        for i, transform in enumerate(row_steps[prefix:], prefix):
+            with profiler.stage("transform", len(chunk), i, transform.get("type")) as counters:
+                if i in seen:
+                    chunk, seen[i] = deduplicate_chunk(chunk, transform["key_fields"], seen[i])
+                else:
+                    chunk = transform_frame(chunk, transform)
+                counters["rows_out"] = len(chunk)
+        
+        if split == len(transformations):
+            yield chunk
+        else:
+            # Rows in are counted per chunk here, the aggregated rows out once at the merge
+            with profiler.stage("transform", len(chunk), split, "aggregate") as counters:
+                partials.append(partial_aggregate(chunk, transformations[split]))
+                if len(partials) >= STREAM_PARTIALS_COMPACT_AT:
+                    partials = [combine_partials(partials)]
+                counters["rows_out"] = 0
+    
+    state["seen"] = seen
+    if split < len(transformations):
+        state["partials"] = seeded + partials
+        state["run_partials"] = partials
+        with profiler.stage("transform", 0, split, "aggregate") as counters:
+            df = merge_partial_aggregates(seeded + partials, transformations[split])
+            counters.update(calls=0, rows_out=len(df))
+        for i, transform in enumerate(transformations[split + 1:], split + 1):
+            with profiler.stage("transform", len(df), i, transform.get("type")) as counters:
+                df = transform_frame(df, transform)
+                counters["rows_out"] = len(df)
+        yield df
+
+def merge_validation_results(partials: List[List[Dict[str, Any]]], rules: List[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Merge per-chunk validate_data results into run-level results"""
+    if not partials:
+        return validate_data([], rules)
+    
+    results = []
+    for chunk_results in zip(*partials):
+        total_records = sum(r["records_checked"] for r in chunk_results)
+        failed_records = sum(r["records_failed"] for r in chunk_results)
+        quality_score = ((total_records - failed_records) / total_records * 100) if total_records > 0 else 0
+        results.append({
+            "rule_id": chunk_results[0]["rule_id"],
+            "rule_name": chunk_results[0]["rule_name"],
+            "passed": failed_records == 0,
+            "records_checked": total_records,
+            "records_failed": failed_records,
+            "quality_score": round(quality_score, 2)
+        })
+    
+    overall_score = sum(r["quality_score"] for r in results) / len(results) if results else 100
+    
+    return results, {"overall_quality_score": round(overall_score, 2)}
+
+def execute_streaming(batches: Iterable[pd.DataFrame], transformations: List[Dict[str, Any]],
+                      rules: List[Dict[str, Any]], sample_size: int = 50, stats: Optional[Dict[str, Any]] = None,
+                      writer: Optional["RunOutputWriter"] = None, state: Optional[Dict[str, Any]] = None,
+                      progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      profiler: Optional[StageProfiler] = None, partitions: int = 1, prefix: int = 0) -> Dict[str, Any]:
+    """Ingest, transform and validate a run chunk by chunk, keeping only a bounded sample in memory.
+    
+    `progress` is called with the running chunk and record counts as each chunk is ingested."""
+    counts = {"chunks": 0, "records_ingested": 0, "records_out": 0}
+    
+    def counted(chunks):
+        for chunk in chunks:
+            counts["chunks"] += 1
+            counts["records_ingested"] += len(chunk)
+            if progress is not None:
+                progress(dict(counts))
+            yield chunk
+    
+    profiler = profiler or StageProfiler(memory=False)
+    sample = []
+    partial_results = []
+    for chunk in stream_transformations(counted(batches), transformations, stats, state, profiler, partitions, prefix):
+        counts["records_out"] += len(chunk)
+        if len(sample) < sample_size:
+            sample.extend(json_records(chunk.head(sample_size - len(sample))))
+        with profiler.stage("validate", len(chunk)):
+            partial_results.append(validate_frame(chunk, rules)[0])
+        if writer is not None:
+            with profiler.stage("store", len(chunk)):
+                writer.write(chunk)
+    
+    validation_results, quality_metrics = merge_validation_results(partial_results, rules)
+    return {
+        "records_ingested": counts["records_ingested"],
+        "records_out": counts["records_out"],
+        "sample": sample,
+        "validation_results": validation_results,
+        "quality_metrics": quality_metrics
+    }
+
+# ==================== PARTITIONED EXECUTION ====================
+
+PIPELINE_PARTITIONS = int(os.environ.get('PIPELINE_PARTITIONS', '1'))
+PARTITION_WORKERS = int(os.environ.get('PARTITION_WORKERS', os.cpu_count() or 1))
+PARTITION_MIN_ROWS = 10000  # smaller chunks are cheaper to transform in place than to ship to workers
+
+_partition_pool: Optional[ProcessPoolExecutor] = None
+_partition_pool_lock = threading.Lock()
+
+def partition_pool() -> ProcessPoolExecutor:
+    """Process pool for partitioned transforms, created on first use in whichever process needs it"""
+    global _partition_pool
+    with _partition_pool_lock:  # the pipelines of a shared scan run in threads
+        if _partition_pool is None:
+            _partition_pool = ProcessPoolExecutor(max_workers=PARTITION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _partition_pool
+
+def partition_key(row_steps: List[Dict[str, Any]]) -> Optional[List[str]]:
+    """Fields to hash-partition on so every dedup step only ever compares rows within one partition.
+    
+    An empty list means any split works (no dedup); None means the dedup steps use different
+    keys, so no single partitioning keeps them all local."""
+    keys = {tuple(t["key_fields"]) for t in row_steps if t.get("type") == "deduplicate" and t.get("key_fields")}
+    if len(keys) > 1:
+        return None
+    return list(keys.pop()) if keys else []
+
+def split_partitions(df: pd.DataFrame, key: List[str], partitions: int) -> List[np.ndarray]:
+    """Row positions of each partition, in their original order.
+    
+    Keyed splits hash exactly like deduplicate_chunk, so a partition's share of the dedup state
+    is the seen hashes with the same remainder."""
+    if not key:
+        return np.array_split(np.arange(len(df)), partitions)
+    ids = pd.util.hash_pandas_object(df[key], index=False).to_numpy() % np.uint64(partitions)
+    order = np.argsort(ids, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(ids.astype(np.int64), minlength=partitions))[:-1])
+
+def transform_partition(df: pd.DataFrame, row_steps: List[Dict[str, Any]], aggregate: Optional[Dict[str, Any]],
+                        seen: Dict[int, np.ndarray], prefix: int = 0) -> tuple[pd.DataFrame, Dict[int, np.ndarray]]:
+    """Row-level steps on one partition (after the `prefix` already applied), then the aggregate's
+    sum/count partials if the plan has one. Runs in a partition worker; returns the result and the
+    partition's updated dedup keys."""
+    for i, transform in enumerate(row_steps[prefix:], prefix):
+        if i in seen:
+            df, seen[i] = deduplicate_chunk(df, transform["key_fields"], seen[i])
+        else:
+            df = transform_frame(df, transform)
+    return (df if aggregate is None else partial_aggregate(df, aggregate)), seen
+
+def run_partitioned(chunk: pd.DataFrame, row_steps: List[Dict[str, Any]], aggregate: Optional[Dict[str, Any]],
+                    seen: Dict[int, np.ndarray], key: List[str], partitions: int,
+                    pool: ProcessPoolExecutor, prefix: int = 0) -> tuple[List[pd.DataFrame], Dict[int, np.ndarray]]:
+    """Run one chunk's row-level steps and partial aggregate across the pool.
+    
+    Row-level output is put back in the chunk's row order with its original index, so it equals
+    the single-core result exactly. With an aggregate, the per-partition partials are returned
+    for merging instead."""
+    modulus = np.uint64(partitions)
+    futures = []
+    for p, positions in enumerate(split_partitions(chunk, key, partitions)):
+        # Positional index so the surviving rows can be put back in order
+        part = chunk.iloc[positions].set_axis(positions, axis=0)
+        part_seen = {i: keys[keys % modulus == p] for i, keys in seen.items()}
+        futures.append(pool.submit(transform_partition, part, row_steps, aggregate, part_seen, prefix))
+    results = [future.result() for future in futures]
+    
+    merged_seen = {i: np.sort(np.concatenate([part_seen[i] for _, part_seen in results])) for i in seen}
+    if aggregate is not None:
+        return [partial for partial, _ in results], merged_seen
+    df = pd.concat([part for part, _ in results])
+    df = df.iloc[np.argsort(df.index.to_numpy(), kind="stable")]
+    return [df.set_axis(chunk.index[df.index.to_numpy()], axis=0)], merged_seen
+
+# ==================== INDEXES ====================
+
+# Indexes every query the API issues relies on; created idempotently at startup
+INDEX_SPECS = {
+    "data_sources": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id")
+    ],
+    "pipelines": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id")
+    ],
+    "pipeline_runs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("start_time", DESCENDING), ("id", DESCENDING)], name="start_time_id_desc"),
+        IndexModel([("pipeline_id", ASCENDING), ("status", ASCENDING)], name="pipeline_id_status"),
+        IndexModel([("status", ASCENDING), ("heartbeat_at", ASCENDING)], name="status_heartbeat_at")
+    ],
+    "dashboard_rollups": [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+    "data_versions": [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+    "scheduler_leases": [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+    "pipeline_schedules": [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+    "pipeline_watermarks": [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+    "aggregate_sketches": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("pipeline_id", ASCENDING), ("timestamp", ASCENDING)], name="pipeline_id_timestamp")
+    ],
+    "quality_rules": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("active", ASCENDING)], name="active"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id")
+    ],
+    "quality_results": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id_desc"),
+        IndexModel([("pipeline_run_id", ASCENDING)], name="pipeline_run_id")
+    ],
+    "quality_buckets": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("start", ASCENDING)], name="start"),
+        IndexModel([("rule_id", ASCENDING), ("start", ASCENDING)], name="rule_id_start")
+    ],
+    "quality_daily": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("start", ASCENDING)], name="start"),
+        IndexModel([("rule_id", ASCENDING), ("start", ASCENDING)], name="rule_id_start")
+    ],
+    "archives": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("collection", ASCENDING), ("start", ASCENDING)], name="collection_start"),
+        IndexModel([("status", ASCENDING)], name="status")
+    ],
+    "retention_policies": [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+    "processed_data": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("timestamp", DESCENDING)], name="timestamp_desc"),
+        IndexModel([("pipeline_run_id", ASCENDING)], name="pipeline_run_id")
+    ]
+}
+
+# Every filtered or sorted query shape the API issues: (collection, filter, sort)
+QUERY_SHAPES = [
+    ("data_sources", {"id": "?"}, None),
+    ("data_sources", {}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    ("pipelines", {"id": "?"}, None),
+    ("pipelines", {"status": "active"}, None),
+    ("pipelines", {"id": {"$in": ["?"]}}, None),
+    ("pipelines", {}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    ("pipeline_runs", {"id": "?"}, None),
+    ("pipeline_runs", {}, [("start_time", DESCENDING), ("id", DESCENDING)]),
+    ("pipeline_runs", {"pipeline_id": "?", "status": "running"}, None),
+    ("pipeline_runs", {"status": "running", "heartbeat_at": {"$lt": "?"}}, None),
+    ("quality_rules", {"id": "?"}, None),
+    ("quality_rules", {"active": True}, None),
+    ("quality_rules", {}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    ("quality_results", {}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("quality_results", {"pipeline_run_id": "?"}, None),
+    ("quality_buckets", {"start": {"$gte": "?"}}, [("start", ASCENDING)]),
+    ("quality_buckets", {"rule_id": "?", "start": {"$gte": "?"}}, [("start", ASCENDING)]),
+    ("quality_daily", {"start": {"$gte": "?"}}, [("start", ASCENDING)]),
+    ("quality_daily", {"rule_id": "?", "start": {"$gte": "?"}}, [("start", ASCENDING)]),
+    ("processed_data", {}, [("timestamp", DESCENDING)]),
+    ("pipeline_runs", {"start_time": {"$lt": "?"}, "archive_id": None, "status": {"$ne": "running"}}, [("start_time", ASCENDING)]),
+    ("quality_results", {"timestamp": {"$lt": "?"}, "archive_id": None}, [("timestamp", ASCENDING)]),
+    ("processed_data", {"timestamp": {"$lt": "?"}, "archive_id": None}, [("timestamp", ASCENDING)]),
+    ("archives", {"collection": "?"}, [("start", ASCENDING)]),
+    ("archives", {"status": "pending"}, None),
+    ("dashboard_rollups", {"id": "?"}, None),
+    ("data_versions", {"id": "?"}, None),
+    ("pipeline_watermarks", {"id": "?"}, None),
+    ("aggregate_sketches", {"pipeline_id": "?", "timestamp": {"$gte": "?"}}, None)
+]
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """Create the declared indexes; existing identical indexes are left alone"""
+    created = {}
+    for collection, indexes in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. a unique index over existing duplicates; keep going with the other collections
+            logger.error("Could not create indexes on %s: %s", collection, e)
+            created[collection] = []
+    return created
+
+def plan_stages(plan: Any) -> List[str]:
+    """All stage names in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+async def audit_query_shapes() -> List[Dict[str, Any]]:
+    """explain() every query shape the API issues and flag the ones that still scan the collection"""
+    report = []
+    for collection, query, sort in QUERY_SHAPES:
+        entry = {"collection": collection, "filter": query, "sort": sort}
+        try:
+            cursor = db[collection].find(query).limit(1)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = await cursor.explain()
+            stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+            entry["stages"] = stages
+            entry["collection_scan"] = "COLLSCAN" in stages
+            entry["in_memory_sort"] = "SORT" in stages
+        except Exception as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
+
+# ==================== PERSISTENCE ====================
+
+WRITE_BUFFER_MAX_OPS = int(os.environ.get('WRITE_BUFFER_MAX_OPS', '500'))
+WRITE_BUFFER_FLUSH_SECONDS = float(os.environ.get('WRITE_BUFFER_FLUSH_SECONDS', '1.0'))
+WRITE_FLUSH_PER_RUN = os.environ.get('WRITE_FLUSH_PER_RUN', 'true').lower() == 'true'
+# Collections whose readers cache results by data version. Their versions live in Mongo, as
+# other API workers, the scheduler leader and maintenance commands write to them too.
+SHARED_VERSION_COLLECTIONS = {"processed_data"}
+
+async def bump_data_version(collection: str):
+    await db.data_versions.update_one({"id": collection}, {"$inc": {"version": 1}}, upsert=True)
+
+async def data_version(collection: str) -> int:
+    """Deployment-wide version of a collection, bumped after every write to it"""
+    doc = await db.data_versions.find_one({"id": collection}, {"_id": 0, "version": 1})
+    return doc["version"] if doc else 0
+
+class WriteBuffer:
+    """Write-behind buffer of Mongo operations per collection, flushed as unordered bulk writes.
+    
+    Operations queue up until a collection holds `max_ops` of them, the periodic flusher
+    fires every `flush_interval` seconds, or a caller flushes explicitly (at the end of a run).
+    Each flush reports failures per document instead of failing the whole batch."""
+    
+    def __init__(self, max_ops: int, flush_interval: float):
+        self.max_ops = max_ops
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, List[tuple]] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.counters = {"operations": 0, "round_trips": 0, "errors": 0}
+        self.recent_errors = deque(maxlen=100)
+        self.versions: Dict[str, int] = {}
+    
+    def start(self):
+        self.flusher = asyncio.create_task(self._flush_periodically())
+    
+    async def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+            self.flusher = None
+        await self.flush()
+    
+    async def insert(self, collection: str, doc: Dict[str, Any]):
+        await self._add(collection, InsertOne(doc), doc.get("id"))
+    
+    async def update(self, collection: str, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        await self._add(collection, UpdateOne(query, update, upsert=upsert), query.get("id"))
+    
+    async def update_many(self, collection: str, query: Dict[str, Any], update: Dict[str, Any]):
+        await self._add(collection, UpdateMany(query, update), None)
+    
+    async def delete(self, collection: str, query: Dict[str, Any]):
+        await self._add(collection, DeleteMany(query), None)
+    
+    async def _add(self, collection: str, op, doc_id: Optional[str]):
+        ops = self.pending.setdefault(collection, [])
+        ops.append((op, doc_id))
+        if len(ops) >= self.max_ops:
+            await self.flush_collection(collection)
+    
+    async def flush(self) -> Dict[str, Dict[str, Any]]:
+        """Flush every collection concurrently; returns a report per collection"""
+        collections = [c for c, ops in self.pending.items() if ops]
+        reports = await asyncio.gather(*(self.flush_collection(c) for c in collections))
+        return dict(zip(collections, reports))
+    
+    async def flush_collection(self, collection: str) -> Dict[str, Any]:
+        entries = self.pending.pop(collection, [])
+        if not entries:
+            return {"written": 0, "errors": []}
+        
+        errors = []
+        try:
+            await db[collection].bulk_write([op for op, _ in entries], ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                errors.append({"index": err["index"], "id": entries[err["index"]][1],
+                               "code": err.get("code"), "message": err.get("errmsg")})
+        except Exception as e:
+            errors = [{"index": i, "id": doc_id, "code": None, "message": str(e)} for i, (_, doc_id) in enumerate(entries)]
+        
+        # Bumped only after the write is visible, so a version never describes data that isn't there yet
+        self.versions[collection] = self.versions.get(collection, 0) + 1
+        if collection in SHARED_VERSION_COLLECTIONS:
+            try:
+                await bump_data_version(collection)
+            except Exception:
+                logger.exception("Could not bump the data version of %s", collection)
+        self.counters["operations"] += len(entries)
+        self.counters["round_trips"] += 1
+        self.counters["errors"] += len(errors)
+        for err in errors:
+            self.recent_errors.append({"collection": collection, **err})
+            logger.error("Buffered write to %s failed for document %s: %s", collection, err["id"], err["message"])
+        return {"written": len(entries) - len(errors), "errors": errors}
+    
+    def version(self, collection: str) -> int:
+        """Number of flushes to `collection` by this process; see data_version for the deployment-wide one"""
+        return self.versions.get(collection, 0)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": {c: len(ops) for c, ops in self.pending.items() if ops},
+            **self.counters,
+            "versions": dict(self.versions),
+            "recent_errors": list(self.recent_errors)
+        }
+    
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Periodic write buffer flush failed")
+
+write_buffer = WriteBuffer(WRITE_BUFFER_MAX_OPS, WRITE_BUFFER_FLUSH_SECONDS)
+
+# ==================== DASHBOARD ROLLUPS ====================
+
+ROLLUP_ID = "dashboard"
+ROLLUP_RECENT_RUNS = 10
+ROLLUP_RECENT_QUALITY = 50
+RUN_SUMMARY_FIELDS = ["id", "pipeline_id", "pipeline_name", "status", "start_time", "end_time",
+                      "records_processed", "records_failed", "metrics", "error_message"]
+
+def run_summary(run_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Run document without its logs, as kept in the rollup's recent-runs list"""
+    return {k: run_doc.get(k) for k in RUN_SUMMARY_FIELDS}
+
+async def rebuild_dashboard_rollups() -> Dict[str, Any]:
+    """Recompute the dashboard rollup document from the full history (quality totals from the daily buckets)"""
+    run_counts = {"running": 0}
+    async for group in db.pipeline_runs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        run_counts[group["_id"]] = group["count"]
+    # Daily quality buckets still cover results that retention archived
+    quality_totals = await db.quality_daily.aggregate([
+        {"$group": {"_id": None, "sum": {"$sum": "$score_sum"}, "count": {"$sum": "$count"}}}
+    ]).to_list(1)
+    
+    rollup = {
+        "id": ROLLUP_ID,
+        "total_pipelines": await db.pipelines.count_documents({}),
+        "active_pipelines": await db.pipelines.count_documents({"status": "active"}),
+        "total_sources": await db.data_sources.count_documents({}),
+        "run_counts": run_counts,
+        "recent_runs": await db.pipeline_runs.find({}, {"_id": 0, "logs": 0}).sort("start_time", -1).limit(ROLLUP_RECENT_RUNS).to_list(ROLLUP_RECENT_RUNS),
+        "quality_score_sum": quality_totals[0]["sum"] if quality_totals else 0,
+        "quality_score_count": quality_totals[0]["count"] if quality_totals else 0,
+        "recent_quality": await db.quality_results.find({}, {"_id": 0}).sort("timestamp", -1).limit(ROLLUP_RECENT_QUALITY).to_list(ROLLUP_RECENT_QUALITY),
+        "rebuilt_at": datetime.now(timezone.utc)
+    }
+    await db.dashboard_rollups.replace_one({"id": ROLLUP_ID}, rollup, upsert=True)
+    rollup.pop("_id", None)
+    return rollup
+
+async def ensure_dashboard_rollups():
+    if not await db.dashboard_rollups.find_one({"id": ROLLUP_ID}, {"_id": 1}):
+        await rebuild_dashboard_rollups()
+
+async def rollup_counters(increments: Dict[str, int]):
+    """Atomically adjust top-level rollup counters such as total_pipelines"""
+    await db.dashboard_rollups.update_one({"id": ROLLUP_ID}, {"$inc": increments})
+
+async def rollup_run_queued(run_doc: Dict[str, Any]):
+    await db.dashboard_rollups.update_one({"id": ROLLUP_ID}, {
+        "$inc": {"run_counts.running": 1},
+        "$push": {"recent_runs": {"$each": [run_summary(run_doc)], "$sort": {"start_time": -1}, "$slice": ROLLUP_RECENT_RUNS}}
+    })
+
+async def rollup_run_finished(run_doc: Dict[str, Any], quality_docs: List[Dict[str, Any]]):
+    """Buffer the rollup updates for a finished run; they flush with the run's other writes"""
+    update = {"$inc": {"run_counts.running": -1, f"run_counts.{run_doc['status']}": 1}}
+    if quality_docs:
+        update["$inc"]["quality_score_sum"] = sum(d["quality_score"] for d in quality_docs)
+        update["$inc"]["quality_score_count"] = len(quality_docs)
+        recent = [{k: v for k, v in d.items() if k != "_id"} for d in quality_docs]
+        update["$push"] = {"recent_quality": {"$each": recent, "$sort": {"timestamp": -1}, "$slice": ROLLUP_RECENT_QUALITY}}
+    await write_buffer.update("dashboard_rollups", {"id": ROLLUP_ID}, update)
+    # Refresh the run's entry if it is still among the recent runs
+    await write_buffer.update("dashboard_rollups", {"id": ROLLUP_ID, "recent_runs.id": run_doc["id"]},
+                              {"$set": {"recent_runs.$": run_summary(run_doc)}})
+
+# ==================== QUALITY TIME SERIES ====================
+
+# Quality results are also kept as one document per rule per hour (with the raw points) and
+# per rule per day (summary only), so trends read a handful of buckets instead of every result
+QUALITY_BUCKET_MAX_POINTS = 1000  # newest raw points kept in an hourly bucket; its summary covers all
+QUALITY_RESOLUTIONS = {
+    # resolution: (collection, bucket width, default range)
+    "raw": ("quality_buckets", timedelta(hours=1), timedelta(hours=6)),
+    "hour": ("quality_buckets", timedelta(hours=1), timedelta(days=2)),
+    "day": ("quality_daily", timedelta(days=1), timedelta(days=30))
+}
+
+def to_utc(timestamp: datetime) -> datetime:
+    return timestamp.astimezone(timezone.utc) if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def bucket_start(timestamp: datetime, width: timedelta) -> datetime:
+    timestamp = to_utc(timestamp)
+    if width >= timedelta(days=1):
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def quality_point(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {"timestamp": doc["timestamp"], "pipeline_run_id": doc["pipeline_run_id"], "quality_score": doc["quality_score"],
+            "passed": doc["passed"], "records_checked": doc["records_checked"], "records_failed": doc["records_failed"]}
+
+def quality_buckets(docs: Iterable[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    """Summaries of quality results per (collection, bucket id): hourly with raw points, and daily"""
+    buckets = {}
+    for doc in docs:
+        for resolution in ("hour", "day"):
+            collection, width, _ = QUALITY_RESOLUTIONS[resolution]
+            start = bucket_start(doc["timestamp"], width)
+            key = (collection, f"{doc['rule_id']}:{start.strftime('%Y-%m-%dT%H' if resolution == 'hour' else '%Y-%m-%d')}")
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {"id": key[1], "rule_id": doc["rule_id"], "rule_name": doc["rule_name"], "start": start,
+                                         "count": 0, "score_sum": 0.0, "score_min": doc["quality_score"],
+                                         "score_max": doc["quality_score"], "failed_checks": 0,
+                                         "records_checked": 0, "records_failed": 0}
+                if resolution == "hour":
+                    bucket["points"] = []
+            bucket["rule_name"] = doc["rule_name"]
+            bucket["count"] += 1
+            bucket["score_sum"] += doc["quality_score"]
+            bucket["score_min"] = min(bucket["score_min"], doc["quality_score"])
+            bucket["score_max"] = max(bucket["score_max"], doc["quality_score"])
+            bucket["failed_checks"] += int(not doc["passed"])
+            bucket["records_checked"] += doc["records_checked"]
+            bucket["records_failed"] += doc["records_failed"]
+            if "points" in bucket:
+                bucket["points"].append(quality_point(doc))
+    return buckets
+
+async def record_quality_results(quality_docs: List[Dict[str, Any]]):
+    """Buffer upserts folding a run's quality results into their hourly and daily buckets"""
+    for (collection, bucket_id), bucket in quality_buckets(quality_docs).items():
+        update = {
+            "$setOnInsert": {"rule_id": bucket["rule_id"], "start": bucket["start"]},
+            "$set": {"rule_name": bucket["rule_name"]},
+            "$inc": {field: bucket[field] for field in ("count", "score_sum", "failed_checks", "records_checked", "records_failed")},
+            "$min": {"score_min": bucket["score_min"]},
+            "$max": {"score_max": bucket["score_max"]}
+        }
+        if "points" in bucket:
+            update["$push"] = {"points": {"$each": bucket["points"], "$sort": {"timestamp": 1}, "$slice": -QUALITY_BUCKET_MAX_POINTS}}
+        await write_buffer.update(collection, {"id": bucket_id}, update, upsert=True)
+
+async def rebuild_quality_buckets() -> Dict[str, int]:
+    """Recompute the hourly and daily quality buckets from the individual quality results.
+    
+    Buckets before the latest retention cutoff are kept, as their results have been archived."""
+    archived = await db.archives.find({"collection": "quality_results"}, {"_id": 0, "cutoff": 1}).sort("cutoff", DESCENDING).limit(1).to_list(1)
+    boundary = archived[0]["cutoff"] if archived else None
+    query = {"timestamp": {"$gte": boundary}} if boundary else {}
+    buckets = await asyncio.to_thread(quality_buckets, await db.quality_results.find(query, {"_id": 0}).to_list(None))
+    rebuilt = {}
+    for resolution in ("hour", "day"):
+        collection = QUALITY_RESOLUTIONS[resolution][0]
+        docs = [bucket for (c, _), bucket in buckets.items() if c == collection]
+        for bucket in docs:
+            if "points" in bucket:
+                bucket["points"] = sorted(bucket["points"], key=lambda p: p["timestamp"])[-QUALITY_BUCKET_MAX_POINTS:]
+        await db[collection].delete_many({"start": {"$gte": boundary}} if boundary else {})
+        if docs:
+            await db[collection].insert_many(docs)
+        rebuilt[collection] = len(docs)
+    return rebuilt
+
+async def ensure_quality_buckets():
+    if not await db.quality_buckets.find_one({}, {"_id": 1}) and await db.quality_results.find_one({}, {"_id": 1}):
+        await rebuild_quality_buckets()
+
+def trend_series(buckets: List[Dict[str, Any]], resolution: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Buckets sorted by start, as one series of points per rule"""
+    series = {}
+    for bucket in buckets:
+        entry = series.setdefault(bucket["rule_id"], {"rule_id": bucket["rule_id"], "rule_name": bucket["rule_name"], "points": []})
+        entry["rule_name"] = bucket["rule_name"]
+        if resolution == "raw":
+            entry["points"].extend(p for p in bucket.get("points", []) if start <= p["timestamp"] < end)
+        else:
+            entry["points"].append({
+                "start": bucket["start"], "count": bucket["count"],
+                "min": bucket["score_min"], "avg": round(bucket["score_sum"] / bucket["count"], 4) if bucket["count"] else None,
+                "max": bucket["score_max"], "failed_checks": bucket["failed_checks"],
+                "records_checked": bucket["records_checked"], "records_failed": bucket["records_failed"]
+            })
+    return list(series.values())
+
+# ==================== DATETIME MIGRATION ====================
+
+# Fields older versions stored as ISO strings; "logs.timestamp" is inside an array of log entries
+DATETIME_FIELDS = {
+    "data_sources": ["created_at"],
+    "pipelines": ["created_at", "updated_at"],
+    "pipeline_runs": ["start_time", "end_time", "heartbeat_at", "logs.timestamp"],
+    "quality_rules": ["created_at"],
+    "quality_results": ["timestamp"],
+    "processed_data": ["timestamp"]
+}
+MIGRATION_BATCH_SIZE = 1000
+
+def to_datetime(value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def migrate_document(doc: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """$set payload converting a document's string datetimes"""
+    update = {}
+    for field in fields:
+        if "." in field:
+            array, key = field.split(".", 1)
+            entries = doc.get(array) or []
+            if any(isinstance(e.get(key), str) for e in entries):
+                update[array] = [{**e, key: to_datetime(e.get(key))} if key in e else e for e in entries]
+        elif isinstance(doc.get(field), str):
+            update[field] = to_datetime(doc[field])
+    return update
+
+async def migrate_datetimes() -> Dict[str, int]:
+    """Convert ISO-string datetime fields to native BSON dates. Idempotent: only string-typed fields match."""
+    migrated = {}
+    for collection, fields in DATETIME_FIELDS.items():
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        projection = {field.split(".", 1)[0]: 1 for field in fields}
+        ops = []
+        migrated[collection] = 0
+        async for doc in db[collection].find(query, projection):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": migrate_document(doc, fields)}))
+            if len(ops) >= MIGRATION_BATCH_SIZE:
+                await db[collection].bulk_write(ops, ordered=False)
+                migrated[collection] += len(ops)
+                ops = []
+        if ops:
+            await db[collection].bulk_write(ops, ordered=False)
+            migrated[collection] += len(ops)
+    
+    # The rollup and quality buckets copy run and quality documents, so they are rebuilt from the converted ones
+    if migrated["quality_results"]:
+        await rebuild_quality_buckets()
+    if migrated["pipeline_runs"] or migrated["quality_results"]:
+        await rebuild_dashboard_rollups()
+    if migrated["processed_data"]:
+        await bump_data_version("processed_data")
+    return migrated
+
+# ==================== COLUMNAR STORE ====================
+
+PROCESSED_DATA_DIR = Path(os.environ.get('PROCESSED_DATA_DIR', str(ROOT_DIR / 'data' / 'processed')))
+
+class RunOutputWriter:
+    """Streams a run's full transformed output into an uncompressed Arrow IPC file.
+    
+    Files are partitioned as pipeline_id=<id>/date=<YYYY-MM-DD>/<run_id>.arrow under
+    PROCESSED_DATA_DIR and only appear under their final name once complete."""
+    
+    def __init__(self, pipeline_id: str, run_id: str):
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        self.relative_path = Path(f"pipeline_id={pipeline_id}") / f"date={day}" / f"{run_id}.arrow"
+        self.path = PROCESSED_DATA_DIR / self.relative_path
+        self.tmp_path = self.path.with_suffix(".arrow.tmp")
+        self.writer = None
+        self.schema = None
+        self.rows = 0
+    
+    def write(self, df: pd.DataFrame):
+        if self.writer is None and not len(df):
+            return  # an empty chunk's object columns carry no type to build the schema from
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.schema = table.schema
+            self.writer = pa.ipc.new_file(str(self.tmp_path), self.schema)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+    
+    def close(self) -> Optional[Dict[str, Any]]:
+        """Finish the file and return the metadata pointer stored in Mongo (None if nothing was written)"""
+        if self.writer is None:
+            return None
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+        return {
+            "format": "arrow_ipc",
+            "path": self.relative_path.as_posix(),
+            "rows": self.rows,
+            "columns": self.schema.names,
+            "bytes": self.path.stat().st_size
+        }
+    
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.tmp_path.unlink(missing_ok=True)
+
+def has_stored_output(doc: Dict[str, Any]) -> bool:
+    storage = doc.get('storage')
+    return bool(storage) and (PROCESSED_DATA_DIR / storage["path"]).exists()
+
+def read_run_output(storage: Dict[str, Any], columns: Optional[List[str]] = None, limit: Optional[int] = None) -> pa.Table:
+    """Memory-map a stored run output and project it; no row data is copied until converted"""
+    source = pa.memory_map(str(PROCESSED_DATA_DIR / storage["path"]))
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+    if limit is not None:
+        table = table.slice(0, limit)
+    return table
+
+def load_processed_frame(processed_docs: List[Dict[str, Any]], columns: Optional[List[str]] = None,
+                         limit: Optional[int] = None) -> pd.DataFrame:
+    """Combine the output of several runs, from the columnar store where available and the Mongo sample otherwise"""
+    frames = []
+    rows = 0
+    for doc in processed_docs:
+        if limit is not None and rows >= limit:
+            break
+        if has_stored_output(doc):
+            frame = read_run_output(doc['storage'], columns, None if limit is None else limit - rows).to_pandas()
+        else:
+            frame = apply_schema(pd.DataFrame(doc.get('data', [])), doc.get('metadata', {}).get('source_type'))
+            if columns is not None:
+                frame = frame[[c for c in columns if c in frame.columns]]
+            if limit is not None:
+                frame = frame.head(limit - rows)
+        if len(frame):
+            frames.append(frame)
+            rows += len(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+# ==================== INCREMENTAL RUNS ====================
+
+def watermark_id(pipeline: Dict[str, Any]) -> str:
+    return f"{pipeline['id']}:{pipeline.get('source_id')}"
+
+def plan_fingerprint(transformations: List[Dict[str, Any]], source_type: Optional[str] = None,
+                     stats: Optional[Dict[str, Any]] = None) -> str:
+    """Identify the planned transformation chain and input dtypes; stored state is only reused by the same plan"""
+    plan = plan_transformations(transformations, stats)[0]
+    fingerprint = {"plan": plan, "schema": schema_fingerprint(source_type)}
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True, default=str).encode()).hexdigest()
+
+def write_arrow_table(path: Path, table: pa.Table):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".arrow.tmp")
+    with pa.ipc.new_file(str(tmp_path), table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def save_incremental_state(pipeline_id: str, run_id: str, state: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """Write a run's dedup keys and aggregate partials next to its output; returns their relative paths"""
+    directory = Path(f"pipeline_id={pipeline_id}") / "state"
+    pointer = {"seen": None, "partials": None}
+    
+    seen = {step: keys for step, keys in state.get("seen", {}).items() if len(keys)}
+    if seen:
+        pointer["seen"] = (directory / f"{run_id}-seen.arrow").as_posix()
+        write_arrow_table(PROCESSED_DATA_DIR / pointer["seen"], pa.table({
+            "step": pa.array(np.repeat(list(seen), [len(keys) for keys in seen.values()]), pa.int32()),
+            "key": pa.array(np.concatenate(list(seen.values())), pa.uint64())
+        }))
+    
+    partials = state.get("partials")
+    if partials:
+        merged = combine_partials(partials)
+        pointer["partials"] = (directory / f"{run_id}-partials.arrow").as_posix()
+        write_arrow_table(PROCESSED_DATA_DIR / pointer["partials"], pa.Table.from_pandas(merged, preserve_index=True))
+    return pointer
+
+def load_incremental_state(pointer: Optional[Dict[str, Optional[str]]]) -> Dict[str, Any]:
+    """Read back the state written by save_incremental_state, in the shape stream_transformations takes"""
+    state = {"seen": {}, "partials": []}
+    if not pointer:
+        return state
+    if pointer.get("seen"):
+        table = pa.ipc.open_file(pa.memory_map(str(PROCESSED_DATA_DIR / pointer["seen"]))).read_all()
+        steps, keys = table.column("step").to_numpy(), table.column("key").to_numpy()
+        for step in np.unique(steps):
+            state["seen"][int(step)] = np.sort(keys[steps == step])
+    if pointer.get("partials"):
+        table = pa.ipc.open_file(pa.memory_map(str(PROCESSED_DATA_DIR / pointer["partials"]))).read_all()
+        state["partials"].append(table.to_pandas())
+    return state
+
+def remove_incremental_state(pointer: Optional[Dict[str, Optional[str]]]):
+    for path in (pointer or {}).values():
+        if path:
+            (PROCESSED_DATA_DIR / path).unlink(missing_ok=True)
+
+async def load_watermark(pipeline: Dict[str, Any]) -> Dict[str, Any]:
+    """The last committed watermark, plan fingerprint and state pointer for a pipeline's source"""
+    doc = await db.pipeline_watermarks.find_one({"id": watermark_id(pipeline)}, {"_id": 0})
+    return doc or {}
+
+async def commit_watermark(pipeline: Dict[str, Any], run_id: str, base: Dict[str, Any], incremental: Dict[str, Any]) -> bool:
+    """Advance the watermark to a successful run's, unless another run of the pipeline committed first.
+    
+    The replace is conditional on the watermark still pointing at the run the state was loaded
+    from; a run that loses that race keeps its output but discards its state."""
+    doc = {
+        "id": watermark_id(pipeline),
+        "pipeline_id": pipeline["id"],
+        "source_id": pipeline.get("source_id"),
+        "watermark": incremental["watermark"],
+        "plan": incremental["plan"],
+        "state": incremental["state"],
+        "files": incremental.get("files", []),
+        "run_id": run_id,
+        "updated_at": datetime.now(timezone.utc)
+    }
+    try:
+        result = await db.pipeline_watermarks.replace_one({"id": doc["id"], "run_id": base.get("run_id")}, doc, upsert=True)
+        committed = result.matched_count > 0 or result.upserted_id is not None
+    except DuplicateKeyError:
+        committed = False
+    if committed:
+        remove_incremental_state(base.get("state"))
+    else:
+        remove_incremental_state(incremental["state"])
+    return committed
+
+# ==================== ANALYTICS ====================
+
+ANALYTICS_WINDOW_RUNS = 10
+ANALYTICS_MAX_LIMIT = 1000
+MONGO_FILTER_OPERATORS = {">": "$gt", "<": "$lt", "==": "$eq", "!=": "$ne"}
+PUSHDOWN_AGG_FUNCS = {"sum", "avg", "count", "min", "max"}
+PANDAS_AGG_FUNCS = {"sum": "sum", "avg": "mean", "count": "count", "min": "min", "max": "max",
+                    "median": "median", "std": "std", "nunique": "nunique"}
+ROW_ORDER_FIELDS = ["_ts", "_row"]  # run timestamp and position within the run, for a stable default order
+ANALYTICS_CACHE_MAX_BYTES = int(os.environ.get('ANALYTICS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+ANALYTICS_CACHE_TTL_SECONDS = float(os.environ.get('ANALYTICS_CACHE_TTL_SECONDS', '300'))
+
+class ResultCache:
+    """LRU cache of query results keyed by data version and normalized query.
+    
+    Bounded by the approximate (JSON-encoded) size of the cached results and by entry age.
+    Entries from an older data version are dropped as soon as a newer version is seen."""
+    
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()  # key -> (expires_at, size, result)
+        self.version = 0
+        self.bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+    
+    def get(self, version: int, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        self._observe(version)
+        key = self._key(version, query)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._drop(key)
+            self.counters["expirations"] += 1
+            entry = None
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return entry[2]
+    
+    def put(self, version: int, query: Dict[str, Any], result: Dict[str, Any]):
+        self._observe(version)
+        if version != self.version:
+            return  # computed against data that has since changed
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        key = self._key(version, query)
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, size, result)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+    
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl, "data_version": self.version, **self.counters}
+    
+    def _observe(self, version: int):
+        if version > self.version:
+            self.counters["invalidations"] += len(self.entries)
+            self.clear()
+            self.version = version
+    
+    def _drop(self, key):
+        self.bytes -= self.entries.pop(key)[1]
+    
+    @staticmethod
+    def _key(version: int, query: Dict[str, Any]) -> str:
+        return f"{version}:{json.dumps(query, sort_keys=True, default=str)}"
+
+analytics_cache = ResultCache(ANALYTICS_CACHE_MAX_BYTES, ANALYTICS_CACHE_TTL_SECONDS)
+
+def parse_analytics_query(query_request: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize an analytics request into type, grouping, filters, ordering and limit"""
+    query_type = query_request.get('type', 'select_all')
+    group_field = query_request.get('group_field')
+    agg_field = query_request.get('agg_field')
+    agg_func = query_request.get('agg_func', 'sum')
+    if query_type != 'group_by' or not (group_field and agg_field):
+        query_type = 'select_all'
+    elif agg_func not in PANDAS_AGG_FUNCS and agg_func not in SKETCH_FUNCTIONS:
+        raise ValueError(f"Unsupported agg_func '{agg_func}'")
+    percentile = None
+    if agg_func == "approx_percentile":
+        percentile = float(query_request.get('percentile', 0.95))
+        if not 0 <= percentile <= 1:
+            raise ValueError("percentile must be between 0 and 1")
+    
+    order = query_request.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    limit = int(query_request.get('limit', 100))
+    if not 1 <= limit <= ANALYTICS_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {ANALYTICS_MAX_LIMIT}")
+    
+    return {
+        "type": query_type,
+        "group_field": group_field,
+        "agg_field": agg_field,
+        "agg_func": agg_func,
+        "percentile": percentile,
+        "filters": query_request.get('filters') or [],
+        "order_by": query_request.get('order_by'),
+        "ascending": order == 'asc',
+        "limit": limit
+    }
+
+def query_columns(query: Dict[str, Any]) -> Optional[List[str]]:
+    """Columns a query reads (None means all of them)"""
+    if query["type"] != "group_by":
+        return None
+    fields = [query["group_field"], query["agg_field"]] + [c.get("field") for c in query["filters"]]
+    return list(dict.fromkeys(fields))
+
+def analytics_match(filters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filter conditions as $match clauses; operators filter_mask ignores are ignored here too"""
+    return [{c["field"]: {MONGO_FILTER_OPERATORS[c.get("operator")]: c.get("value")}}
+            for c in filters if c.get("operator") in MONGO_FILTER_OPERATORS]
+
+def analytics_pipeline(query: Dict[str, Any], run_ids: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """Aggregation pipeline evaluating a query over the samples of Mongo-resident runs, or None if it can't be pushed down.
+    
+    select_all is answered completely ($match, $sort, $limit). group_by returns per-group partials
+    (sum, numeric count, non-null count, min, max) so they merge with the columnar store's."""
+    if query["type"] == "group_by" and query["agg_func"] not in PUSHDOWN_AGG_FUNCS:
+        return None
+    
+    pipeline = [
+        {"$match": {"id": {"$in": run_ids}}},
+        {"$project": {"_id": 0, "data": 1, "timestamp": 1}},
+        {"$unwind": {"path": "$data", "includeArrayIndex": "_row"}},
+        {"$addFields": {"data._ts": "$timestamp", "data._row": "$_row"}},
+        {"$replaceRoot": {"newRoot": "$data"}}
+    ]
+    match = analytics_match(query["filters"])
+    
+    if query["type"] == "select_all":
+        if match:
+            pipeline.append({"$match": {"$and": match}})
+        order = {query["order_by"]: 1 if query["ascending"] else -1} if query["order_by"] else {}
+        pipeline.append({"$sort": {**order, "_ts": -1, "_row": 1}})
+        pipeline.append({"$limit": query["limit"]})
+        return pipeline
+    
+    # Like pandas: rows without a group key are dropped, NaN and non-numeric values don't aggregate
+    value = f"${query['agg_field']}"
+    present = {"$and": [{"$ne": [{"$ifNull": [value, None]}, None]}, {"$ne": [value, float("nan")]}]}
+    numeric = {"$and": [{"$isNumber": value}, {"$ne": [value, float("nan")]}]}
+    pipeline.append({"$match": {"$and": match + [{query["group_field"]: {"$ne": None}}]}})
+    pipeline.append({"$group": {
+        "_id": f"${query['group_field']}",
+        "sum": {"$sum": {"$cond": [numeric, value, 0]}},
+        "n": {"$sum": {"$cond": [numeric, 1, 0]}},
+        "count": {"$sum": {"$cond": [present, 1, 0]}},
+        "min": {"$min": {"$cond": [numeric, value, None]}},
+        "max": {"$max": {"$cond": [numeric, value, None]}}
+    }})
+    return pipeline
+
+def partial_group(df: pd.DataFrame, group_field: str, agg_field: str) -> pd.DataFrame:
+    """The same per-group partials analytics_pipeline's $group produces, computed in pandas"""
+    numeric = pd.to_numeric(df[agg_field], errors="coerce").astype(np.float64)
+    grouped = numeric.groupby(df[group_field], observed=True)
+    return pd.DataFrame({
+        "sum": grouped.sum(),
+        "n": grouped.count(),
+        "count": df[agg_field].groupby(df[group_field], observed=True).count(),
+        "min": grouped.min(),
+        "max": grouped.max()
+    })
+
+def filter_rows(df: pd.DataFrame, filters: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Apply analytics filters, treating fields missing from `df` as null like Mongo does"""
+    missing = {c.get("field"): np.nan for c in filters if c.get("field") not in df.columns}
+    mask = filter_mask(df.assign(**missing) if missing else df, filters)
+    return df if mask is None else df[mask]
+
+def sort_rows(df: pd.DataFrame, query: Dict[str, Any]) -> pd.DataFrame:
+    """Order rows the way Mongo's $sort does (nulls lowest)"""
+    if not query["order_by"] or query["order_by"] not in df.columns:
+        return df
+    return df.sort_values(query["order_by"], ascending=query["ascending"], kind="stable",
+                          na_position="first" if query["ascending"] else "last")
+
+def finish_analytics_query(query: Dict[str, Any], runs: List[Dict[str, Any]], mongo_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Evaluate the query over runs in the columnar store and merge with the rows Mongo returned"""
+    stored = [run for run in runs if has_stored_output(run)]
+    columns = query_columns(query)
+    
+    if query["type"] == "select_all":
+        frames = [pd.DataFrame(mongo_rows)]
+        for run in stored:
+            if not query["filters"] and not query["order_by"]:
+                frame = read_run_output(run['storage'], limit=query["limit"]).to_pandas()
+            else:
+                frame = read_run_output(run['storage']).to_pandas()
+            frame["_ts"], frame["_row"] = run['timestamp'], np.arange(len(frame))
+            frame = filter_rows(frame, query["filters"])
+            frames.append(sort_rows(frame, query).head(query["limit"]))
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return analytics_response(pd.DataFrame())
+        df = pd.concat(frames, ignore_index=True, sort=False).sort_values(ROW_ORDER_FIELDS, ascending=[False, True], kind="stable")
+        result_df = sort_rows(df, query).head(query["limit"]).drop(columns=ROW_ORDER_FIELDS)
+        return analytics_response(result_df)
+    
+    group_field, agg_field = query["group_field"], query["agg_field"]
+    partials = []
+    if mongo_rows:
+        partials.append(pd.DataFrame(mongo_rows).set_index("_id"))
+    for run in stored:
+        # Columns a run doesn't have are null, as they are for Mongo
+        frame = filter_rows(read_run_output(run['storage'], columns).to_pandas().reindex(columns=columns), query["filters"])
+        partials.append(partial_group(frame, group_field, agg_field))
+    if not partials:
+        return analytics_response(pd.DataFrame())
+    
+    merged = pd.concat(partials).groupby(level=0, observed=True).agg({"sum": "sum", "n": "sum", "count": "sum", "min": "min", "max": "max"})
+    agg_func = query["agg_func"]
+    if agg_func == "avg":
+        values = merged["sum"] / merged["n"].where(merged["n"] > 0)
+    else:
+        values = merged[agg_func]
+    result_df = pd.DataFrame({group_field: merged.index, agg_field: values.to_numpy()})
+    return analytics_response(sort_rows(result_df, query).head(query["limit"]))
+
+def pandas_analytics_query(query: Dict[str, Any], runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run the whole query in pandas over stored outputs and Mongo samples"""
+    df = load_processed_frame(runs, columns=query_columns(query))
+    if df.empty:
+        return analytics_response(df)
+    
+    df = filter_rows(df, query["filters"])
+    if query["type"] == "group_by":
+        agg_func = query["agg_func"]
+        if agg_func in SKETCH_FUNCTIONS:
+            agg = lambda values: group_sketches(values, agg_func, query["percentile"])
+        else:
+            agg = PANDAS_AGG_FUNCS[agg_func]
+        df = df.groupby(query["group_field"], observed=True)[query["agg_field"]].agg(agg).reset_index()
+    return analytics_response(sort_rows(df, query).head(query["limit"]))
+
+def analytics_response(result_df: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "columns": result_df.columns.tolist(),
+        "rows": json_records(result_df),
+        "row_count": len(result_df)
+    }
+
+# ==================== RUN EVENTS ====================
+
+RUN_EVENT_BUFFER = int(os.environ.get('RUN_EVENT_BUFFER', '1000'))
+RUN_LOG_PERSIST_BATCH = int(os.environ.get('RUN_LOG_PERSIST_BATCH', '50'))
+RUN_LOG_PERSIST_SECONDS = float(os.environ.get('RUN_LOG_PERSIST_SECONDS', '2'))
+RUN_EVENT_HEARTBEAT_SECONDS = 15
+RUN_EVENT_POLL_SECONDS = 1  # for runs executing in another server process
+
+class RunEventStream:
+    """Live log events and progress counters of one run.
+    
+    Log entries are numbered in the order they are logged, which is also their index in the
+    run document's persisted `logs` array. The newest `RUN_EVENT_BUFFER` entries stay in a ring
+    buffer; entries not yet persisted wait in `pending` until the next batched append."""
+    
+    def __init__(self, run_id: str, persisted: int):
+        self.run_id = run_id
+        self.ring = deque(maxlen=RUN_EVENT_BUFFER)
+        self.next_offset = persisted
+        self.persisted = persisted
+        self.pending: List[Dict[str, Any]] = []
+        self.progress: Optional[Dict[str, Any]] = None
+        self.progress_version = 0
+        self.worker_logs = 0
+        self.status: Optional[str] = None
+        self.changed = asyncio.Event()
+        self.lock = asyncio.Lock()
+    
+    def append(self, entry: Dict[str, Any]):
+        self.ring.append(entry)
+        self.pending.append(entry)
+        self.next_offset += 1
+        self._notify()
+    
+    def set_progress(self, counters: Dict[str, Any]):
+        self.progress = counters
+        self.progress_version += 1
+        self._notify()
+    
+    def close(self, status: str):
+        self.status = status
+        self._notify()
+    
+    def entries(self, offset: int) -> List[Dict[str, Any]]:
+        """Buffered entries from `offset` on, or as far back as still held in memory"""
+        ring_start = self.next_offset - len(self.ring)
+        if offset >= ring_start:
+            return list(self.ring)[offset - ring_start:]
+        if offset >= self.persisted:
+            return self.pending[offset - self.persisted:]
+        return []
+    
+    def _notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+    
+    async def persist(self):
+        """Append the pending entries to the run document in one write; batches never overlap"""
+        async with self.lock:
+            batch = self.pending[:]
+            if not batch:
+                return
+            await db.pipeline_runs.update_one({"id": self.run_id}, {"$push": {"logs": {"$each": batch}}})
+            del self.pending[:len(batch)]
+            self.persisted += len(batch)
+
+class RunEventHub:
+    """Routes run log events from the dispatcher and the worker processes to live subscribers.
+    
+    Workers send their entries through a manager queue as they log them; the complete worker
+    log also comes back with the outcome, so anything the queue dropped or delayed is caught up
+    before the run finishes and duplicates are discarded by position."""
+    
+    def __init__(self):
+        self.streams: Dict[str, RunEventStream] = {}
+        self.persister: Optional[asyncio.Task] = None
+    
+    def start(self):
+        self.persister = asyncio.create_task(self._persist_periodically())
+    
+    async def stop(self):
+        if self.persister:
+            self.persister.cancel()
+            await asyncio.gather(self.persister, return_exceptions=True)
+            self.persister = None
+        await asyncio.gather(*(stream.persist() for stream in self.streams.values()), return_exceptions=True)
+    
+    def open(self, run: PipelineRun) -> RunEventStream:
+        """Start streaming a run whose current logs are already stored with it"""
+        stream = RunEventStream(run.id, len(run.logs))
+        stream.ring.extend(run.logs)
+        self.streams[run.id] = stream
+        return stream
+    
+    async def log(self, run_id: str, level: str, message: str):
+        stream = self.streams.get(run_id)
+        if stream is None:
+            return
+        log_event(stream, level, message)
+        if len(stream.pending) >= RUN_LOG_PERSIST_BATCH:
+            await stream.persist()
+    
+    def worker_event(self, run_id: str, event: Dict[str, Any]):
+        stream = self.streams.get(run_id)
+        if stream is None:
+            return
+        if event["type"] == "progress":
+            stream.set_progress(event["data"])
+        elif event["index"] == stream.worker_logs:
+            stream.worker_logs += 1
+            stream.append(event["entry"])
+    
+    async def catch_up(self, run_id: str, worker_logs: List[Dict[str, Any]]):
+        """Publish whatever part of a finished worker's log has not arrived through the queue"""
+        stream = self.streams.get(run_id)
+        if stream is None:
+            return
+        for entry in worker_logs[stream.worker_logs:]:
+            stream.worker_logs += 1
+            stream.append(entry)
+    
+    async def close(self, run_id: str, status: str):
+        """Persist the remaining entries and end the run's live subscriptions"""
+        stream = self.streams.get(run_id)
+        if stream is None:
+            return
+        await stream.persist()
+        del self.streams[run_id]
+        stream.close(status)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"live_runs": len(self.streams),
+                "pending_entries": sum(len(stream.pending) for stream in self.streams.values())}
+    
+    async def _persist_periodically(self):
+        while True:
+            await asyncio.sleep(RUN_LOG_PERSIST_SECONDS)
+            for stream in list(self.streams.values()):
+                try:
+                    await stream.persist()
+                except Exception:
+                    logger.exception("Failed to persist logs of pipeline run %s", stream.run_id)
+
+run_events = RunEventHub()
+
+async def iter_run_events(run_id: str, offset: int = 0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Log entries of a run from `offset` on, then its live progress, until the run ends.
+    
+    Yields dicts tagged with `type` ("log", "progress" or "end"), and None as a heartbeat
+    when nothing happened for RUN_EVENT_HEARTBEAT_SECONDS. Entries older than the ring buffer,
+    and runs executing in another server process, are read from the run document."""
+    stream = None
+    seen_progress = 0
+    while True:
+        stream = stream or run_events.streams.get(run_id)
+        if stream is None:
+            doc = await db.pipeline_runs.find_one({"id": run_id}, {"_id": 0, "status": 1, "logs": {"$slice": [offset, 10 ** 6]}})
+            if doc is None:
+                return
+            for entry in doc.get("logs", []):
+                yield {"type": "log", "offset": offset, **entry}
+                offset += 1
+            if doc["status"] != "running":
+                yield {"type": "end", "offset": offset, "status": doc["status"]}
+                return
+            await asyncio.sleep(RUN_EVENT_POLL_SECONDS)
+            continue
+        
+        changed = stream.changed
+        ring_start = stream.next_offset - len(stream.ring)
+        if offset < ring_start and offset < stream.persisted:
+            # Evicted from the ring buffer; fetch the gap from the persisted log
+            doc = await db.pipeline_runs.find_one({"id": run_id}, {"_id": 0, "logs": {"$slice": [offset, stream.persisted - offset]}})
+            entries = (doc or {}).get("logs", [])
+            for entry in entries:
+                yield {"type": "log", "offset": offset, **entry}
+                offset += 1
+            if not entries:
+                offset = ring_start
+            continue
+        for entry in stream.entries(offset):
+            yield {"type": "log", "offset": offset, **entry}
+            offset += 1
+        if stream.progress_version != seen_progress:
+            seen_progress = stream.progress_version
+            yield {"type": "progress", **stream.progress}
+        if stream.status is not None and offset >= stream.next_offset:
+            yield {"type": "end", "offset": offset, "status": stream.status}
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), RUN_EVENT_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield None
+
+# ==================== JOB QUEUE ====================
+
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', os.cpu_count() or 1))
+PIPELINE_QUEUE_DEPTH = int(os.environ.get('PIPELINE_QUEUE_DEPTH', '100'))
+RUN_HEARTBEAT_SECONDS = float(os.environ.get('RUN_HEARTBEAT_SECONDS', '30'))
+# A running run whose process hasn't reported for this long was orphaned by a crash or restart
+RUN_STALE_SECONDS = float(os.environ.get('RUN_STALE_SECONDS', str(RUN_HEARTBEAT_SECONDS * 4)))
+
+class PipelineCancelled(Exception):
+    """Raised inside a worker when its run has been cancelled"""
+
+def log_event(logs: List[Dict[str, Any]], level: str, message: str):
+    logs.append({"timestamp": datetime.now(timezone.utc), "level": level, "message": message})
+
+class RunLogPublisher(list):
+    """A worker's run log that also forwards each entry, and progress counters, to the server's event hub"""
+    
+    def __init__(self, run_id: str, events=None):
+        super().__init__()
+        self.run_id = run_id
+        self.events = events
+    
+    def append(self, entry: Dict[str, Any]):
+        super().append(entry)
+        self._send({"type": "log", "index": len(self) - 1, "entry": entry})
+    
+    def progress(self, counters: Dict[str, Any]):
+        self._send({"type": "progress", "data": counters})
+    
+    def _send(self, event: Dict[str, Any]):
+        if self.events is None:
+            return
+        try:
+            self.events.put_nowait((self.run_id, event))
+        except Exception:
+            pass  # live events are best effort; the outcome carries the complete log
+
+def process_pipeline_run(pipeline: Dict[str, Any], quality_rules: List[Dict[str, Any]], options: Dict[str, Any],
+                         cancel_event=None, events=None) -> Dict[str, Any]:
+    """Ingest, transform and validate one pipeline run. Runs in a worker process, so it must not touch Mongo."""
+    logs = RunLogPublisher(options["run_id"], events)
+    profiler = StageProfiler()
+    if PROFILE_MEMORY == "tracemalloc" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled("Pipeline run cancelled")
+    
+    transformations = pipeline.get('transformations', [])
+    writer = RunOutputWriter(pipeline['id'], options["run_id"])
+    resume = resume_run(transformations, options, logs, profiler)
+    
+    try:
+        outcome = run_stages(options, transformations, quality_rules, writer, logs, check_cancelled, resume["watermark"],
+                             resume["state"], progress=logs.progress, profiler=profiler, ingested_files=resume["ingested"])
+    except BaseException:
+        writer.abort()
+        raise
+    return complete_run(pipeline, options, outcome, writer, resume, logs, profiler)
+
+def resume_run(transformations: List[Dict[str, Any]], options: Dict[str, Any], logs: List[Dict[str, Any]],
+               profiler: StageProfiler) -> Dict[str, Any]:
+    """Where a run starts: the plan fingerprint, plus the watermark, state and ingested files to resume from.
+    
+    Incremental runs resume from the committed watermark and state unless a backfill was asked for
+    or the transformations changed since that state was written."""
+    base = options.get("incremental") or {}
+    plan = plan_fingerprint(transformations, options.get("source_type"), source_stats(options))
+    resume = {"plan": plan, "watermark": None, "state": {}, "ingested": []}
+    resumable = base.get("watermark") is not None or bool(base.get("files"))
+    if options.get("full_refresh"):
+        log_event(logs, "INFO", "Full refresh: reprocessing all source records")
+    elif resumable and base.get("plan") != plan:
+        log_event(logs, "INFO", "Transformations changed since the last watermark: reprocessing all source records")
+    elif resumable:
+        with profiler.stage("load_state"):
+            resume.update(watermark=base.get("watermark"), state=load_incremental_state(base.get("state")),
+                          ingested=base.get("files") or [])
+        if resume["ingested"]:
+            log_event(logs, "INFO", f"Incremental run: skipping {len(resume['ingested'])} already ingested files")
+        else:
+            log_event(logs, "INFO", f"Incremental run: processing records after {resume['watermark'].isoformat()}")
+    return resume
+
+def complete_run(pipeline: Dict[str, Any], options: Dict[str, Any], outcome: Dict[str, Any], writer: RunOutputWriter,
+                 resume: Dict[str, Any], logs: List[Dict[str, Any]], profiler: StageProfiler) -> Dict[str, Any]:
+    """Close the run's output and save its incremental state; returns the outcome the dispatcher persists"""
+    try:
+        with profiler.stage("store") as counters:
+            outcome["storage"] = writer.close()
+            counters["calls"] = 0
+    except BaseException:
+        writer.abort()
+        raise
+    if outcome["storage"]:
+        log_event(logs, "INFO", f"Stored {outcome['storage']['rows']} records in the columnar store")
+    state = resume["state"]
+    aggregate = next((t for t in plan_transformations(pipeline.get('transformations', []), source_stats(options))[0]
+                      if is_aggregate_step(t)), None)
+    if aggregate is not None and aggregate["function"] in SKETCH_FUNCTIONS and state.get("run_partials"):
+        # This run's sketches alone, so dashboards can merge any range of runs
+        outcome["sketches"] = {"field": aggregate["field"], "function": aggregate["function"], "group_by": aggregate["group_by"],
+                               "percentile": aggregate.get("percentile"),
+                               "groups": sketch_groups(state["run_partials"], aggregate["group_by"])}
+    with profiler.stage("save_state"):
+        outcome["incremental"] = {
+            "watermark": outcome.pop("watermark"),
+            "plan": resume["plan"],
+            "state": save_incremental_state(pipeline['id'], options["run_id"], state),
+            "files": resume["ingested"] + outcome.pop("files")
+        }
+    outcome["stages"] = profiler.report() + outcome.pop("shared_stages", [])
+    outcome["source_type"] = options.get("source_type")
+    
+    log_event(logs, "INFO", f"Quality score: {outcome['quality_metrics']['overall_quality_score']}%")
+    return {"logs": logs, **outcome}
+
+def run_stages(options: Dict[str, Any], transformations: List[Dict[str, Any]], quality_rules: List[Dict[str, Any]],
+               writer: RunOutputWriter, logs: List[Dict[str, Any]], check_cancelled: Callable[[], None],
+               watermark: Optional[datetime] = None, state: Optional[Dict[str, Any]] = None,
+               progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+               profiler: Optional[StageProfiler] = None, ingested_files: Iterable[str] = ()) -> Dict[str, Any]:
+    """Ingestion, transformation and validation stages of a run, writing the full output to `writer`.
+    
+    Records come from the source's connector. Only records newer than `watermark` (simulated
+    source) or files not in `ingested_files` (file sources) are processed; `state` carries the
+    dedup keys and aggregate partials of earlier runs in and this run's out."""
+    connector = open_connector(options, ingested_files)
+    streaming = options.get("streaming")
+    chunk_size = connector.chunk_size(options)
+    latest = {"watermark": watermark, "skipped": 0}
+    profiler = profiler or StageProfiler(memory=False)
+    
+    def batches():
+        source = connector.batches(chunk_size, read_columns(transformations, connector.stats))
+        while True:
+            check_cancelled()
+            with profiler.stage("ingest") as counters:
+                chunk = next(source, None)
+                if chunk is None:
+                    counters["calls"] = 0
+                    return
+                counters["rows_in"] = len(chunk)
+                chunk = apply_schema(chunk, options.get("source_type"))
+                if len(chunk) and "timestamp" in chunk.columns and pd.api.types.is_datetime64_any_dtype(chunk["timestamp"]):
+                    newest = chunk["timestamp"].max().to_pydatetime()
+                    latest["watermark"] = newest if latest["watermark"] is None else max(latest["watermark"], newest)
+                if watermark is not None and connector.filters_by_watermark:
+                    # The simulated source has no query interface, so the watermark predicate is applied on arrival
+                    fresh = (chunk["timestamp"] > watermark).to_numpy()
+                    latest["skipped"] += int((~fresh).sum())
+                    chunk = chunk[fresh]
+                counters["rows_out"] = len(chunk)
+            if len(chunk):
+                yield chunk
+    
+    if streaming:
+        log_event(logs, "INFO", f"Streaming ingestion, transformation and quality checks in chunks of {chunk_size} records...")
+    else:
+        log_event(logs, "INFO", "Starting data ingestion, transformation and quality checks...")
+    outcome = execute_streaming(batches(), transformations, quality_rules, stats=connector.stats, writer=writer,
+                                state=state, progress=progress, profiler=profiler,
+                                partitions=options.get("partitions", PIPELINE_PARTITIONS))
+    log_ingest_summary(logs, len(connector.files), connector.skipped_files, outcome["records_ingested"],
+                       latest["skipped"], outcome["records_out"])
+    
+    return {
+        "sample": outcome["sample"],
+        "records_out": outcome["records_out"],
+        "validation_results": outcome["validation_results"],
+        "quality_metrics": outcome["quality_metrics"],
+        "watermark": latest["watermark"],
+        "files": connector.files
+    }
+
+def log_ingest_summary(logs: List[Dict[str, Any]], files_read: int, files_skipped: int, records_ingested: int,
+                       records_skipped: int, records_out: int):
+    if files_read or files_skipped:
+        log_event(logs, "INFO", f"Read {files_read} files, skipped {files_skipped} already ingested")
+    log_event(logs, "INFO", f"Ingested {records_ingested} records")
+    if records_skipped:
+        log_event(logs, "INFO", f"Skipped {records_skipped} records at or before the watermark")
+    log_event(logs, "INFO", f"Transformed to {records_out} records")
+
+# ==================== SHARED SCANS ====================
+
+SHARED_SCAN_BUFFER_CHUNKS = 2  # chunks queued per pipeline before the scan waits for it
+SHARED_STEP_TYPES = {"filter", "remove_nulls"}  # stateless row-level steps whose results can be shared
+
+def step_key(step: Dict[str, Any]) -> str:
+    return json.dumps(step, sort_keys=True, default=str)
+
+class ScanBranch:
+    """One pipeline of a shared scan: its resume point, output and a thread running its transformation chain.
+    
+    The scan thread feeds it chunks through a bounded queue, already filtered to the records this
+    pipeline hasn't processed and with the shared leading steps applied."""
+    
+    def __init__(self, pipeline: Dict[str, Any], quality_rules: List[Dict[str, Any]], options: Dict[str, Any],
+                 cancel_event=None, events=None):
+        self.pipeline = pipeline
+        self.quality_rules = quality_rules
+        self.options = options
+        self.cancel_event = cancel_event
+        self.logs = RunLogPublisher(options["run_id"], events)
+        # Pipelines run concurrently in threads, so per-stage memory growth would not be attributable
+        self.profiler = StageProfiler(memory=False)
+        self.transformations = pipeline.get('transformations', [])
+        self.stats = source_stats(options)
+        self.plan = plan_transformations(self.transformations, self.stats)[0]
+        self.resume = resume_run(self.transformations, options, self.logs, self.profiler)
+        self.ingested = set(self.resume["ingested"])
+        self.writer = RunOutputWriter(pipeline['id'], options["run_id"])
+        self.inbox: queue.Queue = queue.Queue(maxsize=SHARED_SCAN_BUFFER_CHUNKS)
+        self.shared_steps: List[str] = []
+        self.records_ingested = 0
+        self.records_skipped = 0
+        self.outcome: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.stop = threading.Event()
+        self.done = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+    
+    def stateless_steps(self) -> List[Dict[str, Any]]:
+        """Leading stateless steps of the plan, after its column projection"""
+        steps = self.plan[1:] if self.plan and self.plan[0]["type"] == "project" else self.plan
+        return list(itertools.takewhile(lambda t: t.get("type") in SHARED_STEP_TYPES, steps))
+    
+    @property
+    def prefix(self) -> int:
+        """Planned steps applied before chunks reach the branch: the shared steps and the projection"""
+        if not self.shared_steps:
+            return 0
+        return len(self.shared_steps) + int(self.plan[0]["type"] == "project")
+    
+    def prepare(self, chunk: pd.DataFrame, cache: Dict[tuple, pd.DataFrame], profiler: StageProfiler) -> pd.DataFrame:
+        """Apply the shared steps, each computed once per chunk for all branches, then this plan's projection"""
+        if not self.shared_steps:
+            return chunk
+        key = ()
+        for depth, (step, step_id) in enumerate(zip(self.stateless_steps(), self.shared_steps)):
+            key += (step_id,)
+            if key not in cache:
+                with profiler.stage("shared_transform", len(chunk), depth, step.get("type")) as counters:
+                    cache[key] = transform_frame(chunk, step)
+                    counters["rows_out"] = len(cache[key])
+            chunk = cache[key]
+        if self.plan[0]["type"] == "project":
+            chunk = transform_frame(chunk, self.plan[0])
+        return chunk
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"scan-{self.options['run_id']}", daemon=True)
+        self.thread.start()
+    
+    def feed(self, chunk: Optional[pd.DataFrame]) -> bool:
+        """Queue a chunk (None ends the stream); False once the branch has stopped"""
+        while not self.done.is_set():
+            try:
+                self.inbox.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _chunks(self) -> Iterator[pd.DataFrame]:
+        while True:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise PipelineCancelled("Pipeline run cancelled")
+            if self.stop.is_set():
+                raise RuntimeError("Shared scan stopped")
+            try:
+                chunk = self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            yield chunk
+    
+    def _run(self):
+        try:
+            self.outcome = execute_streaming(self._chunks(), self.transformations, self.quality_rules, stats=self.stats,
+                                             writer=self.writer, state=self.resume["state"], progress=self.logs.progress,
+                                             profiler=self.profiler, partitions=self.options.get("partitions", PIPELINE_PARTITIONS),
+                                             prefix=self.prefix)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+def share_prefixes(branches: List[ScanBranch], input_key: Callable[[ScanBranch], Any]):
+    """Mark the leading steps each branch shares with another branch receiving the same input"""
+    groups = {}
+    for branch in branches:
+        groups.setdefault(input_key(branch), []).append(branch)
+    for group in groups.values():
+        counts = {}
+        for branch in group:
+            key = ()
+            for step in branch.stateless_steps():
+                key += (step_key(step),)
+                counts[key] = counts.get(key, 0) + 1
+        for branch in group:
+            key = ()
+            for step in branch.stateless_steps():
+                if counts.get(key + (step_key(step),), 0) < 2:
+                    break
+                key += (step_key(step),)
+            branch.shared_steps = list(key)
+
+def process_batch_run(pipelines: List[Dict[str, Any]], quality_rules: List[Dict[str, Any]], options: List[Dict[str, Any]],
+                      cancel_events: Optional[List[Any]] = None, events=None) -> List[Dict[str, Any]]:
+    """Run several pipelines on one scan of their shared source. Runs in a worker process, so it must not touch Mongo.
+    
+    The source is read once, with the union of the columns the pipelines need, and each chunk is
+    fanned out to every pipeline's transformation chain. Leading filter/null-check steps common
+    to pipelines with the same resume point are evaluated once per chunk. Returns one entry per
+    pipeline: {"status": "success", "outcome": ...} or {"status": "failed" | "cancelled", "error": ...}."""
+    if PROFILE_MEMORY == "tracemalloc" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    cancel_events = cancel_events or [None] * len(pipelines)
+    branches = [ScanBranch(pipeline, quality_rules, run_options, cancel_event, events)
+                for pipeline, run_options, cancel_event in zip(pipelines, options, cancel_events)]
+    
+    # Source, record count and chunking options are the same for the whole batch. Files every
+    # pipeline has ingested are skipped by the connector, the rest per pipeline.
+    scan_options = options[0]
+    ingested = set.intersection(*(set(b.resume["ingested"]) for b in branches))
+    connector = open_connector(scan_options, ingested)
+    chunk_size = connector.chunk_size(scan_options)
+    wanted = [read_columns(b.transformations, b.stats) for b in branches]
+    columns = None if any(c is None for c in wanted) else sorted(set().union(*wanted))
+    profiler = StageProfiler()
+    newest = None
+    
+    # Pipelines at the same watermark receive identical chunks, so they can share leading steps
+    input_key = lambda branch: branch.resume["watermark"] if connector.filters_by_watermark else None
+    share_prefixes(branches, input_key)
+    
+    for branch in branches:
+        shared = f" sharing {len(branch.shared_steps)} leading steps" if branch.shared_steps else ""
+        log_event(branch.logs, "INFO", f"Shared scan of the source with {len(branches)} pipelines{shared}, in chunks of {chunk_size} records...")
+        branch.start()
+    try:
+        source = connector.batches(chunk_size, columns)
+        while True:
+            live = [b for b in branches if not b.done.is_set()]
+            if not live:
+                break
+            with profiler.stage("ingest") as counters:
+                chunk = next(source, None)
+                if chunk is None:
+                    counters["calls"] = 0
+                    break
+                counters["rows_in"] = len(chunk)
+                chunk = apply_schema(chunk, scan_options.get("source_type"))
+                if len(chunk) and "timestamp" in chunk.columns and pd.api.types.is_datetime64_any_dtype(chunk["timestamp"]):
+                    chunk_newest = chunk["timestamp"].max().to_pydatetime()
+                    newest = chunk_newest if newest is None else max(newest, chunk_newest)
+            
+            fresh_chunks, caches = {}, {}
+            for branch in live:
+                if connector.current_file in branch.ingested:
+                    continue
+                key = input_key(branch)
+                if key not in fresh_chunks:
+                    # The simulated source has no query interface, so the watermark predicate is applied on arrival
+                    fresh_chunks[key] = chunk if key is None else chunk[(chunk["timestamp"] > key).to_numpy()]
+                fresh = fresh_chunks[key]
+                branch.records_skipped += len(chunk) - len(fresh)
+                if len(fresh):
+                    branch.records_ingested += len(fresh)
+                    branch.feed(branch.prepare(fresh, caches.setdefault(key, {}), profiler))
+    except BaseException:
+        for branch in branches:
+            branch.stop.set()
+        for branch in branches:
+            branch.thread.join()
+            branch.writer.abort()
+        raise
+    for branch in branches:
+        branch.feed(None)
+    for branch in branches:
+        branch.thread.join()
+    
+    results = []
+    for branch in branches:
+        if branch.error is None:
+            try:
+                outcome = branch.outcome
+                files = [f for f in connector.files if f not in branch.ingested]
+                log_ingest_summary(branch.logs, len(files), connector.skipped_files + len(connector.files) - len(files),
+                                   branch.records_ingested, branch.records_skipped, outcome["records_out"])
+                watermark = branch.resume["watermark"]
+                outcome = {
+                    "sample": outcome["sample"],
+                    "records_out": outcome["records_out"],
+                    "validation_results": outcome["validation_results"],
+                    "quality_metrics": outcome["quality_metrics"],
+                    "watermark": newest if watermark is None else max(watermark, newest or watermark),
+                    "files": files,
+                    "shared_stages": [{**stage, "shared_by": len(branches)} for stage in profiler.report()]
+                }
+                results.append({"status": "success", "outcome": complete_run(branch.pipeline, branch.options, outcome,
+                                                                              branch.writer, branch.resume, branch.logs,
+                                                                              branch.profiler)})
+                continue
+            except Exception as e:
+                branch.error = e
+        branch.writer.abort()
+        status = "cancelled" if isinstance(branch.error, PipelineCancelled) else "failed"
+        results.append({"status": status, "error": str(branch.error)})
+    return results
+
+class QueueSlots:
+    """Queue capacity claimed in the same step as the capacity check, so concurrent submits cannot all
+    pass the check before any of their runs is registered. Each queued run takes one slot; slots
+    still unused when the block exits (e.g. a failed insert) are released."""
+    
+    def __init__(self, jobs: "PipelineJobQueue", runs: int):
+        self.jobs = jobs
+        self.left = runs
+    
+    def take(self):
+        self.left -= 1
+        self.jobs.reserved -= 1
+    
+    def __enter__(self) -> "QueueSlots":
+        return self
+    
+    def __exit__(self, *exc):
+        self.jobs.reserved -= self.left
+        self.left = 0
+
+class PipelineJobQueue:
+    """Bounded queue of pipeline runs executed on a pool of worker processes.
+    
+    A fixed number of dispatcher tasks pull run ids (or shared-scan batches of them) off an
+    asyncio queue, fetch the active quality rules, hand the CPU work to the process pool and
+    persist the outcome. At most
+    `workers` runs execute at once; at most `max_queued` more may wait."""
+    
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.reserved = 0  # slots claimed by submits whose runs aren't registered in `jobs` yet
+        self.batches: Dict[str, List[str]] = {}  # batch id queued in place of its runs' ids -> those run ids
+        self.queue: Optional[asyncio.Queue] = None
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.manager = None
+        self.events = None
+        self.pump: Optional[asyncio.Task] = None
+        self.heartbeat: Optional[asyncio.Task] = None
+        self.dispatchers: List[asyncio.Task] = []
+    
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        self.manager = ctx.Manager()
+        self.events = self.manager.Queue()
+        self.queue = asyncio.Queue()
+        self.pump = asyncio.create_task(self._pump_events())
+        self.heartbeat = asyncio.create_task(self._beat())
+        self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+    
+    async def stop(self):
+        for task in self.dispatchers + [self.heartbeat]:
+            if task:
+                task.cancel()
+        await asyncio.gather(*self.dispatchers, *([self.heartbeat] if self.heartbeat else []), return_exceptions=True)
+        self.dispatchers = []
+        self.heartbeat = None
+        if self.pump:
+            self.events.put(None)
+            await asyncio.gather(self.pump, return_exceptions=True)
+            self.pump = None
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.manager:
+            self.manager.shutdown()
+    
+    def stats(self) -> Dict[str, Any]:
+        states = [job["state"] for job in self.jobs.values()]
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": states.count("queued"),
+            "reserved": self.reserved,
+            "running": states.count("running")
+        }
+    
+    async def submit(self, pipeline: Dict[str, Any], options: Dict[str, Any], trigger: Optional[str] = None,
+                     slots: Optional[QueueSlots] = None) -> PipelineRun:
+        """Queue a run; `slots` are capacity already reserved by the caller, e.g. for several submits"""
+        if slots is None:
+            with self.reserve(1) as slots:
+                return await self.submit(pipeline, options, trigger, slots)
+        run = await self._queue_run(pipeline, options, trigger, slots)
+        self.queue.put_nowait(run.id)
+        return run
+    
+    async def submit_batch(self, pipelines: List[Dict[str, Any]], options: Dict[str, Any],
+                           trigger: Optional[str] = None, slots: Optional[QueueSlots] = None) -> List[PipelineRun]:
+        """Queue one run per pipeline, executed together on a single shared scan of their common source"""
+        if slots is None:
+            with self.reserve(len(pipelines)) as slots:
+                return await self.submit_batch(pipelines, options, trigger, slots)
+        runs = []
+        try:
+            for pipeline in pipelines:
+                runs.append(await self._queue_run(pipeline, options, trigger or f"shared scan of {len(pipelines)} pipelines", slots))
+        except Exception:
+            # The batch never reaches a dispatcher, so its registered runs would hold their slots forever
+            for run in runs:
+                self.jobs.pop(run.id, None)
+                await self._finish(run, "failed", "Shared-scan batch could not be queued")
+            raise
+        batch_id = str(uuid.uuid4())
+        self.batches[batch_id] = [run.id for run in runs]
+        self.queue.put_nowait(batch_id)
+        return runs
+    
+    def reserve(self, runs: int) -> QueueSlots:
+        """Check capacity for `runs` more runs and claim it, without yielding to other submits in between"""
+        self.check_capacity(runs)
+        self.reserved += runs
+        return QueueSlots(self, runs)
+    
+    def check_capacity(self, runs: int):
+        if self.queue is None:
+            raise HTTPException(status_code=503, detail="Pipeline workers are not running")
+        queued = self.stats()["queued"]
+        pipeline_queue_depth.observe(queued)
+        if queued + self.reserved + runs > self.max_queued:
+            raise HTTPException(status_code=429, detail="Pipeline queue is full, retry later", headers={"Retry-After": "5"})
+    
+    async def _queue_run(self, pipeline: Dict[str, Any], options: Dict[str, Any], trigger: Optional[str],
+                         slots: QueueSlots) -> PipelineRun:
+        now = datetime.now(timezone.utc)
+        run = PipelineRun(
+            pipeline_id=pipeline['id'],
+            pipeline_name=pipeline['name'],
+            status="running",
+            start_time=now,
+            heartbeat_at=now,
+            logs=[]
+        )
+        log_event(run.logs, "INFO", f"Queued for execution ({trigger})" if trigger else "Queued for execution")
+        run_doc = run.model_dump()
+        await db.pipeline_runs.insert_one(run_doc)
+        await rollup_run_queued(run_doc)
+        run_events.open(run)
+        
+        self.jobs[run.id] = {"state": "queued", "run": run, "pipeline": pipeline, "options": dict(options, run_id=run.id),
+                             "cancel": self.manager.Event()}
+        slots.take()
+        return run
+    
+    async def cancel(self, run_id: str) -> Optional[str]:
+        """Cancel a queued or running job; returns the state it was in, or None if it isn't active"""
+        job = self.jobs.get(run_id)
+        if job is None or job["state"] == "cancelled":
+            return None
+        state = job["state"]
+        job["cancel"].set()
+        if state == "queued":
+            job["state"] = "cancelled"
+            await self._finish(job["run"], "cancelled", "Pipeline run cancelled before it started")
+        return state
+    
+    async def _dispatch(self):
+        while True:
+            item = await self.queue.get()
+            run_ids = self.batches.pop(item, None) or [item]
+            try:
+                jobs = [job for job in map(self.jobs.get, run_ids) if job is not None and job["state"] != "cancelled"]
+                if len(run_ids) > 1 and jobs:
+                    await self._run_batch(jobs)
+                elif jobs:
+                    await self._run(jobs[0])
+            except Exception:
+                logger.exception("Failed to record outcome of pipeline run %s", item)
+            finally:
+                for run_id in run_ids:
+                    self.jobs.pop(run_id, None)
+                self.queue.task_done()
+    
+    async def _prepare(self, job: Dict[str, Any], source: Dict[str, Any]) -> tuple[Dict[str, Any], Dict[str, Any]]:
+        """Mark a job running; returns its committed watermark and the options the worker gets"""
+        job["state"] = "running"
+        # Read the watermark at dispatch, not submit, so queued runs see their predecessors' commits
+        base = await load_watermark(job["pipeline"])
+        options = {**job["options"], "incremental": base, "source_type": source.get("type"),
+                   "source_config": source.get("config")}
+        return base, options
+    
+    async def _source(self, pipeline: Dict[str, Any]) -> Dict[str, Any]:
+        return await db.data_sources.find_one({"id": pipeline.get("source_id")}, {"_id": 0, "type": 1, "config": 1}) or {}
+    
+    async def _run(self, job: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        run = job["run"]
+        try:
+            quality_rules = await db.quality_rules.find({"active": True}, {"_id": 0}).to_list(100)
+            base, options = await self._prepare(job, await self._source(job["pipeline"]))
+            outcome = await loop.run_in_executor(self.pool, process_pipeline_run, job["pipeline"],
+                                                 quality_rules, options, job["cancel"], self.events)
+            await self._complete(job, base, outcome)
+        except PipelineCancelled:
+            await self._finish(run, "cancelled", "Pipeline run cancelled")
+        except BrokenProcessPool as e:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            await self._finish(run, "failed", f"Worker process died: {str(e)}")
+        except Exception as e:
+            await self._finish(run, "failed", str(e))
+    
+    async def _run_batch(self, jobs: List[Dict[str, Any]]):
+        """Run a shared-scan batch in one worker: the rules and source are loaded once for all its runs"""
+        loop = asyncio.get_running_loop()
+        prepared = []
+        try:
+            quality_rules = await db.quality_rules.find({"active": True}, {"_id": 0}).to_list(100)
+            source = await self._source(jobs[0]["pipeline"])
+            for job in jobs:
+                prepared.append(await self._prepare(job, source))
+            results = await loop.run_in_executor(self.pool, process_batch_run, [job["pipeline"] for job in jobs],
+                                                 quality_rules, [options for _, options in prepared],
+                                                 [job["cancel"] for job in jobs], self.events)
+        except BrokenProcessPool as e:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            results = [{"status": "failed", "error": f"Worker process died: {str(e)}"}] * len(jobs)
+        except Exception as e:
+            results = [{"status": "failed", "error": str(e)}] * len(jobs)
+        
+        bases = [base for base, _ in prepared] + [None] * (len(jobs) - len(prepared))
+        for job, base, result in zip(jobs, bases, results):
+            try:
+                if result["status"] == "success":
+                    await self._complete(job, base, result["outcome"])
+                elif result["status"] == "cancelled":
+                    await self._finish(job["run"], "cancelled", "Pipeline run cancelled")
+                else:
+                    await self._finish(job["run"], "failed", result["error"])
+            except Exception as e:
+                await self._finish(job["run"], "failed", str(e))
+    
+    async def _complete(self, job: Dict[str, Any], base: Dict[str, Any], outcome: Dict[str, Any]):
+        """Persist a worker's outcome, commit the watermark and finish the run as successful"""
+        run = job["run"]
+        await run_events.catch_up(run.id, outcome["logs"])
+        profiler = StageProfiler(memory=False)
+        with profiler.stage("persist", outcome["records_out"]):
+            quality_docs = await save_run_outcome(run, outcome)
+            if not await commit_watermark(job["pipeline"], run.id, base, outcome["incremental"]):
+                await run_events.log(run.id, "WARNING", "Another run advanced the watermark first; this run's state was not kept")
+            if WRITE_FLUSH_PER_RUN:
+                await write_buffer.flush()
+        run.metrics["stages"].extend(profiler.report())
+        for stage in run.metrics["stages"]:
+            pipeline_stage_seconds.observe(stage["wall_ms"] / 1000, stage["stage"], stage.get("operation", ""))
+        await self._finish(run, "success", quality_docs=quality_docs)
+    
+    async def _finish(self, run: PipelineRun, status: str, error: Optional[str] = None,
+                      quality_docs: Optional[List[Dict[str, Any]]] = None):
+        run.status = status
+        run.end_time = datetime.now(timezone.utc)
+        if status == "success":
+            await run_events.log(run.id, "SUCCESS", "Pipeline completed successfully")
+        elif status == "cancelled":
+            run.error_message = error
+            await run_events.log(run.id, "WARNING", error)
+        else:
+            run.error_message = error
+            await run_events.log(run.id, "ERROR", f"Pipeline failed: {error}")
+        
+        # Logs are appended to the stored run in batches by the event hub, never rewritten here
+        run_doc = run.model_dump(exclude={"logs"})
+        await write_buffer.update("pipeline_runs", {"id": run.id}, {"$set": run_doc})
+        await rollup_run_finished(run_doc, quality_docs or [])
+        if WRITE_FLUSH_PER_RUN:
+            await write_buffer.flush()
+        await run_events.close(run.id, status)
+    
+    async def _beat(self):
+        """Keep the heartbeat of this process's queued and running runs fresh (see fail_orphaned_runs)"""
+        while True:
+            await asyncio.sleep(RUN_HEARTBEAT_SECONDS)
+            try:
+                if self.jobs:
+                    await db.pipeline_runs.update_many({"id": {"$in": list(self.jobs)}, "status": "running"},
+                                                       {"$set": {"heartbeat_at": datetime.now(timezone.utc)}})
+            except Exception:
+                logger.exception("Run heartbeat failed")
+    
+    async def _pump_events(self):
+        """Hand log and progress events sent by worker processes to the event hub"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = await loop.run_in_executor(None, self.events.get)
+            except (EOFError, OSError):
+                return  # the manager process is gone
+            if item is None:
+                return
+            run_events.worker_event(*item)
+
+async def save_run_outcome(run: PipelineRun, outcome: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Buffer the quality results and processed sample produced by a worker for writing"""
+    quality_metrics = outcome["quality_metrics"]
+    quality_docs = []
+    
+    # Save quality results
+    for result in outcome["validation_results"]:
+        quality_result = DataQualityResult(
+            pipeline_run_id=run.id,
+            **result
+        )
+        doc = quality_result.model_dump()
+        quality_docs.append(doc)
+        await write_buffer.insert("quality_results", doc)
+    await record_quality_results(quality_docs)
+    
+    # Save processed data
+    processed = ProcessedData(
+        pipeline_run_id=run.id,
+        data=outcome["sample"],  # Store sample for querying
+        metadata={"total_records": outcome["records_out"], "quality_metrics": quality_metrics,
+                  "source_type": outcome.get("source_type")},
+        storage=outcome.get("storage")
+    )
+    doc = processed.model_dump()
+    await write_buffer.insert("processed_data", doc)
+    
+    # Save this run's approximate aggregate sketches
+    sketches = outcome.get("sketches")
+    for entry in sketches["groups"] if sketches else []:
+        sketch = AggregateSketch(pipeline_id=run.pipeline_id, pipeline_run_id=run.id, field=sketches["field"],
+                                 function=sketches["function"], group_by=sketches["group_by"],
+                                 percentile=sketches["percentile"], **entry)
+        await write_buffer.insert("aggregate_sketches", sketch.model_dump())
+    
+    run.records_processed = outcome["records_out"]
+    run.metrics = {**quality_metrics, "stages": outcome.get("stages", [])}
+    return quality_docs
+
+async def fail_orphaned_runs(pipeline_id: Optional[str] = None) -> int:
+    """Mark runs left "running" by a process that crashed or restarted as failed; returns how many.
+    
+    A run is orphaned once its heartbeat is older than RUN_STALE_SECONDS. The update is
+    conditional on the stale heartbeat, so a run whose owner just reported is left alone."""
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(seconds=RUN_STALE_SECONDS)
+    query = {"status": "running", "$or": [{"heartbeat_at": {"$lt": stale_before}},
+                                          {"heartbeat_at": None, "start_time": {"$lt": stale_before}}]}
+    if pipeline_id is not None:
+        query["pipeline_id"] = pipeline_id
+    failed = 0
+    async for doc in db.pipeline_runs.find(query, {"_id": 0, "logs": 0}):
+        last_seen = doc.get("heartbeat_at") or doc["start_time"]
+        update = {"status": "failed", "end_time": now,
+                  "error_message": f"Run orphaned: its process stopped reporting at {last_seen.isoformat()}"}
+        logs = []
+        log_event(logs, "ERROR", f"Pipeline failed: {update['error_message']}")
+        result = await db.pipeline_runs.update_one(
+            {"id": doc["id"], "status": "running", "heartbeat_at": doc.get("heartbeat_at")},
+            {"$set": update, "$push": {"logs": {"$each": logs}}})
+        if result.modified_count:
+            await rollup_run_finished({**doc, **update}, [])
+            failed += 1
+    if failed:
+        logger.warning("Marked %d orphaned pipeline runs as failed", failed)
+        await write_buffer.flush_collection("dashboard_rollups")
+    return failed
 
-# Create the main app without a prefix
-app = FastAPI()
+pipeline_jobs = PipelineJobQueue(PIPELINE_WORKERS, PIPELINE_QUEUE_DEPTH)
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+# ==================== LEASES ====================
 
-# ==================== MODELS ====================
+async def take_lease(lease_id: str, owner: str, seconds: float) -> bool:
+    """Acquire or renew a lease in scheduler_leases; a live lease held by another owner wins"""
+    now = datetime.now(timezone.utc)
+    try:
+        lease = await db.scheduler_leases.find_one_and_update(
+            {"id": lease_id, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return lease is not None and lease["owner"] == owner
+    except DuplicateKeyError:
+        return False
 
-class DataSource(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    type: str  # "manufacturing_plant", "quality_sensor", "inventory_system"
-    location: str
-    status: str = "active"  # "active", "inactive"
-    config: Dict[str, Any] = {}
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+# ==================== RETENTION ====================
 
-class DataSourceCreate(BaseModel):
-    name: str
-    type: str
-    location: str
-    config: Dict[str, Any] = {}
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', str(ROOT_DIR / 'data' / 'archive')))
+RETENTION_INTERVAL_SECONDS = float(os.environ.get('RETENTION_INTERVAL_SECONDS', '3600'))
+RETENTION_LEASE_SECONDS = float(os.environ.get('RETENTION_LEASE_SECONDS', '60'))
+RETENTION_LEASE_ID = "retention"
+RETENTION_BATCH_SIZE = 5000  # documents per archive file
+RUN_LOG_COMPACT_KEEP = 5  # log entries kept at each end of a compacted run log, besides warnings and errors
+ARCHIVE_RESTORE_HOLD = timedelta(days=7)  # restored documents stay hot this long before retention applies again
 
-class Pipeline(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str
-    source_id: str
-    transformations: List[Dict[str, Any]] = []
-    schedule: Optional[str] = None
-    status: str = "draft"  # "draft", "active", "paused"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+# Days each collection stays hot (0 keeps it forever); runs also have their logs compacted sooner
+RETENTION_DEFAULTS = {
+    "pipeline_runs": {"days": int(os.environ.get('RETENTION_RUNS_DAYS', '90')),
+                      "compact_logs_days": int(os.environ.get('RETENTION_RUN_LOGS_DAYS', '14'))},
+    "quality_results": {"days": int(os.environ.get('RETENTION_QUALITY_RESULTS_DAYS', '90'))},
+    "processed_data": {"days": int(os.environ.get('RETENTION_PROCESSED_DATA_DAYS', '30'))}
+}
+RETENTION_TIME_FIELDS = {"pipeline_runs": "start_time", "quality_results": "timestamp", "processed_data": "timestamp"}
 
-class PipelineCreate(BaseModel):
-    name: str
-    description: str
-    source_id: str
-    transformations: List[Dict[str, Any]] = []
-    schedule: Optional[str] = None
+class RetentionInProgress(Exception):
+    """Raised when a retention pass is asked for while another one holds the retention lease"""
 
-class PipelineRun(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    pipeline_id: str
-    pipeline_name: str
-    status: str  # "running", "success", "failed"
-    start_time: datetime
-    end_time: Optional[datetime] = None
-    records_processed: int = 0
-    records_failed: int = 0
-    logs: List[Dict[str, Any]] = []
-    metrics: Dict[str, Any] = {}
-    error_message: Optional[str] = None
+@asynccontextmanager
+async def retention_lease(owner: Optional[str] = None):
+    """Hold the retention lease for a pass, renewing it while the pass runs.
+    
+    Passes start on the scheduler leader, any API worker or the CLI, so only the Mongo lease keeps
+    them apart. A pass that loses its lease (it could not renew before expiry and another pass took
+    over) is cancelled and reported as RetentionInProgress; the next pass finishes its pending archives."""
+    owner = owner or str(uuid.uuid4())
+    if not await take_lease(RETENTION_LEASE_ID, owner, RETENTION_LEASE_SECONDS):
+        raise RetentionInProgress("A retention pass is already running")
+    task = asyncio.current_task()
+    lost = False
+    
+    async def renew():
+        nonlocal lost
+        while True:
+            await asyncio.sleep(RETENTION_LEASE_SECONDS / 3)
+            try:
+                held = await take_lease(RETENTION_LEASE_ID, owner, RETENTION_LEASE_SECONDS)
+            except Exception:
+                logger.exception("Retention lease renewal failed")
+                continue
+            if not held:
+                lost = True
+                task.cancel()
+                return
+    
+    renewal = asyncio.create_task(renew())
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not lost:
+            raise
+        task.uncancel()
+        raise RetentionInProgress("The retention lease was taken over by another pass")
+    finally:
+        renewal.cancel()
+        await asyncio.gather(renewal, return_exceptions=True)
+        await db.scheduler_leases.delete_one({"id": RETENTION_LEASE_ID, "owner": owner})
 
-class DataQualityRule(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str
-    rule_type: str  # "completeness", "accuracy", "consistency", "timeliness"
-    field: str
-    condition: Dict[str, Any]
-    severity: str  # "critical", "high", "medium", "low"
-    active: bool = True
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+async def retention_policies() -> Dict[str, Dict[str, int]]:
+    """The env defaults with any overrides saved through the API"""
+    policies = {collection: dict(policy) for collection, policy in RETENTION_DEFAULTS.items()}
+    async for doc in db.retention_policies.find({}, {"_id": 0}):
+        if doc["id"] in policies:
+            policies[doc["id"]].update({k: v for k, v in doc.items() if k in policies[doc["id"]]})
+    return policies
 
-class DataQualityRuleCreate(BaseModel):
-    name: str
-    description: str
-    rule_type: str
-    field: str
-    condition: Dict[str, Any]
-    severity: str
+def retention_cutoff(now: datetime, days: int) -> Optional[datetime]:
+    """Start of the day `days` ago, so whole days (and their quality buckets) are archived together"""
+    return bucket_start(now - timedelta(days=days), timedelta(days=1)) if days > 0 else None
 
-class DataQualityResult(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    pipeline_run_id: str
-    rule_id: str
-    rule_name: str
-    passed: bool
-    records_checked: int
-    records_failed: int
-    quality_score: float
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+def compact_logs(logs: List[Dict[str, Any]], archive_id: str) -> List[Dict[str, Any]]:
+    """First and last few entries plus every warning and error, with a marker pointing at the full log"""
+    if len(logs) <= 2 * RUN_LOG_COMPACT_KEEP:
+        return logs
+    middle = logs[RUN_LOG_COMPACT_KEEP:-RUN_LOG_COMPACT_KEEP]
+    kept = [entry for entry in middle if entry.get("level") in ("WARNING", "ERROR")]
+    marker = {"timestamp": middle[0].get("timestamp"), "level": "INFO",
+              "message": f"{len(middle) - len(kept)} log entries compacted; the full log is in archive {archive_id}"}
+    return logs[:RUN_LOG_COMPACT_KEEP] + [marker] + kept + logs[-RUN_LOG_COMPACT_KEEP:]
 
-class ProcessedData(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    pipeline_run_id: str
-    data: List[Dict[str, Any]]
-    metadata: Dict[str, Any]
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+def archive_output_path(storage: Dict[str, Any]) -> Path:
+    return Path("processed_data") / "outputs" / Path(storage["path"]).with_suffix(".parquet")
 
-# ==================== DATA GENERATION ====================
+def write_archive(collection: str, archive_id: str, docs: List[Dict[str, Any]]) -> Path:
+    """Write documents as zstd-compressed JSON lines; processed_data run outputs are converted to zstd Parquet"""
+    for doc in docs:
+        if collection == "processed_data" and has_stored_output(doc):
+            target = ARCHIVE_DIR / archive_output_path(doc["storage"])
+            target.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(read_run_output(doc["storage"]), str(target), compression="zstd")
+            doc["storage"] = {**doc["storage"], "archive_path": archive_output_path(doc["storage"]).as_posix()}
+    
+    oldest = min(doc[RETENTION_TIME_FIELDS[collection]] for doc in docs)
+    relative = Path(collection) / f"date={oldest.strftime('%Y-%m-%d')}" / f"{archive_id}.jsonl.zst"
+    path = ARCHIVE_DIR / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".zst.tmp")
+    with pa.CompressedOutputStream(str(tmp_path), "zstd") as out:
+        for doc in docs:
+            out.write(orjson.dumps(doc, default=json_default, option=orjson.OPT_APPEND_NEWLINE))
+    os.replace(tmp_path, path)
+    return relative
+
+def read_archive(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Documents of an archive file, with their datetimes converted back from ISO strings"""
+    with pa.CompressedInputStream(pa.OSFile(str(ARCHIVE_DIR / manifest["path"])), "zstd") as source:
+        data = source.read()
+    fields = DATETIME_FIELDS[manifest["collection"]]
+    docs = []
+    for line in data.splitlines():
+        doc = orjson.loads(line)
+        docs.append({**doc, **migrate_document(doc, fields)})
+    return docs
+
+async def apply_hot_action(collection: str, docs: List[Dict[str, Any]], archive_id: str, cutoff: Optional[datetime]):
+    """Shrink archived documents in their hot collection through the write buffer, so readers such as
+    the analytics cache see a new data version: runs lose (or compact) their logs, the rest are deleted"""
+    ids = [doc["id"] for doc in docs]
+    if collection == "pipeline_runs":
+        for doc in docs:
+            if cutoff is not None and doc["start_time"] < cutoff:
+                update = {"$set": {"archive_id": archive_id}, "$unset": {"logs": "", "restored_at": ""}}
+            else:
+                update = {"$set": {"archive_id": archive_id, "logs": compact_logs(doc.get("logs") or [], archive_id)}}
+            await write_buffer.update(collection, {"id": doc["id"]}, update)
+    else:
+        await write_buffer.delete(collection, {"id": {"$in": ids}})
+    result = await write_buffer.flush_collection(collection)
+    if result["errors"]:
+        # Leaves the archive pending, so the next pass retries
+        raise RuntimeError(f"Retention update of {collection} failed: {result['errors'][0]['message']}")
+    if collection == "processed_data":
+        for doc in docs:
+            if doc.get("storage"):
+                (PROCESSED_DATA_DIR / doc["storage"]["path"]).unlink(missing_ok=True)
 
-def generate_plant_data(num_records: int = 100) -> List[Dict[str, Any]]:
-    """Generate simulated manufacturing plant data"""
-    plants = ["Plant_ATL", "Plant_NYC", "Plant_CHI", "Plant_LA", "Plant_MIA"]
-    products = ["Product_A", "Product_B", "Product_C", "Product_D", "Product_E"]
+async def archive_batch(collection: str, docs: List[Dict[str, Any]], hot_cutoff: Optional[datetime],
+                        archive_cutoff: datetime) -> Dict[str, Any]:
+    """Archive one batch: file first, then a pending manifest, then the hot-collection changes.
+    A pass interrupted after the manifest is finished by the next one (see resume_archives)."""
+    archive_id = str(uuid.uuid4())
+    time_field = RETENTION_TIME_FIELDS[collection]
+    path = await asyncio.to_thread(write_archive, collection, archive_id, [dict(doc) for doc in docs])
+    manifest = {
+        "id": archive_id,
+        "collection": collection,
+        "path": path.as_posix(),
+        "count": len(docs),
+        "start": min(doc[time_field] for doc in docs),
+        "end": max(doc[time_field] for doc in docs),
+        "cutoff": archive_cutoff,
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc)
+    }
+    await db.archives.insert_one(manifest)
+    await apply_hot_action(collection, docs, archive_id, hot_cutoff)
+    await db.archives.update_one({"id": archive_id}, {"$set": {"status": "complete"}})
+    manifest.pop("_id", None)
+    return manifest
+
+async def resume_archives(policies: Dict[str, Dict[str, int]], now: datetime) -> int:
+    """Reapply the hot-collection changes of archives whose pass was interrupted; they are idempotent"""
+    resumed = 0
+    async for manifest in db.archives.find({"status": "pending"}, {"_id": 0}):
+        docs = await asyncio.to_thread(read_archive, manifest)
+        cutoff = retention_cutoff(now, policies[manifest["collection"]]["days"])
+        await apply_hot_action(manifest["collection"], docs, manifest["id"], cutoff)
+        await db.archives.update_one({"id": manifest["id"]}, {"$set": {"status": "complete"}})
+        resumed += 1
+    return resumed
+
+async def apply_retention(now: Optional[datetime] = None, owner: Optional[str] = None) -> Dict[str, Any]:
+    """Archive documents past their collection's retention and shrink them in the hot collections.
     
-    data = []
-    base_time = datetime.now(timezone.utc) - timedelta(days=7)
+    Runs are archived whole once their logs are due for compaction, keep compacted logs until the
+    retention age and then only their summary. Quality results and processed data are archived
+    and deleted; quality trends keep their history in the hourly/daily buckets. Only one pass runs
+    per deployment (see retention_lease)."""
+    async with retention_lease(owner):
+        now = now or datetime.now(timezone.utc)
+        policies = await retention_policies()
+        report = {"started_at": now, "resumed": await resume_archives(policies, now), "collections": {}}
+        restored_before = now - ARCHIVE_RESTORE_HOLD
+        for collection, policy in policies.items():
+            time_field = RETENTION_TIME_FIELDS[collection]
+            cutoff = retention_cutoff(now, policy["days"])
+            archive_cutoff = cutoff
+            if collection == "pipeline_runs" and policy.get("compact_logs_days", 0) > 0:
+                compact_cutoff = retention_cutoff(now, policy["compact_logs_days"])
+                archive_cutoff = compact_cutoff if cutoff is None else max(cutoff, compact_cutoff)
+            counts = {"archived": 0, "archives": 0, "expired": 0}
+            if archive_cutoff is None:
+                report["collections"][collection] = counts
+                continue
+            
+            query = {time_field: {"$lt": archive_cutoff}, "archive_id": None}
+            if collection == "pipeline_runs":
+                query["status"] = {"$ne": "running"}
+            while docs := await db[collection].find(query, {"_id": 0}).sort(time_field, ASCENDING).limit(RETENTION_BATCH_SIZE).to_list(RETENTION_BATCH_SIZE):
+                await archive_batch(collection, docs, cutoff, archive_cutoff)
+                counts["archived"] += len(docs)
+                counts["archives"] += 1
+            
+            # Already archived documents that have since aged out: compacted runs and expired restores
+            if cutoff is not None:
+                expired = {time_field: {"$lt": cutoff}, "archive_id": {"$ne": None},
+                           "$or": [{"restored_at": None}, {"restored_at": {"$lt": restored_before}}]}
+                if collection == "pipeline_runs":
+                    expired["logs"] = {"$exists": True}
+                    counts["expired"] = await db[collection].count_documents(expired)
+                    await write_buffer.update_many(collection, expired, {"$unset": {"logs": "", "restored_at": ""}})
+                else:
+                    docs = await db[collection].find(expired, {"_id": 0}).to_list(None)
+                    counts["expired"] = len(docs)
+                    if docs:
+                        await apply_hot_action(collection, docs, None, cutoff)
+                await write_buffer.flush_collection(collection)
+            report["collections"][collection] = counts
+        report["finished_at"] = datetime.now(timezone.utc)
+        await db.retention_status.replace_one({"id": "last_run"}, {"id": "last_run", **report}, upsert=True)
+        return report
+
+async def search_archives(collection: str, start: Optional[datetime], end: Optional[datetime],
+                          match: Dict[str, str], limit: int) -> List[Dict[str, Any]]:
+    """Documents of the archives overlapping [start, end) that equal every `match` field, oldest first"""
+    query = {"collection": collection}
+    if start is not None:
+        query["end"] = {"$gte": start}
+    if end is not None:
+        query["start"] = {"$lt": end}
+    time_field = RETENTION_TIME_FIELDS[collection]
+    found = []
+    async for manifest in db.archives.find(query, {"_id": 0}).sort("start", ASCENDING):
+        for doc in await asyncio.to_thread(read_archive, manifest):
+            if start is not None and doc[time_field] < start or end is not None and doc[time_field] >= end:
+                continue
+            if all(doc.get(field) == value for field, value in match.items()):
+                found.append({**doc, "archive_id": manifest["id"]})
+                if len(found) >= limit:
+                    return found
+    return found
+
+async def restore_archive(archive_id: str) -> Dict[str, Any]:
+    """Put an archive's documents back in their hot collection, where they stay for ARCHIVE_RESTORE_HOLD"""
+    manifest = await db.archives.find_one({"id": archive_id}, {"_id": 0})
+    if not manifest:
+        raise HTTPException(status_code=404, detail="Archive not found")
+    collection = manifest["collection"]
+    docs = await asyncio.to_thread(read_archive, manifest)
+    now = datetime.now(timezone.utc)
+    for doc in docs:
+        storage = doc.get("storage") or {}
+        if storage.get("archive_path"):
+            # The archive path has hive-style pipeline_id=/date= directories, which must not become columns
+            table = await asyncio.to_thread(pq.read_table, str(ARCHIVE_DIR / storage["archive_path"]), partitioning=None)
+            await asyncio.to_thread(write_arrow_table, PROCESSED_DATA_DIR / storage["path"], table)
+            doc["storage"] = {k: v for k, v in storage.items() if k != "archive_path"}
+        doc.update(archive_id=archive_id, restored_at=now)
+        await write_buffer.update(collection, {"id": doc["id"]}, {"$set": doc}, upsert=True)
+    await write_buffer.flush_collection(collection)
+    await db.archives.update_one({"id": archive_id}, {"$set": {"restored_at": now}})
+    return {"archive_id": archive_id, "collection": collection, "restored": len(docs)}
+
+# ==================== SCHEDULER ====================
+
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+SCHEDULER_LEASE_SECONDS = float(os.environ.get('SCHEDULER_LEASE_SECONDS', '30'))
+SCHEDULER_SYNC_SECONDS = float(os.environ.get('SCHEDULER_SYNC_SECONDS', '60'))
+SCHEDULER_LEASE_ID = "pipeline-scheduler"
+SCHEDULED_RUN_OPTIONS = {"num_records": 100, "seed": None, "streaming": False, "chunk_size": 10000, "full_refresh": False,
+                         "partitions": PIPELINE_PARTITIONS}
+
+def parse_cron_field(field: str, low: int, high: int) -> List[int]:
+    values = set()
+    for part in field.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(v) for v in spec.split("-", 1))
+        else:
+            start = int(spec)
+            end = high if step else start
+        step = int(step) if step else 1
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Cron field '{field}' out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day-of-month month day-of-week), evaluated in UTC.
     
-    for i in range(num_records):
-        record = {
-            "record_id": f"REC_{i:06d}",
-            "plant_id": random.choice(plants),
-            "product": random.choice(products),
-            "production_volume": round(random.uniform(5000, 15000), 2),
-            "quality_score": round(random.uniform(85, 100), 2),
-            "downtime_minutes": random.randint(0, 120),
-            "batch_id": f"BATCH_{random.randint(1000, 9999)}",
-            "temperature": round(random.uniform(2, 8), 1),
-            "ph_level": round(random.uniform(2.8, 3.5), 2),
-            "timestamp": (base_time + timedelta(hours=i)).isoformat(),
-            "operator_id": f"OP_{random.randint(100, 999)}"
-        }
-        # Randomly add some data quality issues
-        if random.random() < 0.05:  # 5% missing values
-            record["quality_score"] = None
-        if random.random() < 0.03:  # 3% out of range
-            record["temperature"] = round(random.uniform(15, 25), 1)
-        
-        data.append(record)
+    Supports *, lists, ranges and steps. As in Vixie cron, when both day fields are restricted
+    a day matches if either does."""
+    
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields")
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = set(parse_cron_field(fields[2], 1, 31))
+        self.months = set(parse_cron_field(fields[3], 1, 12))
+        self.weekdays = {d % 7 for d in parse_cron_field(fields[4], 0, 7)}  # 0 and 7 are Sunday
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+        self.next_after(datetime.now(timezone.utc))  # rejects expressions that never fire, e.g. Feb 30
     
-    return data
+    def matches_day(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        dom = day.day in self.days
+        dow = day.isoweekday() % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return dom or dow
+        return (dom or not self.days_restricted) and (dow or not self.weekdays_restricted)
+    
+    def next_after(self, after: datetime) -> datetime:
+        """First fire time strictly after `after`"""
+        start = after.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(366 * 8):
+            if self.matches_day(day):
+                for hour in self.hours:
+                    if day == start.date() and hour < start.hour:
+                        continue
+                    for minute in self.minutes:
+                        candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=timezone.utc)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+def validate_schedule(expression: Optional[str]):
+    if expression:
+        try:
+            CronSchedule(expression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid schedule: {e}")
 
-def apply_transformations(data: List[Dict[str, Any]], transformations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Apply PySpark-style transformations to data"""
-    df = pd.DataFrame(data)
+class PipelineScheduler:
+    """Fires runs of active pipelines on their cron schedules.
     
-    for transform in transformations:
-        transform_type = transform.get("type")
-        
-        if transform_type == "filter":
-            condition = transform.get("condition")
-            if condition:
-                field = condition.get("field")
-                operator = condition.get("operator")
-                value = condition.get("value")
-                
-                if operator == ">": df = df[df[field] > value]
-                elif operator == "<": df = df[df[field] < value]
-                elif operator == "==": df = df[df[field] == value]
-                elif operator == "!=": df = df[df[field] != value]
+    Next fire times sit in a heap and the loop sleeps until the earliest one, a pipeline
+    change, or lease renewal. Only the process holding the Mongo lease fires, so several
+    uvicorn workers never double-fire. Runs missed while no leader was up are coalesced
+    into one, and a pipeline with a run still in progress skips its slot; runs orphaned by a
+    crashed process don't count (see fail_orphaned_runs). The leader also starts the periodic
+    retention pass."""
+    
+    def __init__(self, lease_seconds: float, sync_seconds: float):
+        self.lease_seconds = lease_seconds
+        self.sync_seconds = sync_seconds
+        self.owner = str(uuid.uuid4())
+        self.is_leader = False
+        self.heap: List[tuple] = []  # (fire_at, pipeline_id, generation)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.generation = 0
+        self.last_sync = 0.0
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.retention_task: Optional[asyncio.Task] = None
+        self.last_retention = 0.0
+        self.counters = {"fired": 0, "coalesced": 0, "skipped_overlap": 0, "errors": 0}
+    
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.last_retention = time.monotonic()  # first pass one interval after startup
+        self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        for task in (self.task, self.retention_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.task = self.retention_task = None
+        if self.is_leader:
+            await db.scheduler_leases.delete_one({"id": SCHEDULER_LEASE_ID, "owner": self.owner})
+            self.is_leader = False
+    
+    async def refresh(self, pipeline_id: str):
+        """Pick up a created, updated or deleted pipeline right away (other workers' changes arrive with the next sync)"""
+        if not self.is_leader:
+            return
+        doc = await db.pipelines.find_one({"id": pipeline_id}, {"_id": 0, "id": 1, "schedule": 1, "status": 1})
+        if doc and doc.get("status") == "active" and doc.get("schedule"):
+            self._track(pipeline_id, doc["schedule"])
+        else:
+            self.entries.pop(pipeline_id, None)
+        self.wakeup.set()
+    
+    def stats(self) -> Dict[str, Any]:
+        scheduled = sorted(({"pipeline_id": pid, "schedule": e["cron"].expression, "next_fire_at": e["next"]}
+                            for pid, e in self.entries.items()), key=lambda e: e["next_fire_at"])
+        return {"leader": self.is_leader, "owner": self.owner, "scheduled": scheduled, **self.counters}
+    
+    def _track(self, pipeline_id: str, expression: str, last_fired_at: Optional[datetime] = None):
+        """(Re)schedule a pipeline; an unchanged expression keeps its pending fire time"""
+        entry = self.entries.get(pipeline_id)
+        if entry and entry["cron"].expression == expression:
+            return
+        try:
+            cron = CronSchedule(expression)  # also rejects expressions that never fire
+        except ValueError as e:
+            logger.warning("Not scheduling pipeline %s: %s", pipeline_id, e)
+            self.entries.pop(pipeline_id, None)
+            return
+        self.generation += 1
+        fire_at = cron.next_after(last_fired_at or datetime.now(timezone.utc))
+        self.entries[pipeline_id] = {"cron": cron, "next": fire_at, "generation": self.generation}
+        heapq.heappush(self.heap, (fire_at, pipeline_id, self.generation))
+    
+    async def _sync(self, resume: bool):
+        """Reload scheduled pipelines. On taking over leadership (`resume`), fire times continue from
+        the last persisted fire so slots missed during downtime are caught up."""
+        docs = await db.pipelines.find({"status": "active", "schedule": {"$nin": [None, ""]}},
+                                       {"_id": 0, "id": 1, "schedule": 1}).to_list(None)
+        state = {}
+        if resume:
+            state = {s["id"]: s async for s in db.pipeline_schedules.find({}, {"_id": 0})}
         
-        elif transform_type == "aggregate":
-            group_by = transform.get("group_by", [])
-            agg_func = transform.get("function", "sum")
-            agg_field = transform.get("field")
-            
-            if group_by and agg_field:
-                if agg_func == "sum":
-                    df = df.groupby(group_by)[agg_field].sum().reset_index()
-                elif agg_func == "avg":
-                    df = df.groupby(group_by)[agg_field].mean().reset_index()
-                elif agg_func == "count":
-                    df = df.groupby(group_by)[agg_field].count().reset_index()
+        active = set()
+        for doc in docs:
+            active.add(doc["id"])
+            last = state.get(doc["id"])
+            resume_from = last["last_fired_at"] if last and last.get("schedule") == doc["schedule"] else None
+            self._track(doc["id"], doc["schedule"], resume_from)
+        for pipeline_id in set(self.entries) - active:
+            del self.entries[pipeline_id]
+        self.last_sync = time.monotonic()
+    
+    async def _hold_lease(self) -> bool:
+        """Acquire or renew the leader lease; a live lease held by another process wins"""
+        return await take_lease(SCHEDULER_LEASE_ID, self.owner, self.lease_seconds)
+    
+    async def _fire(self, pipeline_id: str, entry: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        cron = entry["cron"]
+        # Coalesce every slot that is already due into this one run
+        slot, missed = entry["next"], 0
+        while missed < 1000 and (slot := cron.next_after(slot)) <= now:
+            missed += 1
+        self.counters["coalesced"] += missed
         
-        elif transform_type == "remove_nulls":
-            df = df.dropna()
+        entry["next"] = cron.next_after(now)
+        heapq.heappush(self.heap, (entry["next"], pipeline_id, entry["generation"]))
+        # Persist before submitting so a new leader never fires the same slots again
+        await db.pipeline_schedules.update_one(
+            {"id": pipeline_id},
+            {"$set": {"id": pipeline_id, "schedule": cron.expression, "last_fired_at": now}}, upsert=True)
         
-        elif transform_type == "deduplicate":
-            key_fields = transform.get("key_fields", [])
-            if key_fields:
-                df = df.drop_duplicates(subset=key_fields)
+        await fail_orphaned_runs(pipeline_id)
+        if await db.pipeline_runs.find_one({"pipeline_id": pipeline_id, "status": "running"}, {"_id": 1}):
+            self.counters["skipped_overlap"] += 1
+            logger.info("Skipping scheduled run of pipeline %s: previous run still in progress", pipeline_id)
+            return
+        pipeline = await db.pipelines.find_one({"id": pipeline_id, "status": "active"}, {"_id": 0})
+        if not pipeline:
+            self.entries.pop(pipeline_id, None)
+            return
+        try:
+            await pipeline_jobs.submit(pipeline, SCHEDULED_RUN_OPTIONS, trigger=f"schedule {cron.expression}")
+            self.counters["fired"] += 1
+        except HTTPException as e:
+            self.counters["errors"] += 1
+            logger.error("Scheduled run of pipeline %s not queued: %s", pipeline_id, e.detail)
     
-    return df.to_dict('records')
+    async def _retain(self):
+        try:
+            report = await apply_retention()
+            logger.info("Retention pass archived %s",
+                        {c: counts["archived"] for c, counts in report["collections"].items()})
+        except RetentionInProgress as e:
+            logger.info("Retention pass skipped: %s", e)
+        except Exception:
+            logger.exception("Retention pass failed")
+    
+    async def _run(self):
+        renew_every = self.lease_seconds / 3
+        last_renew = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_renew >= renew_every:
+                    was_leader, self.is_leader = self.is_leader, await self._hold_lease()
+                    last_renew = time.monotonic()
+                    if self.is_leader and not was_leader:
+                        logger.info("Scheduler %s is now the leader", self.owner)
+                        await fail_orphaned_runs()
+                        await self._sync(resume=True)
+                    elif was_leader and not self.is_leader:
+                        logger.warning("Scheduler %s lost the leader lease", self.owner)
+                        self.entries.clear()
+                        self.heap.clear()
+                
+                if self.is_leader:
+                    if time.monotonic() - self.last_sync >= self.sync_seconds:
+                        await self._sync(resume=False)
+                    now = datetime.now(timezone.utc)
+                    while self.heap and self.heap[0][0] <= now:
+                        _, pipeline_id, generation = heapq.heappop(self.heap)
+                        entry = self.entries.get(pipeline_id)
+                        if entry and entry["generation"] == generation:
+                            await self._fire(pipeline_id, entry)
+                    if (RETENTION_INTERVAL_SECONDS > 0 and time.monotonic() - self.last_retention >= RETENTION_INTERVAL_SECONDS
+                            and (self.retention_task is None or self.retention_task.done())):
+                        self.last_retention = time.monotonic()
+                        self.retention_task = asyncio.create_task(self._retain())
+                
+                timeout = renew_every - (time.monotonic() - last_renew)
+                if self.heap:
+                    timeout = min(timeout, (self.heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+                self.wakeup.clear()
+                sleeper = asyncio.ensure_future(self.wakeup.wait())
+                try:
+                    await asyncio.wait([sleeper], timeout=max(timeout, 0.05))
+                finally:
+                    sleeper.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler iteration failed")
+                await asyncio.sleep(1)
 
-def validate_data(data: List[Dict[str, Any]], rules: List[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    """Validate data against quality rules"""
-    results = []
+pipeline_scheduler = PipelineScheduler(SCHEDULER_LEASE_SECONDS, SCHEDULER_SYNC_SECONDS)
+
+# ==================== PAGINATION ====================
+
+PAGE_MAX_LIMIT = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_BATCH_SIZE = 500
+
+def encode_cursor(doc: Dict[str, Any], sort_field: str) -> str:
+    """Opaque cursor pointing just past `doc` in (sort_field, id) order"""
+    value = doc.get(sort_field)
+    token = {"v": value.isoformat(), "dt": True} if isinstance(value, datetime) else {"v": value}
+    return base64.urlsafe_b64encode(orjson.dumps({**token, "id": doc["id"]})).decode()
+
+def keyset_filter(sort_field: str, direction: int, cursor: Optional[str]) -> Dict[str, Any]:
+    if cursor is None:
+        return {}
+    try:
+        token = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = datetime.fromisoformat(token["v"]) if token.get("dt") else token["v"]
+        doc_id = token["id"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    op = "$lt" if direction == DESCENDING else "$gt"
+    return {"$or": [{sort_field: {op: value}}, {sort_field: value, "id": {op: doc_id}}]}
+
+async def ndjson_lines(cursor) -> AsyncIterator[bytes]:
+    async for doc in cursor:
+        yield orjson.dumps(doc, default=json_default, option=orjson.OPT_APPEND_NEWLINE)
+
+async def list_documents(request: Request, collection: str, sort_field: str, direction: int,
+                         limit: Optional[int], cursor: Optional[str], default_limit: int) -> Response:
+    """Keyset-paginated listing ordered by (sort_field, id).
     
-    for rule in rules:
-        rule_type = rule.get("rule_type")
-        field = rule.get("field")
-        condition = rule.get("condition")
-        
-        total_records = len(data)
-        failed_records = 0
-        
-        if rule_type == "completeness":
-            # Check for null/missing values
-            failed_records = sum(1 for record in data if record.get(field) is None or record.get(field) == "")
-        
-        elif rule_type == "accuracy":
-            # Check if values are within acceptable range
-            min_val = condition.get("min")
-            max_val = condition.get("max")
-            for record in data:
-                val = record.get(field)
-                if val is not None and (val < min_val or val > max_val):
-                    failed_records += 1
-        
-        elif rule_type == "consistency":
-            # Check if values match expected format/pattern
-            expected_pattern = condition.get("pattern")
-            for record in data:
-                val = str(record.get(field, ""))
-                if expected_pattern and not val.startswith(expected_pattern):
-                    failed_records += 1
-        
-        passed = failed_records == 0
-        quality_score = ((total_records - failed_records) / total_records * 100) if total_records > 0 else 0
-        
-        results.append({
-            "rule_id": rule.get("id"),
-            "rule_name": rule.get("name"),
-            "passed": passed,
-            "records_checked": total_records,
-            "records_failed": failed_records,
-            "quality_score": round(quality_score, 2)
-        })
+    JSON responses hold one page; X-Next-Cursor is set when more may follow. With
+    `Accept: application/x-ndjson` documents are streamed as the Motor cursor yields them,
+    through the end of the collection unless a limit is given. Documents were validated
+    by their model when written, so they are serialized as stored."""
+    if limit is not None and not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    query = db[collection].find(keyset_filter(sort_field, direction, cursor), {"_id": 0}).sort([(sort_field, direction), ("id", direction)])
     
-    overall_score = sum(r["quality_score"] for r in results) / len(results) if results else 100
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        if limit is not None:
+            query = query.limit(limit)
+        return StreamingResponse(ndjson_lines(query.batch_size(NDJSON_BATCH_SIZE)), media_type=NDJSON_MEDIA_TYPE)
     
-    return results, {"overall_quality_score": round(overall_score, 2)}
+    limit = limit or default_limit
+    docs = await query.limit(limit).to_list(limit)
+    headers = {"X-Next-Cursor": encode_cursor(docs[-1], sort_field)} if len(docs) == limit else None
+    return FastJSONResponse(docs, headers=headers)
 
 # ==================== API ENDPOINTS ====================
 
@@ -252,303 +3997,488 @@ async def root():
 # Data Sources
 @api_router.post("/data-sources", response_model=DataSource)
 async def create_data_source(source: DataSourceCreate):
+    try:
+        validate_source_config(source.config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     source_obj = DataSource(**source.model_dump())
     doc = source_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.data_sources.insert_one(doc)
+    await rollup_counters({"total_sources": 1})
     return source_obj
 
 @api_router.get("/data-sources", response_model=List[DataSource])
-async def get_data_sources():
-    sources = await db.data_sources.find({}, {"_id": 0}).to_list(1000)
-    for s in sources:
-        if isinstance(s['created_at'], str):
-            s['created_at'] = datetime.fromisoformat(s['created_at'])
-    return sources
+async def get_data_sources(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    return await list_documents(request, "data_sources", "created_at", ASCENDING, limit, cursor, default_limit=1000)
 
 # Pipelines
 @api_router.post("/pipelines", response_model=Pipeline)
 async def create_pipeline(pipeline: PipelineCreate):
+    validate_schedule(pipeline.schedule)
     pipeline_obj = Pipeline(**pipeline.model_dump())
     doc = pipeline_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.pipelines.insert_one(doc)
+    await rollup_counters({"total_pipelines": 1, "active_pipelines": int(pipeline_obj.status == "active")})
+    await pipeline_scheduler.refresh(pipeline_obj.id)
     return pipeline_obj
 
 @api_router.get("/pipelines", response_model=List[Pipeline])
-async def get_pipelines():
-    pipelines = await db.pipelines.find({}, {"_id": 0}).to_list(1000)
-    for p in pipelines:
-        if isinstance(p['created_at'], str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-        if isinstance(p['updated_at'], str):
-            p['updated_at'] = datetime.fromisoformat(p['updated_at'])
-    return pipelines
+async def get_pipelines(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    return await list_documents(request, "pipelines", "created_at", ASCENDING, limit, cursor, default_limit=1000)
 
 @api_router.get("/pipelines/{pipeline_id}", response_model=Pipeline)
 async def get_pipeline(pipeline_id: str):
     pipeline = await db.pipelines.find_one({"id": pipeline_id}, {"_id": 0})
     if not pipeline:
         raise HTTPException(status_code=404, detail="Pipeline not found")
-    if isinstance(pipeline['created_at'], str):
-        pipeline['created_at'] = datetime.fromisoformat(pipeline['created_at'])
-    if isinstance(pipeline['updated_at'], str):
-        pipeline['updated_at'] = datetime.fromisoformat(pipeline['updated_at'])
     return pipeline
 
 @api_router.put("/pipelines/{pipeline_id}", response_model=Pipeline)
 async def update_pipeline(pipeline_id: str, updates: Dict[str, Any]):
-    updates['updated_at'] = datetime.now(timezone.utc).isoformat()
-    result = await db.pipelines.update_one({"id": pipeline_id}, {"$set": updates})
-    if result.matched_count == 0:
+    validate_schedule(updates.get('schedule'))
+    updates['updated_at'] = datetime.now(timezone.utc)
+    before = await db.pipelines.find_one_and_update({"id": pipeline_id}, {"$set": updates}, projection={"_id": 0, "status": 1})
+    if before is None:
         raise HTTPException(status_code=404, detail="Pipeline not found")
+    if 'status' in updates:
+        delta = int(updates['status'] == "active") - int(before.get('status') == "active")
+        if delta:
+            await rollup_counters({"active_pipelines": delta})
+    await pipeline_scheduler.refresh(pipeline_id)
     return await get_pipeline(pipeline_id)
 
 @api_router.delete("/pipelines/{pipeline_id}")
 async def delete_pipeline(pipeline_id: str):
-    result = await db.pipelines.delete_one({"id": pipeline_id})
-    if result.deleted_count == 0:
+    deleted = await db.pipelines.find_one_and_delete({"id": pipeline_id}, projection={"_id": 0, "status": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Pipeline not found")
+    await rollup_counters({"total_pipelines": -1, "active_pipelines": -int(deleted.get('status') == "active")})
+    await pipeline_scheduler.refresh(pipeline_id)
     return {"message": "Pipeline deleted successfully"}
 
 # Pipeline Execution
-@api_router.post("/pipelines/{pipeline_id}/execute")
-async def execute_pipeline(pipeline_id: str):
-    """Execute a pipeline and run ETL process"""
+@api_router.post("/pipelines/{pipeline_id}/execute", response_model=PipelineRun)
+async def execute_pipeline(pipeline_id: str, num_records: int = 100, seed: Optional[int] = None,
+                           streaming: bool = False, chunk_size: int = 10000, full_refresh: bool = False,
+                           partitions: int = PIPELINE_PARTITIONS):
+    """Queue a pipeline run; the ETL work happens in the background worker pool.
+    
+    Runs only process source records past the pipeline's watermark, or files it hasn't ingested yet;
+    `full_refresh` reprocesses everything. `num_records` and `seed` apply to the simulated source only.
+    `partitions` > 1 splits each large chunk's transforms across that many worker processes."""
     pipeline = await db.pipelines.find_one({"id": pipeline_id}, {"_id": 0})
     if not pipeline:
         raise HTTPException(status_code=404, detail="Pipeline not found")
+    if streaming and chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    if partitions <= 0:
+        raise HTTPException(status_code=400, detail="partitions must be positive")
     
-    # Create pipeline run
-    run = PipelineRun(
-        pipeline_id=pipeline_id,
-        pipeline_name=pipeline['name'],
-        status="running",
-        start_time=datetime.now(timezone.utc),
-        logs=[]
-    )
+    options = {"num_records": num_records, "seed": seed, "streaming": streaming, "chunk_size": chunk_size,
+               "full_refresh": full_refresh, "partitions": partitions}
+    return await pipeline_jobs.submit(pipeline, options)
+
+@api_router.post("/pipelines/batch-execute")
+async def batch_execute_pipelines(request: PipelineBatchExecute):
+    """Queue runs of several pipelines, scanning each source they read only once.
     
-    try:
-        # Step 1: Generate/Ingest data
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "INFO", "message": "Starting data ingestion..."})
-        raw_data = generate_plant_data(num_records=100)
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "INFO", "message": f"Ingested {len(raw_data)} records"})
-        
-        # Step 2: Apply transformations
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "INFO", "message": "Applying transformations..."})
-        transformations = pipeline.get('transformations', [])
-        transformed_data = apply_transformations(raw_data, transformations)
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "INFO", "message": f"Transformed to {len(transformed_data)} records"})
-        
-        # Step 3: Data quality validation
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "INFO", "message": "Running data quality checks..."})
-        quality_rules = await db.quality_rules.find({"active": True}, {"_id": 0}).to_list(100)
-        validation_results, quality_metrics = validate_data(transformed_data, quality_rules)
-        
-        # Save quality results
-        for result in validation_results:
-            quality_result = DataQualityResult(
-                pipeline_run_id=run.id,
-                **result
-            )
-            doc = quality_result.model_dump()
-            doc['timestamp'] = doc['timestamp'].isoformat()
-            await db.quality_results.insert_one(doc)
-        
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "INFO", "message": f"Quality score: {quality_metrics['overall_quality_score']}%"})
-        
-        # Step 4: Save processed data
-        processed = ProcessedData(
-            pipeline_run_id=run.id,
-            data=transformed_data[:50],  # Store sample for querying
-            metadata={"total_records": len(transformed_data), "quality_metrics": quality_metrics}
-        )
-        doc = processed.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
-        await db.processed_data.insert_one(doc)
-        
-        run.status = "success"
-        run.end_time = datetime.now(timezone.utc)
-        run.records_processed = len(transformed_data)
-        run.metrics = quality_metrics
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "SUCCESS", "message": "Pipeline completed successfully"})
-        
-    except Exception as e:
-        run.status = "failed"
-        run.end_time = datetime.now(timezone.utc)
-        run.error_message = str(e)
-        run.logs.append({"timestamp": datetime.now(timezone.utc).isoformat(), "level": "ERROR", "message": f"Pipeline failed: {str(e)}"})
+    Pipelines are grouped by source; each group runs as one job that ingests the source once,
+    loads the quality rules once and fans every chunk out to each pipeline's transformations.
+    Every pipeline still gets its own run, output, quality results and watermark."""
+    pipeline_ids = list(dict.fromkeys(request.pipeline_ids))
+    if not pipeline_ids:
+        raise HTTPException(status_code=400, detail="pipeline_ids must not be empty")
+    partitions = PIPELINE_PARTITIONS if request.partitions is None else request.partitions
+    if request.streaming and request.chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    if partitions <= 0:
+        raise HTTPException(status_code=400, detail="partitions must be positive")
+    found = {p["id"]: p for p in await db.pipelines.find({"id": {"$in": pipeline_ids}}, {"_id": 0}).to_list(None)}
+    missing = [pipeline_id for pipeline_id in pipeline_ids if pipeline_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Pipelines not found: {', '.join(missing)}")
     
-    # Save pipeline run
-    run_doc = run.model_dump()
-    run_doc['start_time'] = run_doc['start_time'].isoformat()
-    if run_doc['end_time']:
-        run_doc['end_time'] = run_doc['end_time'].isoformat()
-    await db.pipeline_runs.insert_one(run_doc)
+    groups = {}
+    for pipeline_id in pipeline_ids:
+        groups.setdefault(found[pipeline_id].get("source_id"), []).append(found[pipeline_id])
+    options = {"num_records": request.num_records, "seed": request.seed, "streaming": request.streaming,
+               "chunk_size": request.chunk_size, "full_refresh": request.full_refresh, "partitions": partitions}
+    batches = []
+    # Capacity for every group is claimed up front, so the request is queued whole or not at all
+    with pipeline_jobs.reserve(len(pipeline_ids)) as slots:
+        for source_id, pipelines in groups.items():
+            if len(pipelines) == 1:
+                runs = [await pipeline_jobs.submit(pipelines[0], options, slots=slots)]
+            else:
+                runs = await pipeline_jobs.submit_batch(pipelines, options, slots=slots)
+            batches.append({"source_id": source_id, "runs": runs})
+    return {"batches": batches}
+
+@api_router.get("/pipelines/{pipeline_id}/explain")
+async def explain_pipeline(pipeline_id: str, num_records: int = 100):
+    """Show the optimized transformation plan and estimated row counts for a pipeline"""
+    pipeline = await db.pipelines.find_one({"id": pipeline_id}, {"_id": 0})
+    if not pipeline:
+        raise HTTPException(status_code=404, detail="Pipeline not found")
+    source = await db.data_sources.find_one({"id": pipeline.get("source_id")}, {"_id": 0, "config": 1}) or {}
+    stats = source_stats({"source_config": source.get("config")})
+    return {"pipeline_id": pipeline_id,
+            **explain_transformations(pipeline.get('transformations', []), num_records, stats)}
+
+@api_router.get("/pipelines/{pipeline_id}/sketches")
+async def get_pipeline_sketches(pipeline_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                percentile: Optional[float] = None):
+    """Approximate distinct counts and percentiles per group over the runs in [start, end).
     
-    return run
+    Merges the sketches each run persisted, so no rows are rescanned; `percentile` overrides the
+    pipeline's own for approx_percentile aggregates."""
+    if percentile is not None and not 0 <= percentile <= 1:
+        raise HTTPException(status_code=400, detail="percentile must be between 0 and 1")
+    query = {"pipeline_id": pipeline_id}
+    if start is not None or end is not None:
+        query["timestamp"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    docs = await db.aggregate_sketches.find(query, {"_id": 0}).to_list(None)
+    return await asyncio.to_thread(combine_sketch_documents, docs, percentile)
+
+@api_router.get("/scheduler")
+async def get_scheduler_status():
+    """Leader status, upcoming fire times and fired/coalesced/skipped counters"""
+    return pipeline_scheduler.stats()
+
+@api_router.get("/pipeline-jobs")
+async def get_pipeline_jobs():
+    """Current worker pool and queue occupancy"""
+    return {**pipeline_jobs.stats(), "events": run_events.stats()}
+
+# Admin
+@api_router.post("/admin/indexes")
+async def provision_indexes():
+    """Create any missing indexes"""
+    return await ensure_indexes()
+
+@api_router.get("/admin/query-audit")
+async def query_audit():
+    """Explain every query shape the API issues and flag collection scans"""
+    report = await audit_query_shapes()
+    return {"shapes": report, "scanning": [r for r in report if r.get("collection_scan") or r.get("in_memory_sort")]}
+
+@api_router.post("/admin/rollups/rebuild")
+async def rebuild_rollups():
+    """Recompute the dashboard rollups from run history"""
+    return await rebuild_dashboard_rollups()
+
+@api_router.post("/admin/quality-buckets/rebuild")
+async def rebuild_quality_trends():
+    """Recompute the hourly and daily quality buckets from the individual quality results"""
+    return await rebuild_quality_buckets()
+
+@api_router.get("/admin/retention")
+async def get_retention():
+    """Retention policy per collection and the report of the last pass"""
+    return {"policies": await retention_policies(),
+            "last_run": await db.retention_status.find_one({"id": "last_run"}, {"_id": 0, "id": 0})}
+
+@api_router.put("/admin/retention/{collection}")
+async def update_retention_policy(collection: str, policy: RetentionPolicyUpdate):
+    """Override a collection's retention days (0 keeps documents hot forever)"""
+    if collection not in RETENTION_DEFAULTS:
+        raise HTTPException(status_code=404, detail=f"No retention policy for {collection}")
+    update = {k: v for k, v in policy.model_dump().items() if v is not None and k in RETENTION_DEFAULTS[collection]}
+    if any(v < 0 for v in update.values()):
+        raise HTTPException(status_code=400, detail="Retention days must not be negative")
+    await db.retention_policies.update_one({"id": collection}, {"$set": {"id": collection, **update}}, upsert=True)
+    return (await retention_policies())[collection]
+
+@api_router.post("/admin/retention/run")
+async def run_retention():
+    """Archive everything past its retention now instead of waiting for the scheduled pass"""
+    try:
+        return await apply_retention()
+    except RetentionInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@api_router.get("/archives")
+async def list_archives(collection: Optional[str] = None, limit: int = 100):
+    """Archive manifests, oldest data first"""
+    query = {"collection": collection} if collection else {}
+    return await db.archives.find(query, {"_id": 0}).sort("start", ASCENDING).limit(min(limit, 1000)).to_list(None)
+
+@api_router.get("/archives/search")
+async def search_archived_documents(collection: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                    id: Optional[str] = None, pipeline_id: Optional[str] = None,
+                                    pipeline_run_id: Optional[str] = None, rule_id: Optional[str] = None,
+                                    limit: int = 100):
+    """Read archived documents in [start, end) without restoring them, e.g. for audits"""
+    if collection not in RETENTION_TIME_FIELDS:
+        raise HTTPException(status_code=404, detail=f"No archives for {collection}")
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    start, end = (to_utc(t) if t else None for t in (start, end))
+    match = {k: v for k, v in {"id": id, "pipeline_id": pipeline_id, "pipeline_run_id": pipeline_run_id,
+                               "rule_id": rule_id}.items() if v is not None}
+    return await search_archives(collection, start, end, match, min(limit, 1000))
+
+@api_router.post("/archives/{archive_id}/restore")
+async def restore_archived_documents(archive_id: str):
+    """Copy an archive's documents back into their hot collection for a while"""
+    return await restore_archive(archive_id)
+
+@api_router.post("/admin/migrate-datetimes")
+async def run_datetime_migration():
+    """Convert ISO-string datetime fields left by older versions to native BSON dates"""
+    return await migrate_datetimes()
+
+# Write Buffer
+@api_router.get("/write-buffer")
+async def get_write_buffer_stats():
+    """Pending buffered writes, bulk round trips so far and recent per-document errors"""
+    return write_buffer.stats()
+
+@api_router.post("/write-buffer/flush")
+async def flush_write_buffer():
+    return await write_buffer.flush()
 
 # Pipeline Runs
 @api_router.get("/pipeline-runs", response_model=List[PipelineRun])
-async def get_pipeline_runs(limit: int = 50):
-    runs = await db.pipeline_runs.find({}, {"_id": 0}).sort("start_time", -1).limit(limit).to_list(limit)
-    for r in runs:
-        if isinstance(r['start_time'], str):
-            r['start_time'] = datetime.fromisoformat(r['start_time'])
-        if r.get('end_time') and isinstance(r['end_time'], str):
-            r['end_time'] = datetime.fromisoformat(r['end_time'])
-    return runs
+async def get_pipeline_runs(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    return await list_documents(request, "pipeline_runs", "start_time", DESCENDING, limit, cursor, default_limit=50)
 
 @api_router.get("/pipeline-runs/{run_id}", response_model=PipelineRun)
 async def get_pipeline_run(run_id: str):
     run = await db.pipeline_runs.find_one({"id": run_id}, {"_id": 0})
     if not run:
         raise HTTPException(status_code=404, detail="Pipeline run not found")
-    if isinstance(run['start_time'], str):
-        run['start_time'] = datetime.fromisoformat(run['start_time'])
-    if run.get('end_time') and isinstance(run['end_time'], str):
-        run['end_time'] = datetime.fromisoformat(run['end_time'])
     return run
 
+def run_event_json(event: Optional[Dict[str, Any]]) -> str:
+    return orjson.dumps(event if event is not None else {"type": "heartbeat"}, default=json_default).decode()
+
+@api_router.get("/pipeline-runs/{run_id}/events")
+async def stream_pipeline_run_events(run_id: str, request: Request, offset: Optional[int] = None):
+    """Server-Sent Events feed of a run's log entries and progress, ending when the run finishes.
+    
+    Log events carry their offset as the event id, so a reconnecting EventSource resumes
+    after the last entry it saw; `offset` overrides that."""
+    if not await db.pipeline_runs.find_one({"id": run_id}, {"_id": 0, "id": 1}):
+        raise HTTPException(status_code=404, detail="Pipeline run not found")
+    if offset is None:
+        last_id = request.headers.get("last-event-id", "")
+        offset = int(last_id) + 1 if last_id.isdigit() else 0
+    
+    async def events():
+        async for event in iter_run_events(run_id, max(offset, 0)):
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            event_id = f"id: {event['offset']}\n" if event["type"] == "log" else ""
+            yield f"event: {event['type']}\n{event_id}data: {run_event_json(event)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.websocket("/pipeline-runs/{run_id}/ws")
+async def pipeline_run_events_socket(websocket: WebSocket, run_id: str, offset: int = 0):
+    """The /events feed over a WebSocket, one JSON message per event"""
+    await websocket.accept()
+    if not await db.pipeline_runs.find_one({"id": run_id}, {"_id": 0, "id": 1}):
+        await websocket.close(code=4404, reason="Pipeline run not found")
+        return
+    try:
+        async for event in iter_run_events(run_id, max(offset, 0)):
+            await websocket.send_text(run_event_json(event))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@api_router.post("/pipeline-runs/{run_id}/cancel")
+async def cancel_pipeline_run(run_id: str):
+    state = await pipeline_jobs.cancel(run_id)
+    if state is None:
+        if not await db.pipeline_runs.find_one({"id": run_id}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=404, detail="Pipeline run not found")
+        raise HTTPException(status_code=409, detail="Pipeline run is not queued or running")
+    if state == "queued":
+        return {"message": "Queued pipeline run cancelled", "status": "cancelled"}
+    return {"message": "Cancellation requested for running pipeline run", "status": "running"}
+
 # Data Quality Rules
 @api_router.post("/quality-rules", response_model=DataQualityRule)
 async def create_quality_rule(rule: DataQualityRuleCreate):
     rule_obj = DataQualityRule(**rule.model_dump())
     doc = rule_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.quality_rules.insert_one(doc)
     return rule_obj
 
 @api_router.get("/quality-rules", response_model=List[DataQualityRule])
-async def get_quality_rules():
-    rules = await db.quality_rules.find({}, {"_id": 0}).to_list(1000)
-    for r in rules:
-        if isinstance(r['created_at'], str):
-            r['created_at'] = datetime.fromisoformat(r['created_at'])
-    return rules
+async def get_quality_rules(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    return await list_documents(request, "quality_rules", "created_at", ASCENDING, limit, cursor, default_limit=1000)
 
 @api_router.put("/quality-rules/{rule_id}", response_model=DataQualityRule)
 async def update_quality_rule(rule_id: str, updates: Dict[str, Any]):
     result = await db.quality_rules.update_one({"id": rule_id}, {"$set": updates})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Quality rule not found")
-    rule = await db.quality_rules.find_one({"id": rule_id}, {"_id": 0})
-    if isinstance(rule['created_at'], str):
-        rule['created_at'] = datetime.fromisoformat(rule['created_at'])
-    return rule
+    return await db.quality_rules.find_one({"id": rule_id}, {"_id": 0})
 
 # Quality Results
 @api_router.get("/quality-results")
-async def get_quality_results(limit: int = 100):
-    results = await db.quality_results.find({}, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
-    for r in results:
-        if isinstance(r['timestamp'], str):
-            r['timestamp'] = datetime.fromisoformat(r['timestamp'])
-    return results
+async def get_quality_results(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    return await list_documents(request, "quality_results", "timestamp", DESCENDING, limit, cursor, default_limit=100)
+
+@api_router.get("/quality-trends")
+async def get_quality_trends(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             resolution: str = "hour", rule_id: Optional[str] = None):
+    """Quality score per rule over [start, end): min/avg/max per hour or day, or the raw points.
+    
+    Reads only the hourly or daily buckets overlapping the range; it defaults to the last
+    6 hours (raw), 2 days (hour) or 30 days (day)."""
+    if resolution not in QUALITY_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(QUALITY_RESOLUTIONS)}")
+    collection, width, default_range = QUALITY_RESOLUTIONS[resolution]
+    # Naive bounds are taken as UTC
+    end = to_utc(end) if end else datetime.now(timezone.utc)
+    start = to_utc(start) if start else end - default_range
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    query = {"start": {"$gte": bucket_start(start, width), "$lt": end}}
+    if rule_id:
+        query = {"rule_id": rule_id, **query}
+    projection = {"_id": 0} if resolution == "raw" else {"_id": 0, "points": 0}
+    buckets = await db[collection].find(query, projection).sort("start", ASCENDING).to_list(None)
+    return {"resolution": resolution, "start": start, "end": end, "series": trend_series(buckets, resolution, start, end)}
 
 # Analytics
 @api_router.post("/analytics/query")
 async def execute_query(query_request: Dict[str, Any]):
     """Execute SQL-like queries on processed data"""
     try:
-        # Get recent processed data
-        processed_data = await db.processed_data.find({}, {"_id": 0}).sort("timestamp", -1).limit(10).to_list(10)
-        
-        # Combine all data
-        all_data = []
-        for pd_item in processed_data:
-            all_data.extend(pd_item.get('data', []))
-        
-        if not all_data:
-            return {"columns": [], "rows": [], "row_count": 0}
-        
-        # Convert to DataFrame for easier querying
-        df = pd.DataFrame(all_data)
-        
-        # Simple query execution (support basic operations)
-        query_type = query_request.get('type', 'select_all')
-        
-        if query_type == 'select_all':
-            result_df = df
-        elif query_type == 'group_by':
-            group_field = query_request.get('group_field')
-            agg_field = query_request.get('agg_field')
-            agg_func = query_request.get('agg_func', 'sum')
-            if group_field and agg_field:
-                if agg_func == 'sum':
-                    result_df = df.groupby(group_field)[agg_field].sum().reset_index()
-                elif agg_func == 'avg':
-                    result_df = df.groupby(group_field)[agg_field].mean().reset_index()
-                elif agg_func == 'count':
-                    result_df = df.groupby(group_field)[agg_field].count().reset_index()
-            else:
-                result_df = df
-        else:
-            result_df = df
-        
-        # Limit results
-        result_df = result_df.head(100)
-        
-        return {
-            "columns": result_df.columns.tolist(),
-            "rows": result_df.to_dict('records'),
-            "row_count": len(result_df)
-        }
+        query = parse_analytics_query(query_request)
+        version = await data_version("processed_data")
+        cached = analytics_cache.get(version, query)
+        if cached is not None:
+            return FastJSONResponse(cached)
+        result = await run_analytics_query(query)
+        analytics_cache.put(version, query, result)
+        return FastJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Query execution failed: {str(e)}")
 
+@api_router.get("/analytics/cache")
+async def get_analytics_cache_stats():
+    """Result cache size, data version and hit/miss/eviction counters"""
+    return analytics_cache.stats()
+
+@api_router.post("/analytics/cache/clear")
+async def clear_analytics_cache():
+    analytics_cache.clear()
+    return analytics_cache.stats()
+
+async def run_analytics_query(query: Dict[str, Any]) -> Dict[str, Any]:
+    # Recent runs, without their samples: stored outputs are read from the columnar store,
+    # the rest is aggregated inside Mongo so only result rows cross the wire
+    runs = await db.processed_data.find({}, {"_id": 0, "data": 0}).sort("timestamp", -1).limit(ANALYTICS_WINDOW_RUNS).to_list(ANALYTICS_WINDOW_RUNS)
+    if not runs:
+        return {"columns": [], "rows": [], "row_count": 0}
+    
+    in_mongo = [run['id'] for run in runs if not has_stored_output(run)]
+    pipeline = analytics_pipeline(query, in_mongo)
+    if pipeline is not None:
+        try:
+            mongo_rows = await db.processed_data.aggregate(pipeline).to_list(None) if in_mongo else []
+            return await asyncio.to_thread(finish_analytics_query, query, runs, mongo_rows)
+        except OperationFailure as e:
+            logger.warning(f"Analytics pushdown failed, falling back to pandas: {e}")
+    
+    # Fallback for operations Mongo can't express: pull the samples and run the query in pandas
+    runs = await db.processed_data.find({}, {"_id": 0}).sort("timestamp", -1).limit(ANALYTICS_WINDOW_RUNS).to_list(ANALYTICS_WINDOW_RUNS)
+    return await asyncio.to_thread(pandas_analytics_query, query, runs)
+
 # Dashboard Stats
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
-    """Get dashboard overview statistics"""
-    # Total pipelines
-    total_pipelines = await db.pipelines.count_documents({})
-    active_pipelines = await db.pipelines.count_documents({"status": "active"})
-    
-    # Recent runs
-    recent_runs = await db.pipeline_runs.find({}, {"_id": 0}).sort("start_time", -1).limit(10).to_list(10)
-    for r in recent_runs:
-        if isinstance(r['start_time'], str):
-            r['start_time'] = datetime.fromisoformat(r['start_time'])
-        if r.get('end_time') and isinstance(r['end_time'], str):
-            r['end_time'] = datetime.fromisoformat(r['end_time'])
-    
-    success_count = sum(1 for r in recent_runs if r['status'] == 'success')
-    failed_count = sum(1 for r in recent_runs if r['status'] == 'failed')
-    running_count = sum(1 for r in recent_runs if r['status'] == 'running')
-    
-    # Quality scores over time
-    quality_results = await db.quality_results.find({}, {"_id": 0}).sort("timestamp", -1).limit(50).to_list(50)
-    for qr in quality_results:
-        if isinstance(qr['timestamp'], str):
-            qr['timestamp'] = datetime.fromisoformat(qr['timestamp'])
+    """Get dashboard overview statistics from the incrementally maintained rollup"""
+    rollup = await db.dashboard_rollups.find_one({"id": ROLLUP_ID}, {"_id": 0})
+    if not rollup:
+        rollup = await rebuild_dashboard_rollups()
     
+    recent_runs = rollup.get("recent_runs", [])
+    quality_results = rollup.get("recent_quality", [])
     avg_quality_score = sum(qr['quality_score'] for qr in quality_results) / len(quality_results) if quality_results else 0
+    quality_score_count = rollup.get("quality_score_count", 0)
     
-    # Data sources
-    total_sources = await db.data_sources.count_documents({})
-    
-    return {
-        "total_pipelines": total_pipelines,
-        "active_pipelines": active_pipelines,
-        "total_sources": total_sources,
+    return FastJSONResponse({
+        "total_pipelines": rollup.get("total_pipelines", 0),
+        "active_pipelines": rollup.get("active_pipelines", 0),
+        "total_sources": rollup.get("total_sources", 0),
         "recent_runs": recent_runs,
         "run_stats": {
-            "success": success_count,
-            "failed": failed_count,
-            "running": running_count
+            "success": sum(1 for r in recent_runs if r['status'] == 'success'),
+            "failed": sum(1 for r in recent_runs if r['status'] == 'failed'),
+            "running": sum(1 for r in recent_runs if r['status'] == 'running')
         },
+        "lifetime_run_stats": rollup.get("run_counts", {}),
         "avg_quality_score": round(avg_quality_score, 2),
+        "lifetime_avg_quality_score": round(rollup.get("quality_score_sum", 0) / quality_score_count, 2) if quality_score_count else 0,
         "quality_trend": quality_results[:20]
-    }
+    })
 
 # Initialize sample data
+SAMPLE_PIPELINES = [
+    {
+        "name": "Production Data ETL",
+        "description": "Extract, transform, and load production data from manufacturing plants",
+        "transformations": [
+            {"type": "remove_nulls"},
+            {"type": "filter", "condition": {"field": "quality_score", "operator": ">", "value": 80}}
+        ],
+        "schedule": "0 */6 * * *",
+        "status": "active"
+    },
+    {
+        "name": "Quality Metrics Aggregation",
+        "description": "Aggregate quality metrics by plant and product",
+        "transformations": [
+            {"type": "aggregate", "group_by": ["plant_id", "product"], "field": "production_volume", "function": "sum"}
+        ],
+        "schedule": "0 0 * * *",
+        "status": "active"
+    }
+]
+
+SAMPLE_QUALITY_RULES = [
+    {
+        "name": "Quality Score Completeness",
+        "description": "Ensure all records have a quality score",
+        "rule_type": "completeness",
+        "field": "quality_score",
+        "condition": {},
+        "severity": "critical"
+    },
+    {
+        "name": "Temperature Range Check",
+        "description": "Temperature must be between 2°C and 8°C",
+        "rule_type": "accuracy",
+        "field": "temperature",
+        "condition": {"min": 2, "max": 8},
+        "severity": "high"
+    },
+    {
+        "name": "Batch ID Format",
+        "description": "Batch ID must start with BATCH_",
+        "rule_type": "consistency",
+        "field": "batch_id",
+        "condition": {"pattern": "BATCH_"},
+        "severity": "medium"
+    }
+]
+
 @api_router.post("/initialize-sample-data")
 async def initialize_sample_data():
     """Initialize sample data sources, pipelines, and quality rules"""
     
     # Clear existing data
+    replaced = await db.pipelines.distinct("id")
     await db.data_sources.delete_many({})
     await db.pipelines.delete_many({})
     await db.quality_rules.delete_many({})
@@ -560,86 +4490,54 @@ async def initialize_sample_data():
         DataSource(name="Los Angeles Plant", type="manufacturing_plant", location="Los Angeles, CA", config={"plant_code": "LA001"})
     ]
     
-    for source in sources:
-        doc = source.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.data_sources.insert_one(doc)
-    
-    # Create sample pipelines
-    pipelines = [
-        Pipeline(
-            name="Production Data ETL",
-            description="Extract, transform, and load production data from manufacturing plants",
-            source_id=sources[0].id,
-            transformations=[
-                {"type": "remove_nulls"},
-                {"type": "filter", "condition": {"field": "quality_score", "operator": ">", "value": 80}}
-            ],
-            schedule="0 */6 * * *",
-            status="active"
-        ),
-        Pipeline(
-            name="Quality Metrics Aggregation",
-            description="Aggregate quality metrics by plant and product",
-            source_id=sources[1].id,
-            transformations=[
-                {"type": "aggregate", "group_by": ["plant_id", "product"], "field": "production_volume", "function": "sum"}
-            ],
-            schedule="0 0 * * *",
-            status="active"
-        )
-    ]
+    source_docs = [source.model_dump() for source in sources]
+    await db.data_sources.insert_many(source_docs, ordered=False)
+    
+    # Create sample pipelines, each reading from the source at the same position
+    pipelines = [Pipeline(source_id=source.id, **spec) for source, spec in zip(sources, SAMPLE_PIPELINES)]
     
-    for pipeline in pipelines:
-        doc = pipeline.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.pipelines.insert_one(doc)
+    pipeline_docs = [pipeline.model_dump() for pipeline in pipelines]
+    await db.pipelines.insert_many(pipeline_docs, ordered=False)
+    for pipeline_id in replaced + [pipeline.id for pipeline in pipelines]:
+        await pipeline_scheduler.refresh(pipeline_id)
     
     # Create sample quality rules
-    rules = [
-        DataQualityRule(
-            name="Quality Score Completeness",
-            description="Ensure all records have a quality score",
-            rule_type="completeness",
-            field="quality_score",
-            condition={},
-            severity="critical"
-        ),
-        DataQualityRule(
-            name="Temperature Range Check",
-            description="Temperature must be between 2°C and 8°C",
-            rule_type="accuracy",
-            field="temperature",
-            condition={"min": 2, "max": 8},
-            severity="high"
-        ),
-        DataQualityRule(
-            name="Batch ID Format",
-            description="Batch ID must start with BATCH_",
-            rule_type="consistency",
-            field="batch_id",
-            condition={"pattern": "BATCH_"},
-            severity="medium"
-        )
-    ]
+    rules = [DataQualityRule(**spec) for spec in SAMPLE_QUALITY_RULES]
     
-    for rule in rules:
-        doc = rule.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.quality_rules.insert_one(doc)
+    rule_docs = [rule.model_dump() for rule in rules]
+    await db.quality_rules.insert_many(rule_docs, ordered=False)
+    
+    await rebuild_dashboard_rollups()
     
     return {"message": "Sample data initialized successfully", "sources": len(sources), "pipelines": len(pipelines), "rules": len(rules)}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Process-wide latency and queue histograms plus current gauges, in Prometheus text format"""
+    gauges = {
+        "pipeline_jobs_queued": ("Runs waiting for a worker", pipeline_jobs.stats()["queued"]),
+        "pipeline_jobs_running": ("Runs executing on a worker", pipeline_jobs.stats()["running"]),
+        "run_event_streams_live": ("Runs with a live event stream", run_events.stats()["live_runs"]),
+        "write_buffer_pending_operations": ("Buffered Mongo writes not yet flushed", sum(write_buffer.stats()["pending"].values()))
+    }
+    lines = []
+    for histogram in (http_request_seconds, mongo_command_seconds, pipeline_queue_depth, pipeline_stage_seconds):
+        lines.extend(histogram.render())
+    for name, (description, value) in gauges.items():
+        lines.extend([f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(RequestLatencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -649,6 +4547,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def provision_database():
+    try:
+        await ensure_indexes()
+        migrated = await migrate_datetimes()
+        if any(migrated.values()):
+            logger.info("Migrated string datetimes to BSON dates: %s", migrated)
+        await ensure_quality_buckets()
+        await ensure_dashboard_rollups()
+        for shape in await audit_query_shapes():
+            if shape.get("collection_scan") or shape.get("in_memory_sort"):
+                logger.warning("Query on %s %s sort=%s is not index-backed: %s", shape["collection"],
+                               shape["filter"], shape["sort"], shape["stages"])
+    except Exception:
+        logger.exception("Index provisioning failed")
+
+@app.on_event("startup")
+async def start_pipeline_workers():
+    write_buffer.start()
+    run_events.start()
+    pipeline_jobs.start()
+    if SCHEDULER_ENABLED:
+        pipeline_scheduler.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await pipeline_scheduler.stop()
+    await pipeline_jobs.stop()
+    await run_events.stop()
+    await write_buffer.stop()
     client.close()
+
+def main(argv: Optional[List[str]] = None):
+    """Maintenance commands, e.g. `python server.py rebuild-rollups`"""
+    parser = argparse.ArgumentParser(description="Data Pipeline Engineering Platform maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild-rollups", help="Recompute the dashboard rollups from run history")
+    commands.add_parser("migrate-datetimes", help="Convert ISO-string datetime fields to native BSON dates")
+    commands.add_parser("rebuild-quality-buckets", help="Recompute the hourly and daily quality buckets from quality results")
+    commands.add_parser("apply-retention", help="Archive run history past its retention and compact the hot collections")
+    args = parser.parse_args(argv)
+    
+    if args.command == "rebuild-rollups":
+        result = asyncio.run(rebuild_dashboard_rollups())
+    elif args.command == "migrate-datetimes":
+        result = asyncio.run(migrate_datetimes())
+    elif args.command == "rebuild-quality-buckets":
+        result = asyncio.run(rebuild_quality_buckets())
+    elif args.command == "apply-retention":
+        try:
+            result = asyncio.run(apply_retention())
+        except RetentionInProgress as e:
+            parser.exit(1, f"{e}\n")
+    print(json.dumps(result, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
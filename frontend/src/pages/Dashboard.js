@@ -35,6 +35,7 @@ const StatusBadge = ({ status }) => {
   const statusConfig = {
     success: { label: 'SUCCESS', class: 'bg-emerald-500/10 text-emerald-400 border-emerald-500/20' },
     failed: { label: 'FAILED', class: 'bg-red-500/10 text-red-400 border-red-500/20' },
+    cancelled: { label: 'CANCELLED', class: 'bg-slate-500/10 text-slate-400 border-slate-500/20' },
     running: { label: 'RUNNING', class: 'bg-blue-500/10 text-blue-400 border-blue-500/20 animate-pulse' }
   };
   
@@ -43,6 +43,7 @@ const StatusBadge = ({ status }) => {
   const statusConfig = {
     success: { label: 'SUCCESS', class: 'bg-emerald-500/10 text-emerald-400 border-emerald-500/20', icon: CheckCircle2 },
     failed: { label: 'FAILED', class: 'bg-red-500/10 text-red-400 border-red-500/20', icon: XCircle },
+    cancelled: { label: 'CANCELLED', class: 'bg-slate-500/10 text-slate-400 border-slate-500/20', icon: XCircle },
     running: { label: 'RUNNING', class: 'bg-blue-500/10 text-blue-400 border-blue-500/20 animate-pulse', icon: Loader2 }
   };
   
@@ -74,6 +75,31 @@ const PipelineDetail = () => {
     fetchPipelineRuns();
   }, [id]);
   
+  // Follow a running run's logs and progress live; entries are keyed by offset so replays are harmless
+  useEffect(() => {
+    if (!selectedRun || selectedRun.status !== 'running') return undefined;
+    const runId = selectedRun.id;
+    const source = new EventSource(`${API}/pipeline-runs/${runId}/events`);
+    source.addEventListener('log', (event) => {
+      const entry = JSON.parse(event.data);
+      setSelectedRun((run) => {
+        if (!run || run.id !== runId) return run;
+        const logs = run.logs.slice();
+        logs[entry.offset] = entry;
+        return { ...run, logs };
+      });
+    });
+    source.addEventListener('progress', (event) => {
+      const progress = JSON.parse(event.data);
+      setSelectedRun((run) => (run && run.id === runId ? { ...run, progress } : run));
+    });
+    source.addEventListener('end', () => {
+      source.close();
+      fetchPipelineRuns();
+    });
+    return () => source.close();
+  }, [selectedRun?.id, selectedRun?.status]);
+  
   const fetchPipelineDetails = async () => {
     try {
       const response = await axios.get(`${API}/pipelines/${id}`);
@@ -104,7 +130,9 @@ const PipelineDetail = () => {
     
     try {
       const response = await axios.post(`${API}/pipelines/${id}/execute`);
-      if (response.data.status === 'success') {
+      if (response.data.status === 'running') {
+        toast.success('Pipeline run queued');
+      } else if (response.data.status === 'success') {
         toast.success('Pipeline executed successfully');
       } else if (response.data.status === 'failed') {
         toast.error(`Pipeline failed: ${response.data.error_message}`);
@@ -112,7 +140,11 @@ const PipelineDetail = () => {
       fetchPipelineRuns();
     } catch (error) {
       console.error('Error executing pipeline:', error);
-      toast.error('Failed to execute pipeline');
+      if (error.response?.status === 429) {
+        toast.error('Pipeline queue is full, try again shortly');
+      } else {
+        toast.error('Failed to execute pipeline');
+      }
     } finally {
       setExecuting(false);
     }
@@ -274,7 +306,11 @@ const PipelineDetail = () => {
                     )}
                     <div className="bg-[#0B0E14] border border-[#2D3748] rounded-sm p-3">
                       <div className="text-xs text-slate-500 mb-1">Records Processed</div>
-                      <div className="text-sm text-white" style={{fontFamily: 'JetBrains Mono, monospace'}}>{selectedRun.records_processed}</div>
+                      <div className="text-sm text-white" style={{fontFamily: 'JetBrains Mono, monospace'}}>
+                        {selectedRun.status === 'running' && selectedRun.progress
+                          ? `${selectedRun.progress.records_ingested} ingested`
+                          : selectedRun.records_processed}
+                      </div>
                     </div>
                     {selectedRun.metrics?.overall_quality_score && (
                       <div className="bg-[#0B0E14] border border-[#2D3748] rounded-sm p-3">
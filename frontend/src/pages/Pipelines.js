@@ -191,14 +191,20 @@ const Pipelines = () => {
     
     try {
       const response = await axios.post(`${API}/pipelines/${pipelineId}/execute`);
-      if (response.data.status === 'success') {
+      if (response.data.status === 'running') {
+        toast.success('Pipeline run queued');
+      } else if (response.data.status === 'success') {
         toast.success('Pipeline executed successfully');
       } else if (response.data.status === 'failed') {
         toast.error(`Pipeline failed: ${response.data.error_message}`);
       }
     } catch (error) {
       console.error('Error executing pipeline:', error);
-      toast.error('Failed to execute pipeline');
+      if (error.response?.status === 429) {
+        toast.error('Pipeline queue is full, try again shortly');
+      } else {
+        toast.error('Failed to execute pipeline');
+      }
     } finally {
       setExecuting(prev => ({...prev, [pipelineId]: false}));
     }
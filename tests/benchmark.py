@@ -0,0 +1,195 @@
+"""Microbenchmarks for the data-processing hot paths.
+
+Times generate_plant_data, apply_transformations (each transformation type and the sample
+pipelines) and validate_data at several input sizes, records throughput and peak traced
+memory, and compares them against a JSON baseline. Runs fully offline: server.py is imported
+for its functions only and never connects to MongoDB.
+
+    python -m tests.benchmark                      # compare against tests/benchmark_baseline.json
+    python -m tests.benchmark --update-baseline    # record a new baseline
+    python -m tests.benchmark --sizes 1000 --threshold 0.3 --only transform
+    python -m tests.benchmark --schema-report      # typed vs inferred dtypes on the sample pipelines
+
+Exits with status 1 when any case's throughput drops, or its peak memory grows, by more than
+the allowed fraction. Baselines are machine-specific; record one on the machine that checks it.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")  # the client is lazy and never used here
+os.environ.setdefault("DB_NAME", "benchmark")
+
+import numpy as np
+import pandas as pd
+
+import server
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+SEED = 42
+MIN_BATCH_SECONDS = 0.2  # fast cases are looped until one timing batch takes at least this long
+REPEATS = 5
+
+TRANSFORMS = {
+    "filter": [{"type": "filter", "condition": {"field": "quality_score", "operator": ">", "value": 90}}],
+    # Two user-facing filter steps, which the planner fuses into one mask
+    "filter_multi": [{"type": "filter", "condition": {"field": "temperature", "operator": "<", "value": 8}},
+                     {"type": "filter", "condition": {"field": "plant_id", "operator": "!=", "value": "Plant_LA"}}],
+    "remove_nulls": [{"type": "remove_nulls"}],
+    "deduplicate": [{"type": "deduplicate", "key_fields": ["plant_id", "product", "batch_id"]}],
+    "aggregate_sum": [{"type": "aggregate", "group_by": ["plant_id", "product"], "field": "production_volume", "function": "sum"}],
+    "aggregate_avg": [{"type": "aggregate", "group_by": ["plant_id"], "field": "quality_score", "function": "avg"}],
+    "aggregate_count": [{"type": "aggregate", "group_by": ["batch_id"], "field": "record_id", "function": "count"}],
+}
+
+def sample_pipelines():
+    return {spec["name"].lower().replace(" ", "_"): spec["transformations"] for spec in server.SAMPLE_PIPELINES}
+
+def check_filters_select(data):
+    """Fail fast if a filter case keeps every row, e.g. because the planner dropped its step as a no-op"""
+    for name, transformations in TRANSFORMS.items():
+        if name.startswith("filter"):
+            rows = len(server.apply_transformations(data, transformations, server.PLANT_DATA_STATS))
+            if rows >= len(data):
+                raise ValueError(f"transform:{name} kept all {len(data)} input rows, so it measures nothing")
+
+def build_cases(size):
+    """(name, callable) pairs for one input size; inputs are built once, outside the timed region"""
+    data = server.generate_plant_data(size, seed=SEED)
+    check_filters_select(data)
+    rules = [dict(rule, id=f"rule-{i}") for i, rule in enumerate(server.SAMPLE_QUALITY_RULES)]
+    cases = [("generate", lambda: server.generate_plant_data(size, seed=SEED))]
+    for name, transformations in TRANSFORMS.items():
+        cases.append((f"transform:{name}", lambda t=transformations: server.apply_transformations(data, t, server.PLANT_DATA_STATS)))
+    for name, transformations in sample_pipelines().items():
+        cases.append((f"pipeline:{name}", lambda t=transformations: server.apply_transformations(data, t, server.PLANT_DATA_STATS)))
+    cases.append(("validate", lambda: server.validate_data(data, rules)))
+    return cases
+
+def time_case(fn):
+    """Best mean seconds per call over REPEATS batches"""
+    start = time.perf_counter()
+    fn()
+    single = time.perf_counter() - start
+    number = max(1, min(1000, int(MIN_BATCH_SECONDS / max(single, 1e-9))))
+    best = single if number == 1 else float("inf")
+    for _ in range(REPEATS if single < 5 else 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def peak_memory(fn):
+    """Peak bytes traced during one call, measured separately because tracing slows the timed runs"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def schema_report(sizes, source_type="manufacturing_plant"):
+    """Memory and speed of the sample pipelines with inferred dtypes vs the source type's schema"""
+    for size in sizes:
+        data = server.generate_plant_data(size, seed=SEED)
+        typed = server.apply_schema(data, source_type)
+        inferred_bytes, typed_bytes = data.memory_usage(deep=True).sum(), typed.memory_usage(deep=True).sum()
+        print(f"{size:,} rows: {inferred_bytes / 2**20:.1f} MiB inferred -> {typed_bytes / 2**20:.1f} MiB typed "
+              f"({1 - typed_bytes / inferred_bytes:.0%} smaller)")
+        cases = [(f"pipeline:{name}", lambda df, t=transformations: server.apply_transformations(df, t, server.PLANT_DATA_STATS))
+                 for name, transformations in sample_pipelines().items()]
+        cases.append(("groupby:plant_id,product", lambda df: df.groupby(["plant_id", "product"], observed=True)["production_volume"].sum()))
+        cases.append(("groupby:operator_id", lambda df: df.groupby("operator_id", observed=True)["downtime_minutes"].mean()))
+        for name, fn in cases:
+            inferred_seconds, typed_seconds = time_case(lambda: fn(data)), time_case(lambda: fn(typed))
+            print(f"  {name:40s} {inferred_seconds * 1000:>9.2f} ms -> {typed_seconds * 1000:>9.2f} ms ({inferred_seconds / typed_seconds:.1f}x)")
+
+def run(sizes, only=None):
+    results = {}
+    for size in sizes:
+        for name, fn in build_cases(size):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            seconds = time_case(fn)
+            key = f"{name}@{size}"
+            results[key] = {
+                "rows": size,
+                "seconds": round(seconds, 6),
+                "rows_per_second": round(size / seconds, 1),
+                "peak_memory_bytes": peak_memory(fn)
+            }
+            print(f"{key:45s} {results[key]['rows_per_second']:>14,.0f} rows/s {results[key]['peak_memory_bytes'] / 2**20:>9.1f} MiB")
+    return results
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count()
+    }
+
+def compare(results, baseline, threshold, memory_threshold):
+    """Regressions against the baseline as printable lines; cases missing on either side are skipped"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        change = current["rows_per_second"] / previous["rows_per_second"] - 1
+        if change < -threshold:
+            regressions.append(f"{key}: throughput {change:+.1%} ({previous['rows_per_second']:,.0f} -> {current['rows_per_second']:,.0f} rows/s)")
+        if previous["peak_memory_bytes"] and current["peak_memory_bytes"] > previous["peak_memory_bytes"] * (1 + memory_threshold):
+            growth = current["peak_memory_bytes"] / previous["peak_memory_bytes"] - 1
+            regressions.append(f"{key}: peak memory {growth:+.1%} ({previous['peak_memory_bytes']:,} -> {current['peak_memory_bytes']:,} bytes)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data-processing hot paths against a JSON baseline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="input row counts")
+    parser.add_argument("--only", nargs="+", help="case name prefixes to run, e.g. generate transform:filter")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("BENCHMARK_THRESHOLD", "0.2")),
+                        help="allowed fractional throughput drop before failing (default 0.2)")
+    parser.add_argument("--memory-threshold", type=float, default=float(os.environ.get("BENCHMARK_MEMORY_THRESHOLD", "0.25")),
+                        help="allowed fractional peak memory growth before failing (default 0.25)")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--schema-report", action="store_true", help="compare inferred and schema dtypes instead")
+    args = parser.parse_args(argv)
+
+    if args.schema_report:
+        schema_report(args.sizes)
+        return 0
+
+    results = run(args.sizes, args.only)
+
+    if args.update_baseline or not args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"results": {}}
+        baseline["environment"] = environment()
+        baseline["results"] = {**baseline.get("results", {}), **results}
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("environment") != environment():
+        print(f"Warning: baseline was recorded on a different environment: {baseline.get('environment')}")
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(results)} cases, {len(regressions)} regressions")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
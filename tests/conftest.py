@@ -0,0 +1,78 @@
+"""Makes backend/server.py importable for the tests. The Mongo client is lazy, and unit tests never connect;
+tests that need a database use the `mongo` fixture (requires mongomock-motor)."""
+import os
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "tests")
+
+SIMULATOR_BASE_TIME = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def mongo(monkeypatch, tmp_path):
+    """server.db swapped for an in-memory mongomock database, with file stores under tmp_path"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+    client = mongomock_motor.AsyncMongoMockClient(tz_aware=True)
+    monkeypatch.setattr(server, "db", client[os.environ["DB_NAME"]])
+    monkeypatch.setattr(server, "PROCESSED_DATA_DIR", tmp_path / "processed")
+    monkeypatch.setattr(server, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(server, "write_buffer", server.WriteBuffer(server.WRITE_BUFFER_MAX_OPS, server.WRITE_BUFFER_FLUSH_SECONDS))
+    return server.db
+
+@pytest.fixture
+def api():
+    """An httpx client calling the FastAPI app in-process; use inside the test's event loop"""
+    httpx = pytest.importorskip("httpx")
+    import server
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+@pytest.fixture
+def job_queue(mongo, monkeypatch, tmp_path):
+    """Starts a PipelineJobQueue as server.pipeline_jobs inside the test's event loop. Worker processes
+    are spawned, so they get the test's file store through the environment."""
+    import server
+    monkeypatch.setenv("PROCESSED_DATA_DIR", str(tmp_path / "processed"))
+    monkeypatch.setattr(server, "run_events", server.RunEventHub())
+    
+    @asynccontextmanager
+    async def start(workers=1, max_queued=10, dispatch=True):
+        jobs = server.PipelineJobQueue(workers, max_queued)
+        monkeypatch.setattr(server, "pipeline_jobs", jobs)
+        server.write_buffer.start()
+        server.run_events.start()
+        jobs.start()
+        if not dispatch:
+            # Runs stay queued, e.g. to fill the queue
+            for task in jobs.dispatchers:
+                task.cancel()
+        try:
+            yield jobs
+        finally:
+            await jobs.stop()
+            await server.run_events.stop()
+            await server.write_buffer.stop()
+    return start
+
+@pytest.fixture
+def fixed_clock(monkeypatch):
+    """Pins the simulator's record timestamps to SIMULATOR_BASE_TIME, so reruns of a seed yield the same
+    records (in this process only)"""
+    import numpy as np
+    import server
+    
+    def batches(num_records, batch_size, seed=None):
+        rng = np.random.default_rng(seed)
+        for offset in range(0, num_records, batch_size):
+            yield server.generate_plant_data(min(batch_size, num_records - offset), seed=rng, offset=offset,
+                                             base_time=SIMULATOR_BASE_TIME)
+    
+    monkeypatch.setattr(server, "generate_plant_batches", batches)
+    return SIMULATOR_BASE_TIME
@@ -0,0 +1,44 @@
+import asyncio
+import uuid
+
+import server
+
+def processed_doc(plant_id, rows):
+    return {"id": str(uuid.uuid4()), "pipeline_run_id": str(uuid.uuid4()), "metadata": {},
+            "data": [{"plant_id": plant_id, "production_volume": 10.0} for _ in range(rows)]}
+
+QUERY = {"type": "group_by", "group_field": "plant_id", "agg_field": "production_volume", "agg_func": "count"}
+
+def test_writes_from_another_process_invalidate_cached_results(mongo, api, monkeypatch):
+    monkeypatch.setattr(server, "analytics_cache", server.ResultCache(1 << 20, 300))
+    other_process = server.WriteBuffer(100, 1.0)  # e.g. another API worker persisting a run
+    
+    async def scenario():
+        async with api() as client:
+            await other_process.insert("processed_data", processed_doc("Plant_LA", 3))
+            await other_process.flush()
+            first = (await client.post("/api/analytics/query", json=QUERY)).json()
+            cached = (await client.post("/api/analytics/query", json=QUERY)).json()
+            await other_process.insert("processed_data", processed_doc("Plant_NYC", 2))
+            await other_process.flush()
+            after_write = (await client.post("/api/analytics/query", json=QUERY)).json()
+            return first, cached, after_write
+    
+    first, cached, after_write = asyncio.run(scenario())
+    assert first == cached
+    assert server.analytics_cache.counters["hits"] == 1
+    assert server.write_buffer.version("processed_data") == 0  # this process never wrote
+    assert {row["plant_id"]: row["production_volume"] for row in after_write["rows"]} == {"Plant_LA": 3, "Plant_NYC": 2}
+
+def test_data_version_is_shared_and_monotonic(mongo):
+    async def scenario():
+        versions = [await server.data_version("processed_data")]
+        for buffer in (server.WriteBuffer(10, 1.0), server.WriteBuffer(10, 1.0)):
+            await buffer.delete("processed_data", {"id": "missing"})
+            await buffer.flush()
+            versions.append(await server.data_version("processed_data"))
+        await server.bump_data_version("processed_data")
+        versions.append(await server.data_version("processed_data"))
+        return versions
+    
+    assert asyncio.run(scenario()) == [0, 1, 2, 3]
@@ -0,0 +1,41 @@
+import numpy as np
+import pyarrow as pa
+
+import server
+
+REMOVE_NULLS = [{"type": "remove_nulls", "subset": None}]
+
+def write_source(root, df):
+    root.mkdir(parents=True, exist_ok=True)
+    df.to_csv(root / "plant.csv", index=False)
+
+def test_file_sources_are_planned_without_simulator_stats():
+    assert server.source_stats({"source_config": {}}) is server.PLANT_DATA_STATS
+    assert server.source_stats({"source_config": {"path": "plant.csv"}}) is None
+    assert server.plan_transformations(REMOVE_NULLS, None)[0] == [{"type": "remove_nulls", "subset": None}]
+    simulated = server.plan_fingerprint(REMOVE_NULLS, None, server.PLANT_DATA_STATS)
+    assert server.plan_fingerprint(REMOVE_NULLS, None, None) != simulated
+
+def test_csv_remove_nulls_drops_nans_outside_quality_score(monkeypatch, tmp_path):
+    df = server.generate_plant_data(200, seed=8)
+    df["quality_score"] = df["quality_score"].fillna(90.0)
+    df.loc[df.index[:15], "temperature"] = np.nan
+    df.loc[df.index[15:20], "ph_level"] = np.nan
+    write_source(tmp_path / "sources", df)
+    monkeypatch.setattr(server, "SOURCE_FILES_ROOT", tmp_path / "sources")
+    monkeypatch.setattr(server, "PROCESSED_DATA_DIR", tmp_path / "processed")
+    
+    writer = server.RunOutputWriter("p1", "r1")
+    options = {"source_config": {"path": "plant.csv"}, "chunk_size": 64}
+    logs = []
+    outcome = server.run_stages(options, REMOVE_NULLS, [], writer, logs, lambda: None)
+    writer.close()
+    
+    assert len(outcome["files"]) == 1
+    assert any(log["message"] == "Ingested 200 records" for log in logs)
+    assert outcome["records_out"] == 180
+    with pa.memory_map(str(writer.path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    assert table.num_rows == 180
+    assert table.column("temperature").null_count == 0
+    assert table.column("ph_level").null_count == 0
@@ -0,0 +1,98 @@
+import asyncio
+import uuid
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+import server
+from tests.conftest import SIMULATOR_BASE_TIME as BASE_TIME
+
+FILTER = [{"type": "filter", "condition": {"field": "production_volume", "operator": ">", "value": 9000}}]
+AGGREGATE = [{"type": "remove_nulls"},
+             {"type": "aggregate", "group_by": ["plant_id"], "field": "quality_score", "function": "avg"}]
+
+pytestmark = pytest.mark.usefixtures("fixed_clock")
+
+def source(num_records, seed):
+    return server.generate_plant_data(num_records, seed=seed, base_time=BASE_TIME)
+
+def pipeline(transformations):
+    return {"id": "p1", "name": "p", "source_id": "s1", "transformations": transformations}
+
+async def run(pipeline, num_records, seed, **options):
+    """A run as the dispatcher does it: load the committed watermark, process, commit"""
+    base = await server.load_watermark(pipeline)
+    run_id = str(uuid.uuid4())
+    outcome = server.process_pipeline_run(pipeline, [], {"run_id": run_id, "num_records": num_records, "seed": seed,
+                                                         "partitions": 1, "incremental": base, **options})
+    committed = await server.commit_watermark(pipeline, run_id, base, outcome["incremental"])
+    output = server.read_run_output(outcome["storage"]).to_pandas() if outcome["storage"] else pd.DataFrame()
+    return outcome, output, committed
+
+def messages(outcome):
+    return [entry["message"] for entry in outcome["logs"]]
+
+def test_second_run_processes_only_records_past_the_watermark(mongo):
+    async def scenario():
+        first = await run(pipeline(FILTER), 100, seed=1)
+        second = await run(pipeline(FILTER), 150, seed=2)
+        return first, second, await mongo.pipeline_watermarks.find_one({}, {"_id": 0})
+
+    (first, _, _), (second, output, committed), watermark = asyncio.run(scenario())
+    assert first["incremental"]["watermark"] == BASE_TIME + timedelta(hours=99)
+    assert "Skipped 100 records at or before the watermark" in messages(second)
+    assert "Ingested 50 records" in messages(second)
+    expected = server.apply_transformations(source(150, seed=2).iloc[100:], FILTER)
+    assert committed and output["record_id"].tolist() == [row["record_id"] for row in expected]
+    assert watermark["watermark"] == BASE_TIME + timedelta(hours=149)
+
+def test_incremental_aggregate_equals_a_full_recompute(mongo):
+    async def scenario():
+        await run(pipeline(AGGREGATE), 100, seed=1)
+        return await run(pipeline(AGGREGATE), 150, seed=2)
+
+    _, output, _ = asyncio.run(scenario())
+    everything = pd.concat([source(100, seed=1), source(150, seed=2).iloc[100:]])
+    expected = pd.DataFrame(server.apply_transformations(everything, AGGREGATE))
+    pd.testing.assert_frame_equal(output.sort_values("plant_id").reset_index(drop=True),
+                                  expected.sort_values("plant_id").reset_index(drop=True), check_dtype=False)
+
+@pytest.mark.parametrize("change", ["transformations", "full_refresh"])
+def test_changed_chain_or_full_refresh_reprocesses_everything(mongo, change):
+    changed = [{"type": "filter", "condition": {"field": "production_volume", "operator": ">", "value": 9500}}]
+
+    async def scenario():
+        await run(pipeline(FILTER), 100, seed=1)
+        if change == "transformations":
+            return await run(pipeline(changed), 150, seed=2)
+        return await run(pipeline(FILTER), 150, seed=2, full_refresh=True)
+
+    outcome, output, committed = asyncio.run(scenario())
+    assert "Ingested 150 records" in messages(outcome)
+    transformations = changed if change == "transformations" else FILTER
+    expected = server.apply_transformations(source(150, seed=2), transformations)
+    assert committed and output["record_id"].tolist() == [row["record_id"] for row in expected]
+
+def test_commit_from_stale_state_is_rejected(mongo):
+    async def scenario():
+        # Startup provisions this index; the conditional upsert relies on it to reject the stale commit
+        await mongo.pipeline_watermarks.create_index("id", unique=True)
+        await run(pipeline(AGGREGATE), 100, seed=1)
+        base = await server.load_watermark(pipeline(AGGREGATE))
+        # Two runs start from the same committed watermark; the later commit loses
+        outcomes = []
+        for run_id in ("run-a", "run-b"):
+            outcomes.append(server.process_pipeline_run(pipeline(AGGREGATE), [], {"run_id": run_id, "num_records": 150, "seed": 2,
+                                                                                  "partitions": 1, "incremental": base}))
+        committed = [await server.commit_watermark(pipeline(AGGREGATE), run_id, base, outcome["incremental"])
+                     for run_id, outcome in zip(("run-a", "run-b"), outcomes)]
+        return base, outcomes, committed, await mongo.pipeline_watermarks.find_one({}, {"_id": 0})
+
+    base, outcomes, committed, watermark = asyncio.run(scenario())
+    assert committed == [True, False]
+    assert watermark["run_id"] == "run-a" and watermark["state"] == outcomes[0]["incremental"]["state"]
+    # The winner's state replaced the one it was loaded from; the loser's was discarded
+    assert (server.PROCESSED_DATA_DIR / outcomes[0]["incremental"]["state"]["partials"]).exists()
+    assert not (server.PROCESSED_DATA_DIR / base["state"]["partials"]).exists()
+    assert not (server.PROCESSED_DATA_DIR / outcomes[1]["incremental"]["state"]["partials"]).exists()
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import server
+
+PIPELINE = {"id": "p1", "name": "p", "source_id": "s1", "status": "active",
+            "transformations": [{"type": "filter", "condition": {"field": "production_volume", "operator": ">", "value": 8000}}]}
+
+@pytest.fixture
+def slow_round_trips(monkeypatch):
+    # mongomock answers without yielding; a real Mongo round trip lets other requests run meanwhile
+    rollup_run_queued = server.rollup_run_queued
+
+    async def slow(run_doc):
+        await asyncio.sleep(0.01)
+        await rollup_run_queued(run_doc)
+
+    monkeypatch.setattr(server, "rollup_run_queued", slow)
+
+async def wait_for(predicate, timeout=60):
+    for _ in range(int(timeout / 0.05)):
+        if await predicate():
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("timed out")
+
+def test_concurrent_submits_respect_the_queue_depth(mongo, job_queue, api, slow_round_trips):
+    async def scenario():
+        await mongo.pipelines.insert_one(dict(PIPELINE))
+        async with job_queue(max_queued=3, dispatch=False) as jobs, api() as client:
+            responses = await asyncio.gather(*(client.post("/api/pipelines/p1/execute") for _ in range(6)))
+            return [r.status_code for r in responses], responses, jobs.stats()
+
+    codes, responses, stats = asyncio.run(scenario())
+    assert sorted(codes) == [200] * 3 + [429] * 3
+    assert next(r for r in responses if r.status_code == 429).headers["Retry-After"] == "5"
+    assert stats["queued"] == 3 and stats["reserved"] == 0
+
+def test_batch_is_queued_whole_or_not_at_all(mongo, job_queue, api, slow_round_trips):
+    async def scenario():
+        await mongo.pipelines.insert_many([{**PIPELINE, "id": pid, "source_id": pid} for pid in ("p1", "p2", "p3")])
+        async with job_queue(max_queued=3, dispatch=False) as jobs, api() as client:
+            first = await client.post("/api/pipelines/p1/execute")
+            batch = await client.post("/api/pipelines/batch-execute", json={"pipeline_ids": ["p1", "p2", "p3"]})
+            return first.status_code, batch.status_code, jobs.stats(), await mongo.pipeline_runs.count_documents({})
+
+    first, batch, stats, runs = asyncio.run(scenario())
+    assert (first, batch) == (200, 429)
+    assert stats["queued"] == 1 and stats["reserved"] == 0 and runs == 1
+
+def test_failed_write_releases_its_slot(mongo, job_queue, monkeypatch):
+    rollup_run_queued = server.rollup_run_queued
+
+    async def down(run_doc):
+        raise server.OperationFailure("not primary")
+
+    async def scenario():
+        async with job_queue(max_queued=1, dispatch=False) as jobs:
+            monkeypatch.setattr(server, "rollup_run_queued", down)
+            with pytest.raises(server.OperationFailure):
+                await jobs.submit(PIPELINE, {})
+            reserved = jobs.reserved
+            monkeypatch.setattr(server, "rollup_run_queued", rollup_run_queued)
+            await jobs.submit(PIPELINE, {})
+            return reserved, jobs.stats()
+
+    reserved, stats = asyncio.run(scenario())
+    assert reserved == 0 and stats["queued"] == 1
+
+def test_cancel_a_queued_run(mongo, job_queue, api):
+    async def scenario():
+        await mongo.pipelines.insert_one(dict(PIPELINE))
+        async with job_queue(dispatch=False), api() as client:
+            run = (await client.post("/api/pipelines/p1/execute")).json()
+            cancelled = await client.post(f"/api/pipeline-runs/{run['id']}/cancel")
+            again = await client.post(f"/api/pipeline-runs/{run['id']}/cancel")
+            missing = await client.post("/api/pipeline-runs/nope/cancel")
+            return cancelled.json(), again.status_code, missing.status_code, await mongo.pipeline_runs.find_one({"id": run["id"]})
+
+    cancelled, again, missing, run = asyncio.run(scenario())
+    assert cancelled["status"] == "cancelled" and (again, missing) == (409, 404)
+    assert run["status"] == "cancelled" and run["error_message"] == "Pipeline run cancelled before it started"
+
+def test_cancel_a_running_run(mongo, job_queue, api):
+    async def scenario():
+        await mongo.pipelines.insert_one(dict(PIPELINE))
+        async with job_queue() as jobs, api() as client:
+            run = (await client.post("/api/pipelines/p1/execute",
+                                     params={"num_records": 5_000_000, "streaming": True, "chunk_size": 1000})).json()
+
+            async def running():
+                return run["id"] in jobs.jobs and jobs.jobs[run["id"]]["state"] == "running"
+
+            await wait_for(running)
+            requested = (await client.post(f"/api/pipeline-runs/{run['id']}/cancel")).json()
+
+            async def finished():
+                return (await mongo.pipeline_runs.find_one({"id": run["id"]}))["status"] != "running"
+
+            await wait_for(finished)
+            return requested, await mongo.pipeline_runs.find_one({"id": run["id"]}), jobs.stats()
+
+    requested, run, stats = asyncio.run(scenario())
+    assert requested["status"] == "running"
+    assert run["status"] == "cancelled" and run["error_message"] == "Pipeline run cancelled"
+    assert stats["queued"] == stats["running"] == 0
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+def legacy_run(i):
+    """A run as older versions stored it, with ISO-string datetimes (naive ones meant UTC)"""
+    start = START + timedelta(minutes=i // 3)
+    run = server.PipelineRun(pipeline_id="p1", pipeline_name="p", status="success", start_time=start,
+                             end_time=start + timedelta(seconds=30),
+                             logs=[{"timestamp": start + timedelta(seconds=s), "level": "INFO", "message": f"m{s}"} for s in range(3)])
+    doc = run.model_dump(exclude={"heartbeat_at"})
+    doc["start_time"] = start.isoformat() if i % 2 else start.replace(tzinfo=None).isoformat()
+    doc["end_time"] = doc["end_time"].isoformat()
+    doc["logs"] = [{**entry, "timestamp": entry["timestamp"].isoformat()} for entry in doc["logs"]]
+    return doc, run
+
+def test_string_datetimes_become_native_and_rerunning_changes_nothing(mongo):
+    legacy = [legacy_run(i) for i in range(10)]
+
+    async def scenario():
+        await mongo.pipeline_runs.insert_many([doc for doc, _ in legacy])
+        result = server.DataQualityResult(pipeline_run_id=legacy[0][1].id, rule_id="q1", rule_name="q", passed=True,
+                                          records_checked=10, records_failed=0, quality_score=100.0, timestamp=START).model_dump()
+        await mongo.quality_results.insert_one({**result, "timestamp": START.isoformat()})
+        await mongo.pipelines.insert_one({"id": "p1", "name": "p", "created_at": START.isoformat(), "updated_at": START})
+        first = await server.migrate_datetimes()
+        snapshot = await mongo.pipeline_runs.find({}, {"_id": 0}).to_list(None)
+        second = await server.migrate_datetimes()
+        return first, second, snapshot, await mongo.pipeline_runs.find({}, {"_id": 0}).to_list(None), \
+            await mongo.quality_results.find_one({}), await mongo.pipelines.find_one({})
+
+    first, second, snapshot, runs, result, pipeline = asyncio.run(scenario())
+    assert first["pipeline_runs"] == 10 and first["quality_results"] == 1 and first["pipelines"] == 1
+    assert not any(second.values())
+    assert runs == snapshot
+    by_id = {run["id"]: run for run in runs}
+    for _, original in legacy:
+        migrated = by_id[original.id]
+        assert migrated["start_time"] == original.start_time and migrated["end_time"] == original.end_time
+        assert [entry["timestamp"] for entry in migrated["logs"]] == [entry["timestamp"] for entry in original.logs]
+        assert all(isinstance(entry["timestamp"], datetime) for entry in migrated["logs"])
+    assert result["timestamp"] == START and pipeline["created_at"] == START
+
+def test_keyset_cursors_span_migrated_and_native_documents(mongo, api):
+    legacy = [legacy_run(i) for i in range(10)]
+    native = [server.PipelineRun(pipeline_id="p1", pipeline_name="p", status="success",
+                                 start_time=START + timedelta(minutes=i // 3)).model_dump() for i in range(10, 20)]
+
+    async def scenario():
+        await mongo.pipeline_runs.insert_many([doc for doc, _ in legacy] + native)
+        await server.migrate_datetimes()
+        ids, cursor = [], None
+        async with api() as client:
+            while True:
+                response = await client.get("/api/pipeline-runs", params={"limit": 4, **({"cursor": cursor} if cursor else {})})
+                ids += [doc["id"] for doc in response.json()]
+                if not (cursor := response.headers.get("X-Next-Cursor")):
+                    return ids
+
+    ids = asyncio.run(scenario())
+    starts = {run.id: run.start_time for _, run in legacy} | {doc["id"]: doc["start_time"] for doc in native}
+    assert ids == sorted(starts, key=lambda run_id: (starts[run_id], run_id), reverse=True)
@@ -0,0 +1,97 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+import server
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+NDJSON = {"Accept": server.NDJSON_MEDIA_TYPE}
+
+def runs(count):
+    # Runs started in groups of five at the same instant, so most pages split a tie
+    return [server.PipelineRun(pipeline_id="p1", pipeline_name="p", status="success",
+                               start_time=START + timedelta(minutes=i // 5)).model_dump() for i in range(count)]
+
+def rules(count):
+    return [server.DataQualityRule(name=f"r{i}", description="", rule_type="completeness", field="quality_score",
+                                   condition={}, severity="low", created_at=START + timedelta(minutes=i // 4)).model_dump()
+            for i in range(count)]
+
+def expected_order(docs, sort_field, descending):
+    return [doc["id"] for doc in sorted(docs, key=lambda doc: (doc[sort_field], doc["id"]), reverse=descending)]
+
+async def walk(client, path, limit):
+    ids, pages, cursor = [], 0, None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(path, params=params)
+        assert response.status_code == 200
+        ids += [doc["id"] for doc in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids, pages
+
+@pytest.mark.parametrize("path, collection, make, sort_field, descending", [
+    ("/api/pipeline-runs", "pipeline_runs", runs, "start_time", True),
+    ("/api/quality-rules", "quality_rules", rules, "created_at", False),
+])
+@pytest.mark.parametrize("limit", [1, 4, 5, 23, 50])
+def test_walking_every_page_has_no_gaps_or_duplicates(mongo, api, path, collection, make, sort_field, descending, limit):
+    docs = make(23)
+
+    async def scenario():
+        await mongo[collection].insert_many([dict(doc) for doc in docs])
+        async with api() as client:
+            return await walk(client, path, limit)
+
+    ids, pages = asyncio.run(scenario())
+    assert ids == expected_order(docs, sort_field, descending)
+    assert pages == 23 // limit + 1  # a full last page is followed by an empty one
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(orjson.dumps({"v": "2026-03-01T00:00:00+00:00", "dt": True})).decode(),  # no id
+    base64.urlsafe_b64encode(orjson.dumps({"v": "yesterday", "dt": True, "id": "x"})).decode(),
+])
+def test_malformed_cursor_is_rejected(mongo, api, cursor):
+    async def scenario():
+        async with api() as client:
+            return await client.get("/api/pipeline-runs", params={"cursor": cursor})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 400 and response.json()["detail"] == "Invalid cursor"
+
+@pytest.mark.parametrize("limit, status", [(0, 400), (1, 200), (server.PAGE_MAX_LIMIT, 200), (server.PAGE_MAX_LIMIT + 1, 400)])
+def test_limit_bounds(mongo, api, limit, status):
+    async def scenario():
+        async with api() as client:
+            return await client.get("/api/pipeline-runs", params={"limit": limit}, headers=NDJSON if limit == 1 else {})
+
+    assert asyncio.run(scenario()).status_code == status
+
+def test_ndjson_streams_everything_or_up_to_the_limit(mongo, api):
+    docs = runs(60)  # more than the JSON default page of 50
+
+    async def scenario():
+        await mongo.pipeline_runs.insert_many([dict(doc) for doc in docs])
+        async with api() as client:
+            everything = await client.get("/api/pipeline-runs", headers=NDJSON)
+            limited = await client.get("/api/pipeline-runs", params={"limit": 7}, headers=NDJSON)
+            page = await client.get("/api/pipeline-runs", params={"limit": 7})
+            rest = await client.get("/api/pipeline-runs", params={"cursor": page.headers["X-Next-Cursor"]}, headers=NDJSON)
+        return everything, limited, rest
+
+    everything, limited, rest = asyncio.run(scenario())
+    assert everything.headers["content-type"].startswith(server.NDJSON_MEDIA_TYPE)
+    lines = [orjson.loads(line) for line in everything.text.splitlines()]
+    order = expected_order(docs, "start_time", True)
+    assert [doc["id"] for doc in lines] == order
+    assert datetime.fromisoformat(lines[0]["start_time"]) == docs[-1]["start_time"]
+    assert [orjson.loads(line)["id"] for line in limited.text.splitlines()] == order[:7]
+    assert [orjson.loads(line)["id"] for line in rest.text.splitlines()] == order[7:]
+    assert "X-Next-Cursor" not in everything.headers
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import server
+
+CHAINS = {
+    "dedup_then_filter": [{"type": "deduplicate", "key_fields": ["plant_id", "product", "batch_id"]},
+                          {"type": "filter", "condition": {"field": "quality_score", "operator": ">", "value": 80}}],
+    "remove_nulls_then_sum": [{"type": "remove_nulls"},
+                              {"type": "aggregate", "group_by": ["plant_id", "product"], "field": "production_volume", "function": "sum"}],
+    "filter_then_avg": [{"type": "filter", "condition": {"field": "temperature", "operator": "<", "value": 8}},
+                        {"type": "aggregate", "group_by": ["batch_id"], "field": "quality_score", "function": "avg"}],
+    "dedup_then_count": [{"type": "deduplicate", "key_fields": ["operator_id", "batch_id"]},
+                         {"type": "aggregate", "group_by": ["plant_id"], "field": "record_id", "function": "count"}],
+    **{spec["name"]: spec["transformations"] for spec in server.SAMPLE_PIPELINES},
+}
+
+@pytest.fixture(scope="module", autouse=True)
+def small_partitions():
+    """Partition chunks of a few hundred rows so the tests stay fast, and stop the pool afterwards"""
+    min_rows = server.PARTITION_MIN_ROWS
+    server.PARTITION_MIN_ROWS = 100
+    yield
+    server.PARTITION_MIN_ROWS = min_rows
+    if server._partition_pool is not None:
+        server._partition_pool.shutdown()
+        server._partition_pool = None
+
+def stream(df, transformations, partitions):
+    state = {}
+    chunks = [df.iloc[i:i + 800] for i in range(0, len(df), 800)]
+    frames = list(server.stream_transformations(chunks, transformations, server.PLANT_DATA_STATS, state, partitions=partitions))
+    return pd.concat(frames), state
+
+@pytest.mark.parametrize("name", CHAINS)
+def test_partitioned_stream_equals_single_core(name):
+    df = server.generate_plant_data(4000, seed=31)
+    single, single_state = stream(df, CHAINS[name], 1)
+    partitioned, partitioned_state = stream(df, CHAINS[name], 3)
+    pd.testing.assert_frame_equal(partitioned, single)
+    assert partitioned_state["seen"].keys() == single_state["seen"].keys()
+    for step, keys in single_state["seen"].items():
+        assert (partitioned_state["seen"][step] == keys).all()
+
+def test_partitioned_apply_transformations_equals_single_core():
+    df = server.generate_plant_data(3000, seed=32)
+    for transformations in CHAINS.values():
+        partitioned = server.apply_transformations(df, transformations, server.PLANT_DATA_STATS, partitions=2)
+        single = server.apply_transformations(df, transformations, server.PLANT_DATA_STATS)
+        # Partial sums are added in a different order, so totals may differ in the last bits
+        pd.testing.assert_frame_equal(pd.DataFrame(partitioned), pd.DataFrame(single))
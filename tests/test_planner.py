@@ -0,0 +1,90 @@
+import random
+
+import pandas as pd
+import pytest
+
+import server
+
+NUMERIC = ["production_volume", "quality_score", "downtime_minutes", "temperature", "ph_level"]
+CATEGORICAL = {"plant_id": server.PLANTS, "product": server.PRODUCTS}
+GROUP_KEYS = [["plant_id"], ["product"], ["plant_id", "product"], ["batch_id"]]
+
+def random_step(rng, df):
+    kind = rng.choice(["filter", "filter", "categorical_filter", "remove_nulls", "deduplicate", "aggregate", "noop"])
+    if kind == "filter":
+        field = rng.choice(NUMERIC)
+        value = float(df[field].quantile(rng.random()))
+        return {"type": "filter", "condition": {"field": field, "operator": rng.choice([">", "<"]), "value": value}}
+    if kind == "categorical_filter":
+        field = rng.choice(list(CATEGORICAL))
+        return {"type": "filter", "condition": {"field": field, "operator": rng.choice(["==", "!="]),
+                                                "value": rng.choice(CATEGORICAL[field])}}
+    if kind == "remove_nulls":
+        return {"type": "remove_nulls"}
+    if kind == "deduplicate":
+        return {"type": "deduplicate", "key_fields": rng.choice(GROUP_KEYS)}
+    if kind == "aggregate":
+        return {"type": "aggregate", "group_by": rng.choice(GROUP_KEYS), "field": rng.choice(NUMERIC),
+                "function": rng.choice(["sum", "avg", "count"])}
+    return {"type": "filter", "condition": {"field": "temperature", "operator": "~", "value": 1}}
+
+def reads(step):
+    if step["type"] == "filter":
+        return [step["condition"]["field"]]
+    if step["type"] == "deduplicate":
+        return step["key_fields"]
+    if step["type"] == "aggregate":
+        return step["group_by"] + [step["field"]]
+    return []
+
+def random_chain(rng, df):
+    chain = [random_step(rng, df) for _ in range(rng.randint(1, 6))]
+    # Steps after an aggregate may only read the columns it kept
+    for i, step in enumerate(chain):
+        if step["type"] == "aggregate":
+            kept = set(step["group_by"]) | {step["field"]}
+            return chain[:i + 1] + [s for s in chain[i + 1:] if set(reads(s)) <= kept]
+    return chain
+
+def naive(df, chain):
+    for step in chain:
+        df = server.transform_frame(df, step)
+    return df.reset_index(drop=True)
+
+@pytest.fixture(scope="module")
+def data():
+    return server.generate_plant_data(4000, seed=21)
+
+@pytest.mark.parametrize("seed", range(60))
+@pytest.mark.parametrize("with_stats", [False, True])
+def test_planned_execution_equals_naive_execution(data, seed, with_stats):
+    chain = random_chain(random.Random(seed), data)
+    planned = pd.DataFrame(server.apply_transformations(data, chain, server.PLANT_DATA_STATS if with_stats else None))
+    expected = naive(data, chain)
+    if expected.empty:
+        assert planned.empty
+    else:
+        pd.testing.assert_frame_equal(planned, expected, check_dtype=False, check_categorical=False)
+
+def test_filters_pushed_below_aggregate_and_fused():
+    chain = [{"type": "aggregate", "group_by": ["plant_id"], "field": "production_volume", "function": "sum"},
+             {"type": "filter", "condition": {"field": "plant_id", "operator": "!=", "value": "Plant_LA"}},
+             {"type": "filter", "condition": {"field": "plant_id", "operator": "!=", "value": "Plant_NYC"}}]
+    plan, rewrites = server.plan_transformations(chain, server.PLANT_DATA_STATS)
+    assert [node["type"] for node in plan] == ["project", "filter", "aggregate"]
+    assert len(plan[1]["conditions"]) == 2
+    assert plan[0]["columns"] == ["plant_id", "production_volume"]
+    assert any(r.startswith("pushed filter") for r in rewrites)
+
+def test_filter_on_aggregated_value_stays_above_aggregate():
+    chain = [{"type": "aggregate", "group_by": ["plant_id"], "field": "production_volume", "function": "sum"},
+             {"type": "filter", "condition": {"field": "production_volume", "operator": ">", "value": 1}}]
+    plan, _ = server.plan_transformations(chain)
+    assert [node["type"] for node in plan] == ["project", "aggregate", "filter"]
+
+def test_invalid_steps_are_dropped_as_no_ops():
+    chain = [{"type": "filter", "condition": {"field": "temperature", "operator": "~", "value": 1}},
+             {"type": "deduplicate", "key_fields": []}, {"type": "unknown"}]
+    plan, rewrites = server.plan_transformations(chain)
+    assert plan == []
+    assert len(rewrites) == 3
@@ -0,0 +1,117 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+import server
+
+NOW = datetime(2026, 6, 10, 12, tzinfo=timezone.utc)
+FIELDS = ["count", "score_sum", "score_min", "score_max", "failed_checks", "records_checked", "records_failed"]
+
+def results(start, hours, rules=("r1", "r2"), seed=5):
+    """Quality results for each rule every 20 minutes from `start`"""
+    rng = random.Random(seed)
+    docs = []
+    for step in range(hours * 3):
+        for rule_id in rules:
+            score = round(rng.uniform(80, 100), 2)
+            docs.append(server.DataQualityResult(
+                pipeline_run_id=f"run-{step}", rule_id=rule_id, rule_name=f"rule {rule_id}", passed=score >= 90,
+                records_checked=100, records_failed=int(100 - score), quality_score=score,
+                timestamp=start + timedelta(minutes=20 * step, seconds=step % 7)).model_dump())
+    return docs
+
+def summary(values):
+    # Sums of scores are compared to 6 decimals, as they are added up in a different order
+    return {field: round(float(values[field]), 6) if field == "score_sum" else values[field] for field in FIELDS}
+
+def expected(docs, freq):
+    """The bucket summaries aggregated straight from the quality results"""
+    frame = pd.DataFrame(docs)
+    frame["start"] = pd.to_datetime(frame["timestamp"], utc=True).dt.floor(freq)
+    frame["failed"] = ~frame["passed"]
+    grouped = frame.groupby(["rule_id", "start"]).agg(
+        count=("quality_score", "size"), score_sum=("quality_score", "sum"), score_min=("quality_score", "min"),
+        score_max=("quality_score", "max"), failed_checks=("failed", "sum"),
+        records_checked=("records_checked", "sum"), records_failed=("records_failed", "sum"))
+    return {(rule_id, start.to_pydatetime()): summary(row)
+            for (rule_id, start), row in grouped.iterrows()}
+
+async def stored(collection):
+    return {(bucket["rule_id"], bucket["start"]): summary(bucket)
+            async for bucket in server.db[collection].find({}, {"_id": 0})}
+
+def test_incremental_and_rebuilt_buckets_match_the_results(mongo):
+    docs = results(datetime(2026, 6, 8, 21, 10, tzinfo=timezone.utc), hours=30)
+
+    async def scenario():
+        await mongo.quality_results.insert_many([dict(doc) for doc in docs])
+        for run in range(0, len(docs), 8):  # folded in run by run, as process_pipeline_run does
+            await server.record_quality_results(docs[run:run + 8])
+        await server.write_buffer.flush()
+        incremental = await stored("quality_buckets"), await stored("quality_daily")
+        points = {bucket["id"]: len(bucket["points"]) for bucket in await mongo.quality_buckets.find({}).to_list(None)}
+        rebuilt = await server.rebuild_quality_buckets()
+        return incremental, points, rebuilt, (await stored("quality_buckets"), await stored("quality_daily"))
+
+    incremental, points, rebuilt, after_rebuild = asyncio.run(scenario())
+    hourly, daily = expected(docs, "h"), expected(docs, "D")
+    assert len(hourly) == 2 * 30 and len(daily) == 2 * 3
+    assert incremental == (hourly, daily)
+    assert after_rebuild == (hourly, daily)
+    assert rebuilt == {"quality_buckets": len(hourly), "quality_daily": len(daily)}
+    assert sum(points.values()) == len(docs)
+
+def test_trends_filter_by_range_and_rule(mongo, api):
+    docs = results(datetime(2026, 6, 8, tzinfo=timezone.utc), hours=48)
+    start, end = datetime(2026, 6, 8, 5, 30, tzinfo=timezone.utc), datetime(2026, 6, 8, 9, tzinfo=timezone.utc)
+
+    async def scenario():
+        await mongo.quality_results.insert_many([dict(doc) for doc in docs])
+        await server.rebuild_quality_buckets()
+        async with api() as client:
+            hour = await client.get("/api/quality-trends", params={"resolution": "hour", "rule_id": "r2",
+                                                                   "start": start.isoformat(), "end": end.isoformat()})
+            raw = await client.get("/api/quality-trends", params={"resolution": "raw", "start": start.isoformat(), "end": end.isoformat()})
+            day = await client.get("/api/quality-trends", params={"resolution": "day", "start": "2026-06-09T00:00:00Z",
+                                                                  "end": "2026-06-12T00:00:00Z"})
+        return hour.json(), raw.json(), day.json()
+
+    hour, raw, day = asyncio.run(scenario())
+    hourly = expected(docs, "h")
+    [series] = hour["series"]
+    assert series["rule_id"] == "r2"
+    # The bucket the start falls in is included; the one starting at the end is not
+    assert [point["start"] for point in series["points"]] == [f"2026-06-08T0{h}:00:00+00:00" for h in range(5, 9)]
+    for point in series["points"]:
+        bucket = hourly[("r2", datetime.fromisoformat(point["start"]))]
+        assert (point["count"], point["min"], point["max"], point["failed_checks"]) == \
+            (bucket["count"], bucket["score_min"], bucket["score_max"], bucket["failed_checks"])
+        assert point["avg"] == pytest.approx(bucket["score_sum"] / bucket["count"], abs=1e-4)
+
+    in_range = sorted((doc["rule_id"], doc["timestamp"]) for doc in docs if start <= doc["timestamp"] < end)
+    assert sorted((s["rule_id"], datetime.fromisoformat(p["timestamp"])) for s in raw["series"] for p in s["points"]) == in_range
+    assert {s["rule_id"]: [p["start"][:10] for p in s["points"]] for s in day["series"]} == \
+        {"r1": ["2026-06-09"], "r2": ["2026-06-09"]}
+
+def test_rebuild_keeps_the_buckets_of_archived_days(mongo):
+    # Retention keeps 90 days of results: the first two of these days get archived, the last one stays hot
+    docs = results(NOW - timedelta(days=92, hours=12), hours=72)
+
+    async def scenario():
+        await mongo.scheduler_leases.create_index("id", unique=True)
+        await mongo.quality_results.insert_many([dict(doc) for doc in docs])
+        await server.rebuild_quality_buckets()
+        before = await stored("quality_buckets"), await stored("quality_daily")
+        report = await server.apply_retention(NOW)
+        hot = await mongo.quality_results.count_documents({})
+        await server.rebuild_quality_buckets()
+        return before, report, hot, (await stored("quality_buckets"), await stored("quality_daily"))
+
+    before, report, hot, after = asyncio.run(scenario())
+    cutoff = server.retention_cutoff(NOW, 90)
+    assert report["collections"]["quality_results"]["archived"] == len(docs) - hot > 0
+    assert after == before == (expected(docs, "h"), expected(docs, "D"))
+    assert any(start < cutoff for _, start in after[1]) and any(start >= cutoff for _, start in after[1])
@@ -0,0 +1,186 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+import server
+
+UTC = timezone.utc
+NOW = datetime.now(UTC).replace(microsecond=0)
+
+def hot(doc):
+    return {k: v for k, v in doc.items() if k not in ("archive_id", "restored_at")}
+
+def old_run(days):
+    logs = [{"timestamp": NOW - timedelta(days=days), "level": "WARNING" if i == 12 else "INFO", "message": f"step {i}"}
+            for i in range(30)]
+    return server.PipelineRun(pipeline_id="p1", pipeline_name="p", status="completed", logs=logs,
+                              start_time=NOW - timedelta(days=days), end_time=NOW - timedelta(days=days),
+                              heartbeat_at=NOW - timedelta(days=days)).model_dump()
+
+def stored_output(run_id):
+    writer = server.RunOutputWriter("p1", run_id)
+    writer.write(server.generate_plant_data(50, seed=9))
+    return writer.close()
+
+@pytest.fixture
+def leases(mongo):
+    # Startup provisions this index; without it two owners could upsert separate lease documents
+    asyncio.run(mongo.scheduler_leases.create_index("id", unique=True))
+    return mongo.scheduler_leases
+
+async def hold_lease(owner, seconds=60):
+    await server.db.scheduler_leases.insert_one({"id": server.RETENTION_LEASE_ID, "owner": owner,
+                                                 "expires_at": datetime.now(UTC) + timedelta(seconds=seconds)})
+
+def test_compacted_run_round_trips_through_its_archive(mongo, leases):
+    async def scenario():
+        run = old_run(30)  # past log compaction (14 days), within retention (90 days)
+        await mongo.pipeline_runs.insert_one(dict(run))
+        original = await mongo.pipeline_runs.find_one({"id": run["id"]}, {"_id": 0})
+        report = await server.apply_retention(NOW)
+        compacted = await mongo.pipeline_runs.find_one({"id": run["id"]}, {"_id": 0})
+        found = await server.search_archives("pipeline_runs", None, None, {"id": run["id"]}, 10)
+        restored = await server.restore_archive(compacted["archive_id"])
+        return original, report, compacted, found, restored, await mongo.pipeline_runs.find_one({"id": run["id"]}, {"_id": 0})
+
+    original, report, compacted, found, restored, back = asyncio.run(scenario())
+    assert report["collections"]["pipeline_runs"] == {"archived": 1, "archives": 1, "expired": 0}
+    messages = [entry["message"] for entry in compacted["logs"]]
+    assert len(messages) == 2 * server.RUN_LOG_COMPACT_KEEP + 2
+    assert "step 12" in messages and "compacted" in messages[server.RUN_LOG_COMPACT_KEEP]
+    assert hot(found[0]) == hot(original)
+    assert restored["restored"] == 1
+    assert hot(back) == hot(original) and back["archive_id"] == compacted["archive_id"]
+
+def test_run_past_retention_keeps_only_its_summary(mongo, leases):
+    async def scenario():
+        run = old_run(100)
+        await mongo.pipeline_runs.insert_one(dict(run))
+        await server.apply_retention(NOW)
+        return await mongo.pipeline_runs.find_one({"id": run["id"]}, {"_id": 0})
+
+    summary = asyncio.run(scenario())
+    assert "logs" not in summary and summary["archive_id"] and summary["status"] == "completed"
+
+def test_processed_data_and_its_output_round_trip(mongo, leases):
+    async def scenario():
+        storage = stored_output("r1")
+        table = server.read_run_output(storage).to_pandas()
+        doc = server.ProcessedData(pipeline_run_id="r1", data=[{"a": 1}], metadata={"total_records": 50},
+                                   storage=storage, timestamp=NOW - timedelta(days=40)).model_dump()
+        result = server.DataQualityResult(pipeline_run_id="r1", rule_id="q1", rule_name="q", passed=True, records_checked=50,
+                                          records_failed=0, quality_score=100.0, timestamp=NOW - timedelta(days=100)).model_dump()
+        await mongo.processed_data.insert_one(dict(doc))
+        await mongo.quality_results.insert_one(dict(result))
+        originals = [await mongo.processed_data.find_one({}, {"_id": 0}), await mongo.quality_results.find_one({}, {"_id": 0})]
+
+        await server.apply_retention(NOW)
+        gone = [await mongo.processed_data.count_documents({}), await mongo.quality_results.count_documents({}),
+                (server.PROCESSED_DATA_DIR / storage["path"]).exists()]
+        found = await server.search_archives("quality_results", NOW - timedelta(days=101), NOW, {"rule_id": "q1"}, 10)
+        missed = await server.search_archives("quality_results", NOW - timedelta(days=99), NOW, {}, 10)
+        for manifest in await mongo.archives.find({}, {"_id": 0}).to_list(None):
+            await server.restore_archive(manifest["id"])
+        back = [await mongo.processed_data.find_one({}, {"_id": 0}), await mongo.quality_results.find_one({}, {"_id": 0})]
+        return table, originals, gone, found, missed, back
+
+    table, originals, gone, found, missed, back = asyncio.run(scenario())
+    assert gone == [0, 0, False]
+    assert [hot(doc) for doc in found] == [hot(originals[1])] and missed == []
+    assert [hot(doc) for doc in back] == [hot(doc) for doc in originals]
+    pd.testing.assert_frame_equal(server.read_run_output(back[0]["storage"]).to_pandas(), table)
+
+def test_interrupted_pass_is_finished_by_the_next(mongo, leases, monkeypatch):
+    async def crash(*args):
+        raise RuntimeError("crashed")
+
+    async def scenario():
+        run = old_run(30)
+        await mongo.pipeline_runs.insert_one(dict(run))
+        apply_hot_action = server.apply_hot_action
+        monkeypatch.setattr(server, "apply_hot_action", crash)
+        with pytest.raises(RuntimeError):
+            await server.apply_retention(NOW)
+        pending = await mongo.archives.distinct("status")
+        monkeypatch.setattr(server, "apply_hot_action", apply_hot_action)
+        report = await server.apply_retention(NOW)
+        return pending, report, await mongo.archives.distinct("status"), await mongo.pipeline_runs.find_one({"id": run["id"]})
+
+    pending, report, statuses, run = asyncio.run(scenario())
+    assert pending == ["pending"] and statuses == ["complete"]
+    assert report["resumed"] == 1 and report["collections"]["pipeline_runs"]["archived"] == 0
+    assert run["archive_id"] and len(run["logs"]) < 30
+
+def test_only_one_of_two_concurrent_passes_runs(mongo, leases):
+    async def scenario():
+        await mongo.pipeline_runs.insert_many([old_run(30) for _ in range(3)])
+        outcomes = await asyncio.gather(server.apply_retention(NOW, owner="worker-1"),
+                                        server.apply_retention(NOW, owner="worker-2"), return_exceptions=True)
+        return outcomes, await mongo.archives.count_documents({}), await leases.count_documents({})
+
+    outcomes, archives, held = asyncio.run(scenario())
+    assert isinstance(outcomes[1], server.RetentionInProgress)
+    assert outcomes[0]["collections"]["pipeline_runs"]["archived"] == 3
+    assert archives == 1 and held == 0  # released once the pass finished
+
+def test_lease_is_renewed_while_a_pass_runs(mongo, leases, monkeypatch):
+    monkeypatch.setattr(server, "RETENTION_LEASE_SECONDS", 0.3)
+    resume_archives = server.resume_archives
+
+    async def slow_resume(*args):
+        await asyncio.sleep(1)
+        return await resume_archives(*args)
+
+    monkeypatch.setattr(server, "resume_archives", slow_resume)
+
+    async def scenario():
+        first = asyncio.create_task(server.apply_retention(NOW, owner="worker-1"))
+        await asyncio.sleep(0.6)  # past the first lease's expiry
+        with pytest.raises(server.RetentionInProgress):
+            await server.apply_retention(NOW, owner="worker-2")
+        return await first
+
+    assert "finished_at" in asyncio.run(scenario())
+
+def test_pass_that_loses_its_lease_stops(mongo, leases, monkeypatch):
+    monkeypatch.setattr(server, "RETENTION_LEASE_SECONDS", 0.3)
+
+    async def stalled(*args):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(server, "resume_archives", stalled)
+
+    async def scenario():
+        first = asyncio.create_task(server.apply_retention(NOW, owner="worker-1"))
+        await asyncio.sleep(0.05)
+        # Another process took over, e.g. after this one stalled past its expiry
+        await leases.update_one({"id": server.RETENTION_LEASE_ID}, {"$set": {"owner": "worker-2"}})
+        with pytest.raises(server.RetentionInProgress):
+            await first
+        return await leases.find_one({"id": server.RETENTION_LEASE_ID})
+
+    assert asyncio.run(scenario())["owner"] == "worker-2"
+
+def test_pass_is_rejected_while_another_process_holds_the_lease(mongo, leases, api):
+    async def scenario():
+        await hold_lease("other-worker")
+        with pytest.raises(server.RetentionInProgress):
+            await server.apply_retention(NOW)
+        async with api() as client:
+            response = await client.post("/api/admin/retention/run")
+        await leases.update_one({"id": server.RETENTION_LEASE_ID}, {"$set": {"expires_at": datetime.now(UTC) - timedelta(seconds=1)}})
+        return response, await server.apply_retention(NOW)
+
+    response, report = asyncio.run(scenario())
+    assert response.status_code == 409
+    assert response.json()["detail"] == "A retention pass is already running"
+    assert "finished_at" in report  # an expired lease is taken over
+
+def test_cli_exits_while_another_process_holds_the_lease(mongo, leases, capsys):
+    asyncio.run(hold_lease("server-worker"))
+    with pytest.raises(SystemExit) as exited:
+        server.main(["apply-retention"])
+    assert exited.value.code == 1
+    assert "already running" in capsys.readouterr().err
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+UTC = timezone.utc
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("*/15 * * * *", datetime(2026, 3, 1, 10, 7, tzinfo=UTC), datetime(2026, 3, 1, 10, 15, tzinfo=UTC)),
+    ("0 */6 * * *", datetime(2026, 3, 1, 18, 0, tzinfo=UTC), datetime(2026, 3, 2, 0, 0, tzinfo=UTC)),
+    ("30 9 * * 1-5", datetime(2026, 3, 6, 9, 30, tzinfo=UTC), datetime(2026, 3, 9, 9, 30, tzinfo=UTC)),  # Fri -> Mon
+    ("0 0 29 2 *", datetime(2026, 3, 1, tzinfo=UTC), datetime(2028, 2, 29, tzinfo=UTC)),
+    ("0 12 1 * 0", datetime(2026, 3, 1, 12, 0, tzinfo=UTC), datetime(2026, 3, 8, 12, 0, tzinfo=UTC)),  # day OR weekday
+    ("5 4 * * 7", datetime(2026, 3, 1, 4, 5, tzinfo=UTC), datetime(2026, 3, 8, 4, 5, tzinfo=UTC)),  # 7 is Sunday
+])
+def test_next_fire_time(expression, after, expected):
+    assert server.CronSchedule(expression).next_after(after) == expected
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "5-1 * * * *",
+                                        "a * * * *", "0 0 30 2 *", "0 0 31 4,6,9,11 *"])
+def test_invalid_and_never_firing_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        server.CronSchedule(expression)
+    with pytest.raises(server.HTTPException):
+        server.validate_schedule(expression)
+
+def test_only_one_scheduler_holds_the_lease(mongo, monkeypatch):
+    async def scenario():
+        await mongo.scheduler_leases.create_index("id", unique=True)
+        first, second = server.PipelineScheduler(30, 60), server.PipelineScheduler(30, 60)
+        held = [await first._hold_lease(), await second._hold_lease(), await first._hold_lease()]
+        # The leader dies: once its lease expires the other scheduler takes over
+        await mongo.scheduler_leases.update_one({"id": server.SCHEDULER_LEASE_ID},
+                                                {"$set": {"expires_at": datetime.now(UTC) - timedelta(seconds=1)}})
+        held += [await second._hold_lease(), await first._hold_lease()]
+        return held
+    
+    assert asyncio.run(scenario()) == [True, False, True, True, False]
+
+def run_doc(pipeline_id, heartbeat_at):
+    return server.PipelineRun(pipeline_id=pipeline_id, pipeline_name="p", status="running",
+                              start_time=heartbeat_at, heartbeat_at=heartbeat_at).model_dump()
+
+def test_orphaned_run_does_not_block_its_schedule(mongo, monkeypatch):
+    submitted = []
+    
+    async def submit(pipeline, options, trigger=None):
+        submitted.append(pipeline["id"])
+    
+    monkeypatch.setattr(server.pipeline_jobs, "submit", submit)
+    
+    async def scenario():
+        now = datetime.now(UTC)
+        await mongo.dashboard_rollups.insert_one({"id": server.ROLLUP_ID, "run_counts": {"running": 2}, "recent_runs": []})
+        await mongo.pipelines.insert_many([{"id": pid, "name": pid, "status": "active", "schedule": "* * * * *"}
+                                           for pid in ("orphaned", "live")])
+        orphan = run_doc("orphaned", now - timedelta(seconds=server.RUN_STALE_SECONDS + 60))
+        await mongo.pipeline_runs.insert_many([orphan, run_doc("live", now)])
+        scheduler = server.PipelineScheduler(30, 60)
+        for pipeline_id in ("orphaned", "live"):
+            await scheduler._fire(pipeline_id, {"cron": server.CronSchedule("* * * * *"), "next": now, "generation": 0})
+        return scheduler, await mongo.pipeline_runs.find_one({"id": orphan["id"]}), await mongo.dashboard_rollups.find_one()
+    
+    scheduler, orphan, rollup = asyncio.run(scenario())
+    assert submitted == ["orphaned"]
+    assert scheduler.counters["skipped_overlap"] == 1
+    assert orphan["status"] == "failed" and "orphaned" in orphan["error_message"]
+    assert orphan["logs"][-1]["level"] == "ERROR"
+    assert rollup["run_counts"] == {"running": 1, "failed": 1}
+
+def test_sample_pipelines_are_scheduled_without_a_restart(mongo, api):
+    scheduler = server.pipeline_scheduler
+    
+    async def scenario():
+        scheduler.is_leader, scheduler.wakeup = True, asyncio.Event()
+        try:
+            async with api() as client:
+                await client.post("/api/initialize-sample-data")
+                first = set(scheduler.entries)
+                await client.post("/api/initialize-sample-data")
+                return first, set(scheduler.entries), {p["id"] for p in await mongo.pipelines.find({"schedule": {"$ne": None}}).to_list(None)}
+        finally:
+            scheduler.is_leader = False
+            scheduler.entries.clear()
+            scheduler.heap.clear()
+    
+    first, second, scheduled = asyncio.run(scenario())
+    assert first and second == scheduled
+    assert not first & second  # replaced pipelines are no longer scheduled
@@ -0,0 +1,93 @@
+import asyncio
+
+import pandas as pd
+
+import server
+
+NOT_NULL_HIGH_VOLUME = [{"type": "remove_nulls"},
+                        {"type": "filter", "condition": {"field": "production_volume", "operator": ">", "value": 9000}}]
+PIPELINES = [
+    {"id": "resumed", "transformations": NOT_NULL_HIGH_VOLUME},
+    {"id": "avg_quality", "transformations": NOT_NULL_HIGH_VOLUME + [
+        {"type": "aggregate", "group_by": ["plant_id"], "field": "quality_score", "function": "avg"}]},
+    {"id": "batch_counts", "transformations": NOT_NULL_HIGH_VOLUME + [
+        {"type": "aggregate", "group_by": ["product"], "field": "batch_id", "function": "count"}]},
+    {"id": "downtime", "transformations": [
+        {"type": "aggregate", "group_by": ["operator_id"], "field": "downtime_minutes", "function": "sum"}]},
+]
+BROKEN = {"id": "broken", "transformations": [
+    {"type": "aggregate", "group_by": ["plant_id"], "field": "no_such_field", "function": "sum"}]}
+RULES = [server.DataQualityRule(**rule).model_dump() for rule in server.SAMPLE_QUALITY_RULES]
+
+def pipeline(spec):
+    return {"name": spec["id"], "source_id": "s1", "status": "active", **spec}
+
+def options(run_id, base):
+    return {"run_id": run_id, "num_records": 150, "seed": 2, "streaming": True, "chunk_size": 50, "partitions": 1,
+            "incremental": base}
+
+def output(outcome):
+    return server.read_run_output(outcome["storage"]).to_pandas()
+
+def test_batched_runs_match_running_each_pipeline_alone(mongo, fixed_clock):
+    pipelines = [pipeline(spec) for spec in PIPELINES]
+
+    async def scenario():
+        # One pipeline has a committed watermark, so the batch mixes resume points
+        first = server.process_pipeline_run(pipelines[0], RULES, {**options("first", {}), "num_records": 100})
+        await server.commit_watermark(pipelines[0], "first", {}, first["incremental"])
+        return [await server.load_watermark(p) for p in pipelines]
+
+    bases = asyncio.run(scenario())
+    batched = server.process_batch_run(pipelines, RULES, [options(f"batch-{p['id']}", base) for p, base in zip(pipelines, bases)])
+    alone = [server.process_pipeline_run(p, RULES, options(f"alone-{p['id']}", base)) for p, base in zip(pipelines, bases)]
+
+    assert [result["status"] for result in batched] == ["success"] * len(pipelines)
+    for result, expected in zip(batched, alone):
+        outcome = result["outcome"]
+        pd.testing.assert_frame_equal(output(outcome), output(expected))
+        assert outcome["validation_results"] == expected["validation_results"]
+        assert outcome["quality_metrics"] == expected["quality_metrics"]
+        assert outcome["incremental"]["watermark"] == expected["incremental"]["watermark"]
+    messages = [[entry["message"] for entry in result["outcome"]["logs"]] for result in batched]
+    assert "Ingested 50 records" in messages[0] and "Ingested 150 records" in messages[1]
+
+    # The two fresh pipelines with the same leading steps evaluate them once per chunk between them;
+    # the resumed one receives different chunks, so it shares nothing
+    shared = [stage for stage in batched[1]["outcome"]["stages"] if stage["stage"] == "shared_transform"]
+    assert shared and all(stage["calls"] == 3 for stage in shared)
+    assert any("sharing 1 leading steps" in message for message in messages[1] + messages[2])
+    assert not any("sharing" in message for message in messages[0] + messages[3])
+
+def test_failing_pipeline_leaves_the_others_successful(mongo, fixed_clock):
+    pipelines = [pipeline(spec) for spec in (PIPELINES[1], BROKEN, PIPELINES[3])]
+    results = server.process_batch_run(pipelines, RULES, [options(f"batch-{p['id']}", {}) for p in pipelines])
+    assert [result["status"] for result in results] == ["success", "failed", "success"]
+    assert "no_such_field" in results[1]["error"]
+    alone = server.process_pipeline_run(pipelines[2], RULES, options("alone", {}))
+    pd.testing.assert_frame_equal(output(results[2]["outcome"]), output(alone))
+
+def test_batch_execute_persists_each_run(mongo, job_queue, api):
+    async def scenario():
+        await mongo.pipeline_watermarks.create_index("id", unique=True)
+        await mongo.quality_rules.insert_many([dict(rule) for rule in RULES])
+        await mongo.pipelines.insert_many([pipeline(spec) for spec in (PIPELINES[1], BROKEN, PIPELINES[3])])
+        async with job_queue() as jobs, api() as client:
+            response = await client.post("/api/pipelines/batch-execute",
+                                         json={"pipeline_ids": ["avg_quality", "broken", "downtime"], "num_records": 200})
+            for _ in range(1200):
+                if not jobs.jobs:
+                    break
+                await asyncio.sleep(0.05)
+        runs = {run["pipeline_id"]: run for run in await mongo.pipeline_runs.find({}, {"_id": 0}).to_list(None)}
+        results = {run_id: await mongo.quality_results.count_documents({"pipeline_run_id": run_id})
+                   for run_id in (run["id"] for run in runs.values())}
+        watermarks = await mongo.pipeline_watermarks.distinct("pipeline_id")
+        return response.json(), runs, results, watermarks
+
+    body, runs, results, watermarks = asyncio.run(scenario())
+    assert [len(batch["runs"]) for batch in body["batches"]] == [3]
+    assert {pid: run["status"] for pid, run in runs.items()} == {"avg_quality": "success", "broken": "failed", "downtime": "success"}
+    assert results[runs["avg_quality"]["id"]] == results[runs["downtime"]["id"]] == len(RULES)
+    assert results[runs["broken"]["id"]] == 0
+    assert sorted(watermarks) == ["avg_quality", "downtime"]
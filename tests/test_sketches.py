@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+
+STANDARD_ERROR = 1.04 / np.sqrt(1 << server.HLL_PRECISION)
+
+@pytest.mark.parametrize("cardinality", [1, 50, 5_000, 40_000, 400_000])
+def test_hll_error_within_bounds(cardinality):
+    rng = np.random.default_rng(cardinality)
+    values = pd.Series(rng.choice(1 << 62, cardinality, replace=False))
+    # Each value several times, so duplicates are exercised too
+    estimate = server.HyperLogLog().add(pd.concat([values, values.sample(frac=0.5, random_state=1)])).estimate()
+    assert abs(estimate - cardinality) <= max(1, 4 * STANDARD_ERROR * cardinality)
+
+def test_hll_merge_equals_sketch_of_union():
+    rng = np.random.default_rng(7)
+    a, b = pd.Series(rng.integers(0, 200_000, 60_000)), pd.Series(rng.integers(100_000, 300_000, 60_000))
+    merged = server.HyperLogLog().add(a).merge(server.HyperLogLog().add(b))
+    assert (merged.registers == server.HyperLogLog().add(pd.concat([a, b])).registers).all()
+    assert merged.estimate() == server.HyperLogLog().add(pd.concat([b, a])).estimate()
+
+def test_hll_hashes_ints_and_floats_alike_and_ignores_nulls():
+    ints = server.HyperLogLog().add(pd.Series([1, 2, 3]))
+    floats = server.HyperLogLog().add(pd.Series([1.0, 2.0, None, 3.0]))
+    assert (ints.registers == floats.registers).all()
+
+@pytest.mark.parametrize("cardinality", [10, 100_000])  # sparse and dense encodings
+def test_sketch_serialization_round_trip(cardinality):
+    hll = server.HyperLogLog().add(pd.Series(np.arange(cardinality)))
+    assert (server.load_sketch(hll.to_bytes()).registers == hll.registers).all()
+    digest = server.TDigest().add(pd.Series(np.arange(cardinality, dtype=float)))
+    restored = server.load_sketch(digest.to_bytes())
+    assert restored.quantile(0.5) == digest.quantile(0.5)
+    assert (restored.min, restored.max) == (digest.min, digest.max)
+
+@pytest.mark.parametrize("distribution", ["normal", "lognormal", "uniform"])
+def test_tdigest_rank_error_within_bounds(distribution):
+    rng = np.random.default_rng(3)
+    values = getattr(rng, distribution)(size=200_000)
+    # Built from chunks and merged, as runs and partitions do
+    digest = server.TDigest()
+    for chunk in np.array_split(values, 17):
+        digest.merge(server.TDigest().add(pd.Series(chunk)))
+    ordered = np.sort(values)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.95, 0.99):
+        rank = np.searchsorted(ordered, digest.quantile(q)) / len(values)
+        assert abs(rank - q) <= 0.005
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+
+def test_streamed_sketch_aggregates_match_whole_frame():
+    df = server.generate_plant_data(20_000, seed=8)
+    for function in ("approx_distinct", "approx_percentile"):
+        transform = [{"type": "aggregate", "group_by": ["plant_id"], "field": "batch_id" if function == "approx_distinct" else "temperature",
+                      "function": function, "percentile": 0.9}]
+        chunks = [df.iloc[i:i + 3000] for i in range(0, len(df), 3000)]
+        streamed = pd.concat(list(server.stream_transformations(chunks, transform, server.PLANT_DATA_STATS))).set_index("plant_id")
+        field = transform[0]["field"]
+        if function == "approx_distinct":
+            exact = df.groupby("plant_id", observed=True)[field].nunique()
+            assert (abs(streamed[field] - exact) <= 4 * STANDARD_ERROR * exact + 1).all()
+        else:
+            for plant, value in streamed[field].items():
+                ordered = np.sort(df.loc[df["plant_id"] == plant, field].dropna().to_numpy())
+                assert abs(np.searchsorted(ordered, value) / len(ordered) - 0.9) <= 0.01
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+
+KEY = ["plant_id", "product", "batch_id"]
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+@pytest.mark.parametrize("size", [1, 97, 1000, 5000])
+def test_chunked_deduplicate_matches_drop_duplicates(size):
+    df = server.generate_plant_data(5000, seed=3)
+    seen = np.array([], dtype=np.uint64)
+    kept = []
+    for chunk in chunks(df, size):
+        chunk, seen = server.deduplicate_chunk(chunk, KEY, seen)
+        kept.append(chunk)
+    expected = df.drop_duplicates(subset=KEY)
+    assert pd.concat(kept).index.equals(expected.index)
+    assert len(seen) == len(expected)
+    assert np.all(seen[1:] > seen[:-1])
+
+def test_deduplicate_chunk_seeded_from_earlier_run():
+    df = server.generate_plant_data(2000, seed=4)
+    _, seen = server.deduplicate_chunk(df.iloc[:1000], KEY, np.array([], dtype=np.uint64))
+    rerun, _ = server.deduplicate_chunk(df.iloc[:1000], KEY, seen)
+    assert rerun.empty
+
+@pytest.mark.parametrize("spec", server.SAMPLE_PIPELINES, ids=lambda spec: spec["name"])
+def test_streamed_pipeline_equals_whole_frame(spec):
+    df = server.generate_plant_data(3000, seed=5)
+    streamed = pd.concat(list(server.stream_transformations(chunks(df, 700), spec["transformations"], server.PLANT_DATA_STATS)))
+    whole = pd.DataFrame(server.apply_transformations(df, spec["transformations"], server.PLANT_DATA_STATS))
+    pd.testing.assert_frame_equal(streamed.reset_index(drop=True), whole, check_dtype=False)
+
+@pytest.mark.parametrize("offset, count", [(0, 0), (0, 7), (999_995, 10)])
+def test_record_ids_match_the_per_row_format(offset, count):
+    assert list(server.record_ids(offset, count)) == [f"REC_{i:06d}" for i in range(offset, offset + count)]
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import server
+
+def reference_validate_data(data, rules):
+    """The original per-record implementation, kept verbatim as the reference for validate_data"""
+    results = []
+    
+    for rule in rules:
+        rule_type = rule.get("rule_type")
+        field = rule.get("field")
+        condition = rule.get("condition")
+        
+        total_records = len(data)
+        failed_records = 0
+        
+        if rule_type == "completeness":
+            failed_records = sum(1 for record in data if record.get(field) is None or record.get(field) == "")
+        
+        elif rule_type == "accuracy":
+            min_val = condition.get("min")
+            max_val = condition.get("max")
+            for record in data:
+                val = record.get(field)
+                if val is not None and (val < min_val or val > max_val):
+                    failed_records += 1
+        
+        elif rule_type == "consistency":
+            expected_pattern = condition.get("pattern")
+            for record in data:
+                val = str(record.get(field, ""))
+                if expected_pattern and not val.startswith(expected_pattern):
+                    failed_records += 1
+        
+        passed = failed_records == 0
+        quality_score = ((total_records - failed_records) / total_records * 100) if total_records > 0 else 0
+        
+        results.append({
+            "rule_id": rule.get("id"),
+            "rule_name": rule.get("name"),
+            "passed": passed,
+            "records_checked": total_records,
+            "records_failed": failed_records,
+            "quality_score": round(quality_score, 2)
+        })
+    
+    overall_score = sum(r["quality_score"] for r in results) / len(results) if results else 100
+    
+    return results, {"overall_quality_score": round(overall_score, 2)}
+
+RULES = [dict(rule, id=f"rule-{i}") for i, rule in enumerate(server.SAMPLE_QUALITY_RULES)] + [
+    {"id": "plant", "name": "Plant prefix", "rule_type": "consistency", "field": "plant_id", "condition": {"pattern": "Plant_N"}},
+    {"id": "absent", "name": "Absent field", "rule_type": "completeness", "field": "not_a_column", "condition": {}},
+    {"id": "absent-pattern", "name": "Absent pattern", "rule_type": "consistency", "field": "not_a_column", "condition": {"pattern": "x"}},
+    {"id": "unknown", "name": "Unknown type", "rule_type": "timeliness", "field": "timestamp", "condition": {}},
+]
+
+@pytest.mark.parametrize("source_type", [None, "manufacturing_plant"])
+def test_frame_validation_matches_per_record_reference(source_type):
+    df = server.apply_schema(server.generate_plant_data(5000, seed=11), source_type)
+    assert df["quality_score"].isna().any()
+    # Pipelines used to validate the transformed records, i.e. the frame after to_dict
+    assert server.validate_data(df, RULES) == reference_validate_data(df.to_dict("records"), RULES)
+
+@pytest.mark.parametrize("spec", server.SAMPLE_PIPELINES, ids=lambda spec: spec["name"])
+def test_streamed_validation_matches_per_record_reference(spec):
+    df = server.generate_plant_data(3000, seed=12)
+    run = server.execute_streaming([df.iloc[i:i + 500] for i in range(0, len(df), 500)], spec["transformations"],
+                                   RULES, stats=server.PLANT_DATA_STATS)
+    transformed = server.apply_transformations(df, spec["transformations"], server.PLANT_DATA_STATS)
+    expected, metrics = reference_validate_data(transformed, RULES)
+    assert run["validation_results"] == expected
+    assert run["quality_metrics"] == metrics
+
+def test_record_validation_matches_per_record_reference():
+    records = [
+        {"plant_id": "Plant_NYC", "quality_score": 91.5, "temperature": 4.0, "ph_level": 3.4},
+        {"plant_id": "Plant_LA", "quality_score": None, "temperature": 12.0, "ph_level": 3.0},
+        {"plant_id": "", "quality_score": float("nan"), "temperature": None, "ph_level": 5.5},
+        {"plant_id": None, "quality_score": "", "temperature": np.nan, "ph_level": 4.1},
+    ]
+    assert server.validate_data(records, RULES) == reference_validate_data(records, RULES)
+    assert server.validate_data([], RULES) == reference_validate_data([], RULES)